@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
+# Route the hot read endpoints to their async views (see settings.ASYNC_API_VIEWS)
+os.environ.setdefault('ASYNC_API_VIEWS', 'true')
 
 application = get_asgi_application()
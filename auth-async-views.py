@@ -0,0 +1,101 @@
+import asyncio
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db.models import Sum
+from rest_framework import permissions
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from drf_yasg.utils import swagger_auto_schema
+
+from apps.tasks.models import Task, TaskCounter
+from .authentication import afull_user
+from .serializers import UserProfileSerializer
+
+
+async def aauthenticate(request):
+    """Request._authenticate() for async views.
+
+    Authenticators with an aauthenticate() coroutine are awaited, others
+    run in a worker thread.
+    """
+    for authenticator in request.authenticators:
+        try:
+            if hasattr(authenticator, 'aauthenticate'):
+                user_auth_tuple = await authenticator.aauthenticate(request)
+            else:
+                user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+        except APIException:
+            request._not_authenticated()
+            raise
+
+        if user_auth_tuple is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth_tuple
+            return
+
+    request._not_authenticated()
+
+
+class AsyncDispatchMixin:
+    """Async dispatch() for DRF views, so they take Django's async path under ASGI.
+
+    Coroutine handlers are awaited on the event loop; plain handlers run in
+    a worker thread, so a view can make just its hot read paths async.
+    Content negotiation, permission checks, exception handling and
+    rendering are DRF's own, as none of them query the database.
+    """
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, *args, **initkwargs):
+        return markcoroutinefunction(super().as_view(*args, **initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await aauthenticate(request)
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if not iscoroutinefunction(handler):
+                handler = sync_to_async(handler)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncAPIView(AsyncDispatchMixin, APIView):
+    pass
+
+
+class CurrentUserView(AsyncAPIView):
+    """Current authenticated user info (async version of views.current_user)"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Get current user info",
+        responses={200: UserProfileSerializer}
+    )
+    async def get(self, request):
+        user_id = request.user.pk
+        user, assigned, created = await asyncio.gather(
+            afull_user(request.user),
+            TaskCounter.objects.filter(assigned_to_id=user_id).aaggregate(total=Sum('count')),
+            Task.objects.filter(created_by_id=user_id).acount(),
+        )
+        user.tasks_assigned = assigned['total'] or 0
+        user.tasks_created = created
+        serializer = UserProfileSerializer(user)
+        return Response(serializer.data)
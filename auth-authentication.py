@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import HTTP_HEADER_ENCODING
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+# Fields kept for validated users, read from their row: those nested
+# user serializers render (comment authors, uploaders...) and the
+# permission flags. A profile edit or demotion is picked up within the
+# cache TTL; token claims other than the user id are never trusted.
+CACHED_FIELDS = ['username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser']
+
+
+class ValidatedUserCache:
+    """Thread-safe in-process LRU of recently validated users with a TTL"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at <= time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return values
+
+    def set(self, user_id, values):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + self.ttl, values)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+validated_users = ValidatedUserCache(
+    maxsize=getattr(settings, 'AUTH_USER_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 60),
+)
+
+
+def cached_user(user_id, values):
+    """A User built from cached CACHED_FIELDS; any other field is deferred and loaded on access"""
+    values = {'id': user_id, 'is_active': True, **values}
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(None, field_names, [values[name] for name in field_names])
+
+
+def full_user(user):
+    """user with every field loaded, re-reading the row if it was built from the cache"""
+    if user.get_deferred_fields():
+        return User.objects.get(pk=user.pk)
+    return user
+
+
+async def afull_user(user):
+    if user.get_deferred_fields():
+        return await User.objects.aget(pk=user.pk)
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that skips the per-request user query.
+
+    Only the token's user id claim is trusted. The first request from a
+    user loads and validates the row as JWTAuthentication does, and
+    records its CACHED_FIELDS in an in-process LRU. Until that entry
+    expires, requests get a User built from them instead. Other fields
+    are loaded on access; views that show or change the user itself
+    should use full_user() to read the current row in one query.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = self.get_cached_user(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            self.remember_user(user_id, user)
+        return user
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views; only a validated-user cache miss queries the database"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = self.get_cached_user(user_id)
+        if user is None:
+            user = await sync_to_async(super().get_user)(validated_token)
+            self.remember_user(user_id, user)
+        return user
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def get_cached_user(self, user_id):
+        """The user built from the cache if it was validated recently, else None"""
+        values = validated_users.get(user_id)
+        if values is not None:
+            return cached_user(user_id, values)
+        return None
+
+    def remember_user(self, user_id, user):
+        validated_users.set(user_id, {field: getattr(user, field) for field in CACHED_FIELDS})
+
+
+class QueryTokenJWTAuthentication(ClaimsJWTAuthentication):
+    """ClaimsJWTAuthentication that also accepts the token as ?access_token=.
+
+    Only for event streams: browsers' EventSource can't send an
+    Authorization header. URLs end up in access logs, so other views keep
+    to the header.
+    """
+
+    def get_header(self, request):
+        header = super().get_header(request)
+        token = request.query_params.get('access_token')
+        if header is None and token:
+            header = f'{api_settings.AUTH_HEADER_TYPES[0]} {token}'.encode(HTTP_HEADER_ENCODING)
+        return header
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_validated_user(sender, instance, **kwargs):
+    # Only this process's cache; other workers catch up within the TTL
+    validated_users.discard(instance.pk)
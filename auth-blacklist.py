@@ -0,0 +1,190 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+
+VERSION_KEY = 'token_blacklist:version'
+
+# Rows committed out of blacklisted_at order are picked up by re-reading
+# this far behind the last sync
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings: no false negatives, error_rate false positives"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit halves
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+def get_blacklist_cache():
+    return caches[getattr(settings, 'TOKEN_BLACKLIST_CACHE', 'default')]
+
+
+class BlacklistIndex:
+    """Per-process Bloom filter of blacklisted, unexpired refresh-token JTIs.
+
+    A JTI missing from the filter is not blacklisted, so the common case
+    needs no query; a hit is confirmed against token_blacklist. The filter
+    re-reads new blacklist rows when another process bumps the shared
+    version key, and at least every TOKEN_BLACKLIST_SYNC_INTERVAL seconds
+    for caches that are not shared between processes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filter = None
+        self.version = 0
+        self.synced_at = None
+        self.checked_at = 0
+
+    def reset(self):
+        """Drop the filter so the next check reloads it from the database"""
+        with self.lock:
+            self.filter = None
+
+    def sync(self):
+        cache = get_blacklist_cache()
+        version = cache.get(VERSION_KEY, 0)
+        interval = getattr(settings, 'TOKEN_BLACKLIST_SYNC_INTERVAL', 5)
+        if (self.filter is not None and version == self.version
+                and time.monotonic() - self.checked_at < interval):
+            return
+
+        with self.lock:
+            now = timezone.now()
+            if self.filter is None or self.filter.count >= self.filter.capacity:
+                self.load(now)
+            else:
+                for jti in (
+                    BlacklistedToken.objects
+                    .filter(blacklisted_at__gte=self.synced_at - SYNC_OVERLAP)
+                    .values_list('token__jti', flat=True)
+                ):
+                    self.filter.add(jti)
+            self.synced_at = now
+            self.version = version
+            self.checked_at = time.monotonic()
+
+    def load(self, now):
+        # Expired tokens fail signature/exp validation before the blacklist
+        # check, so only unexpired rows need to be in the filter
+        jtis = list(
+            BlacklistedToken.objects
+            .filter(token__expires_at__gt=now)
+            .values_list('token__jti', flat=True)
+        )
+        capacity = max(getattr(settings, 'TOKEN_BLACKLIST_FILTER_CAPACITY', 100000), 2 * len(jtis))
+        bloom = BloomFilter(capacity)
+        for jti in jtis:
+            bloom.add(jti)
+        self.filter = bloom
+
+    def is_blacklisted(self, jti):
+        self.sync()
+        if jti not in self.filter:
+            return False
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def add(self, jti):
+        with self.lock:
+            if self.filter is not None:
+                self.filter.add(jti)
+
+        def bump():
+            cache = get_blacklist_cache()
+            cache.add(VERSION_KEY, 0, timeout=None)
+            try:
+                version = cache.incr(VERSION_KEY)
+            except ValueError:
+                # Evicted between add() and incr(); the next add() recreates it
+                return
+            with self.lock:
+                # Our own write is already in the filter, so don't re-sync for it
+                if version == self.version + 1:
+                    self.version = version
+        transaction.on_commit(bump)
+
+
+blacklist_index = BlacklistIndex()
+
+
+class CachedBlacklistRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check goes through blacklist_index"""
+
+    def check_blacklist(self):
+        if blacklist_index.is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        token, _created = OutstandingToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                'token': str(self),
+                'expires_at': datetime_from_epoch(self.payload['exp']),
+            },
+        )
+        # The token just passed check_blacklist, so insert without the
+        # get_or_create read; a conflict means a concurrent request used it
+        try:
+            with transaction.atomic():
+                blacklisted = BlacklistedToken.objects.create(token=token)
+        except IntegrityError:
+            raise TokenError(_('Token is blacklisted'))
+        blacklist_index.add(jti)
+        return blacklisted, True
+
+
+def prune_expired_tokens(batch_size=1000, now=None):
+    """Delete expired outstanding tokens, and their blacklist rows, in batches.
+
+    Returns the number of outstanding tokens deleted.
+    """
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        pks = list(
+            OutstandingToken.objects
+            .filter(expires_at__lte=now)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            BlacklistedToken.objects.filter(token_id__in=pks).delete()
+            OutstandingToken.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
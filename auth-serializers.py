@@ -1,11 +1,18 @@
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.contrib.auth.tokens import default_token_generator
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode
+from django.db.models import Sum
+from apps.tasks.models import TaskCounter
+from .blacklist import CachedBlacklistRefreshToken
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     """Custom JWT token serializer with additional user info"""
+    token_class = CachedBlacklistRefreshToken
     
     @classmethod
     def get_token(cls, user):
@@ -39,6 +46,11 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
 
 
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh serializer checking the blacklist through its Bloom filter index"""
+    token_class = CachedBlacklistRefreshToken
+
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """User registration serializer"""
     password = serializers.CharField(write_only=True, min_length=8)
@@ -87,9 +99,16 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return obj.get_full_name() or obj.username
     
     def get_tasks_assigned(self, obj):
-        return obj.assigned_tasks.count()
+        # CurrentUserView fetches both counts alongside the user
+        if hasattr(obj, 'tasks_assigned'):
+            return obj.tasks_assigned
+        # Sum the per-group counters rather than counting task rows
+        total = TaskCounter.objects.filter(assigned_to=obj).aggregate(total=Sum('count'))['total']
+        return total or 0
     
     def get_tasks_created(self, obj):
+        if hasattr(obj, 'tasks_created'):
+            return obj.tasks_created
         return obj.created_tasks.count()
 
 
@@ -118,4 +137,26 @@ class PasswordResetSerializer(serializers.Serializer):
     def validate_email(self, value):
         if not User.objects.filter(email=value).exists():
             raise serializers.ValidationError("No user found with this email address")
-        return value
\ No newline at end of file
+        return value
+
+
+class PasswordResetConfirmSerializer(serializers.Serializer):
+    """Password reset confirmation: the uid and token from the reset link, and a new password"""
+    uid = serializers.CharField(required=True)
+    token = serializers.CharField(required=True)
+    new_password = serializers.CharField(required=True, min_length=8)
+    new_password_confirm = serializers.CharField(required=True)
+    
+    def validate(self, attrs):
+        if attrs['new_password'] != attrs['new_password_confirm']:
+            raise serializers.ValidationError("New passwords don't match")
+        try:
+            user_id = int(force_str(urlsafe_base64_decode(attrs['uid'])))
+        except (TypeError, ValueError, OverflowError):
+            user_id = None
+        user = User.objects.filter(pk=user_id, is_active=True).first() if user_id else None
+        # The token hashes the password and last login, so it stops working once used
+        if user is None or not default_token_generator.check_token(user, attrs['token']):
+            raise serializers.ValidationError("Invalid or expired reset link")
+        attrs['user'] = user
+        return attrs
\ No newline at end of file
@@ -0,0 +1,47 @@
+from smtplib import SMTPException
+
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.mail import send_mail
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .blacklist import prune_expired_tokens
+
+
+# Marks a sent reset email, so a retried or redelivered request isn't sent twice
+RESET_EMAIL_KEY = 'password_reset:sent:{}'
+
+
+@shared_task(autoretry_for=(SMTPException, OSError), retry_backoff=True, max_retries=5)
+def send_password_reset_email(user_id, request_id):
+    """Email a password reset link to a user, once per reset request"""
+    key = RESET_EMAIL_KEY.format(request_id)
+    if cache.get(key):
+        return False
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None or not user.email:
+        return False
+
+    link = settings.PASSWORD_RESET_URL.format(
+        uid=urlsafe_base64_encode(force_bytes(user.pk)),
+        token=default_token_generator.make_token(user),
+    )
+    send_mail(
+        'Reset your Task Manager password',
+        f'Hi {user.get_full_name() or user.username},\n\n'
+        f'Use this link to choose a new password:\n{link}\n\n'
+        f"If you didn't ask for a reset, you can ignore this email.",
+        None,
+        [user.email],
+    )
+    cache.set(key, True, timeout=settings.PASSWORD_RESET_TIMEOUT)
+    return True
+
+
+@shared_task
+def prune_tokens():
+    return prune_expired_tokens()
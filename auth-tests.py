@@ -0,0 +1,238 @@
+import os
+import re
+import runpy
+import uuid
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from apps.tasks.models import Task
+from task_manager import settings as project_settings
+from apps.tasks.serializers import UserSerializer
+from .authentication import ClaimsJWTAuthentication, validated_users
+from .blacklist import VERSION_KEY, BloomFilter, blacklist_index, prune_expired_tokens
+from .serializers import CustomTokenObtainPairSerializer
+
+
+class ClaimsJWTAuthenticationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'pw', first_name='Alice')
+        for i in range(3):
+            Task.objects.create(title=f'Task {i}', assigned_to=cls.user, created_by=cls.user)
+
+    def setUp(self):
+        validated_users.clear()
+        cache.clear()
+        self.token = str(CustomTokenObtainPairSerializer.get_token(self.user).access_token)
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        user, _ = ClaimsJWTAuthentication().authenticate(request)
+        return user
+
+    def test_cached_user_needs_no_query(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            UserSerializer(user).data
+
+    def test_profile_comes_from_row_not_claims(self):
+        self.authenticate()
+        User.objects.filter(pk=self.user.pk).update(username='alice2', email='alice2@example.com')
+        validated_users.clear()  # as when the entry expires
+        self.authenticate()
+        user = self.authenticate()  # served from the cache again
+        self.assertEqual((user.username, user.email), ('alice2', 'alice2@example.com'))
+
+        # An edit through save() drops the cached row at once
+        self.user.refresh_from_db()
+        self.user.first_name = 'Alicia'
+        self.user.save()
+        self.assertEqual(self.authenticate().first_name, 'Alicia')
+
+    def test_my_tasks_queries_match_forced_authentication(self):
+        path = '/api/tasks/tasks/my_tasks/'
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as forced:
+            self.client.get(path)
+        self.client.force_authenticate(None)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.client.get(path)  # validates and caches the user
+        cache.clear()
+        with CaptureQueriesContext(connection) as cached:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        self.assertEqual(len(cached), len(forced))
+
+
+class PasswordResetTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'old-password')
+
+    def setUp(self):
+        cache.clear()
+
+    def request_reset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/password-reset/', {'email': 'alice@example.com'})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def confirm(self, uid, token, password='new-password'):
+        return self.client.post('/api/auth/password-reset/confirm/', {
+            'uid': uid, 'token': token, 'new_password': password, 'new_password_confirm': password,
+        })
+
+    def test_link_from_email_sets_password_once(self):
+        self.request_reset()
+        self.assertEqual(len(mail.outbox), 1)
+        uid, token = re.search(r'uid=([\w-]+)&token=([\w-]+)', mail.outbox[0].body).groups()
+
+        response = self.confirm(uid, token)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-password'))
+
+        # Changing the password invalidates the token
+        self.assertEqual(self.confirm(uid, token, 'another-password').status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-password'))
+
+    def test_rejects_bad_uid_or_token(self):
+        self.assertEqual(self.confirm('not-a-uid', 'nope').status_code, 400)
+        self.assertEqual(self.confirm('MQ', 'nope').status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('old-password'))
+
+    def test_mail_failure_does_not_fail_request(self):
+        with mock.patch('apps.authentication.tasks.send_mail', side_effect=SMTPException('down')), \
+                self.assertLogs('task_manager.celery', 'ERROR'):
+            self.request_reset()
+        self.assertEqual(mail.outbox, [])
+
+
+class BloomFilterTests(SimpleTestCase):
+
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        bloom = BloomFilter(5000, error_rate=0.01)
+        added = [uuid.uuid4().hex for _ in range(5000)]
+        for jti in added:
+            bloom.add(jti)
+        self.assertTrue(all(jti in bloom for jti in added))
+
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(20000))
+        self.assertLess(false_positives / 20000, 0.02)
+
+
+class RefreshTokenBlacklistTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+
+    def setUp(self):
+        cache.clear()
+        blacklist_index.reset()
+
+    def refresh(self, token):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/auth/token/refresh/', {'refresh': str(token)})
+
+    def outstanding(self, expires_in=timedelta(days=1)):
+        # Issuing the token records it as outstanding
+        token = CustomTokenObtainPairSerializer.get_token(self.user)
+        OutstandingToken.objects.filter(jti=token['jti']).update(expires_at=timezone.now() + expires_in)
+        return token, OutstandingToken.objects.get(jti=token['jti'])
+
+    def test_rotated_token_cannot_be_reused(self):
+        token, _ = self.outstanding()
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=token['jti']).exists())
+
+        self.assertEqual(self.refresh(token).status_code, 401)
+        # The new refresh token is still good
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+
+    def test_unlisted_token_needs_no_blacklist_query(self):
+        token, _ = self.outstanding()
+        blacklist_index.sync()
+        with self.assertNumQueries(0):
+            self.assertFalse(blacklist_index.is_blacklisted(token['jti']))
+
+    def test_sees_tokens_blacklisted_by_other_processes(self):
+        token, outstanding = self.outstanding()
+        self.assertFalse(blacklist_index.is_blacklisted(token['jti']))
+
+        # Another worker blacklists the token and bumps the shared version
+        BlacklistedToken.objects.create(token=outstanding)
+        cache.add(VERSION_KEY, 0, timeout=None)
+        cache.incr(VERSION_KEY)
+        self.assertTrue(blacklist_index.is_blacklisted(token['jti']))
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+        # With a cache that isn't shared, the sync interval catches it up
+        other, outstanding = self.outstanding()
+        self.assertFalse(blacklist_index.is_blacklisted(other['jti']))
+        BlacklistedToken.objects.create(token=outstanding)
+        with self.settings(TOKEN_BLACKLIST_SYNC_INTERVAL=0):
+            self.assertTrue(blacklist_index.is_blacklisted(other['jti']))
+
+    def test_prune_removes_only_expired_tokens(self):
+        _, live = self.outstanding()
+        _, expired = self.outstanding(expires_in=timedelta(seconds=-1))
+        BlacklistedToken.objects.create(token=expired)
+        self.assertEqual(prune_expired_tokens(batch_size=1), 1)
+        self.assertEqual(list(OutstandingToken.objects.values_list('pk', flat=True)), [live.pk])
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+class PasswordHasherProfileTests(APITestCase):
+    pbkdf2 = 'django.contrib.auth.hashers.PBKDF2PasswordHasher'
+    md5 = 'django.contrib.auth.hashers.MD5PasswordHasher'
+
+    def load_settings(self, profile):
+        with mock.patch.dict(os.environ, {'PASSWORD_HASHER_PROFILE': profile}):
+            return runpy.run_path(project_settings.__file__)
+
+    def test_profile_picks_the_hasher_for_new_passwords(self):
+        for profile, hashers in project_settings.PASSWORD_HASHER_PROFILES.items():
+            hashers_setting = self.load_settings(profile)['PASSWORD_HASHERS']
+            self.assertEqual(hashers_setting[0], hashers[0])
+            # Hashes from the other profiles still verify
+            self.assertLessEqual(
+                {other[0] for name, other in project_settings.PASSWORD_HASHER_PROFILES.items() if name != 'fast'},
+                set(hashers_setting)
+            )
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_settings('rot13')
+
+    def test_login_rehashes_with_the_current_profile(self):
+        user = User.objects.create(username='alice', password=make_password('old-password', hasher='md5'))
+        with self.settings(PASSWORD_HASHERS=[self.pbkdf2, self.md5]):
+            response = self.client.post('/api/auth/login/', {'username': 'alice', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 401)
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith('md5$'))
+
+            response = self.client.post('/api/auth/login/', {'username': 'alice', 'password': 'old-password'})
+            self.assertEqual(response.status_code, 200, response.content)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('old-password'))
@@ -1,22 +1,26 @@
+from django.conf import settings
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView
+from .async_views import CurrentUserView
 from .views import (
     CustomTokenObtainPairView,
+    CustomTokenRefreshView,
     UserRegistrationView,
     UserProfileView,
     ChangePasswordView,
     logout_view,
     password_reset_request,
+    password_reset_confirm,
     current_user
 )
 
 urlpatterns = [
     path('login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
     path('register/', UserRegistrationView.as_view(), name='user_register'),
     path('logout/', logout_view, name='logout'),
     path('profile/', UserProfileView.as_view(), name='user_profile'),
     path('change-password/', ChangePasswordView.as_view(), name='change_password'),
     path('password-reset/', password_reset_request, name='password_reset'),
-    path('me/', current_user, name='current_user'),
+    path('password-reset/confirm/', password_reset_confirm, name='password_reset_confirm'),
+    path('me/', CurrentUserView.as_view() if settings.ASYNC_API_VIEWS else current_user, name='current_user'),
 ]
\ No newline at end of file
@@ -2,19 +2,25 @@ from rest_framework import generics, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from django.contrib.auth import logout
+import uuid
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+from task_manager.celery import enqueue_on_commit
+from .authentication import full_user
+from .blacklist import CachedBlacklistRefreshToken
 from .serializers import (
     CustomTokenObtainPairSerializer,
+    CustomTokenRefreshSerializer,
     UserRegistrationSerializer,
     UserProfileSerializer,
     ChangePasswordSerializer,
-    PasswordResetSerializer
+    PasswordResetSerializer,
+    PasswordResetConfirmSerializer
 )
+from .tasks import send_password_reset_email
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
@@ -22,6 +28,11 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
 
+class CustomTokenRefreshView(TokenRefreshView):
+    """JWT refresh view with cached blacklist lookups"""
+    serializer_class = CustomTokenRefreshSerializer
+
+
 class UserRegistrationView(generics.CreateAPIView):
     """User registration endpoint"""
     queryset = User.objects.all()
@@ -68,7 +79,7 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_object(self):
-        return self.request.user
+        return full_user(self.request.user)
 
 
 class ChangePasswordView(generics.UpdateAPIView):
@@ -77,7 +88,7 @@ class ChangePasswordView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_object(self):
-        return self.request.user
+        return full_user(self.request.user)
     
     @swagger_auto_schema(
         operation_description="Change user password",
@@ -118,7 +129,7 @@ def logout_view(request):
     try:
         refresh_token = request.data.get('refresh_token')
         if refresh_token:
-            token = RefreshToken(refresh_token)
+            token = CachedBlacklistRefreshToken(refresh_token)
             token.blacklist()
         return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
     except Exception as e:
@@ -137,18 +148,40 @@ def logout_view(request):
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def password_reset_request(request):
-    """Request password reset (placeholder - implement email sending)"""
+    """Request password reset; the email is sent by a background worker"""
     serializer = PasswordResetSerializer(data=request.data)
     if serializer.is_valid():
         email = serializer.validated_data['email']
-        # TODO: Implement email sending logic here
-        # For now, just return success message
+        for user_id in User.objects.filter(email=email, is_active=True).values_list('pk', flat=True):
+            enqueue_on_commit(send_password_reset_email, user_id, uuid.uuid4().hex)
         return Response({
             'message': f'Password reset instructions sent to {email}'
         })
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@swagger_auto_schema(
+    method='post',
+    operation_description="Set a new password from a password reset link",
+    request_body=PasswordResetConfirmSerializer,
+    responses={
+        200: openapi.Response(description="Password reset"),
+        400: openapi.Response(description="Invalid or expired link, or validation error")
+    }
+)
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def password_reset_confirm(request):
+    """Set a new password with the uid and token from a reset email"""
+    serializer = PasswordResetConfirmSerializer(data=request.data)
+    if serializer.is_valid():
+        user = serializer.validated_data['user']
+        user.set_password(serializer.validated_data['new_password'])
+        user.save()
+        return Response({'message': 'Password reset successfully'})
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 @swagger_auto_schema(
     method='get',
     operation_description="Get current user info",
@@ -158,5 +191,5 @@ def password_reset_request(request):
 @permission_classes([permissions.IsAuthenticated])
 def current_user(request):
     """Get current authenticated user info"""
-    serializer = UserProfileSerializer(request.user)
+    serializer = UserProfileSerializer(full_user(request.user))
     return Response(serializer.data)
\ No newline at end of file
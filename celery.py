@@ -0,0 +1,48 @@
+"""
+Celery application for task_manager.
+
+Workers are started with ``celery -A task_manager worker`` (and ``beat`` for
+the periodic jobs in CELERY_BEAT_SCHEDULE). Without CELERY_BROKER_URL tasks
+run eagerly in the calling process, so no broker is needed locally.
+"""
+
+import logging
+import os
+
+from celery import Celery
+from django.db import transaction
+from kombu.exceptions import OperationalError
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
+
+app = Celery('task_manager')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_on_commit(task, *args, **kwargs):
+    """Queue task once the current transaction commits, or drop it on rollback.
+
+    If the broker can't be reached the task runs in this process instead,
+    so the work is delayed but never lost. A task run in this process,
+    eagerly or as that fallback, logs its failure rather than raising into
+    the request that queued it.
+    """
+    def run_inline():
+        try:
+            task.apply(args, kwargs)
+        except Exception:
+            logger.exception('%s failed running inline', task.name)
+
+    def send():
+        if app.conf.task_always_eager:
+            run_inline()
+            return
+        try:
+            task.apply_async(args, kwargs)
+        except OperationalError:
+            logger.warning('Broker unavailable, running %s inline', task.name, exc_info=True)
+            run_inline()
+    transaction.on_commit(send)
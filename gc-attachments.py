@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.tasks.attachments import collect_garbage, prune_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete idle resumable uploads and attachment blobs that no attachment references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-minutes',
+            type=int,
+            default=None,
+            help='Keep blobs unreferenced for less than this long (default: TASK_BLOB_GC_GRACE)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be deleted without deleting it'
+        )
+
+    def handle(self, *args, **options):
+        grace = settings.TASK_BLOB_GC_GRACE
+        if options['grace_minutes'] is not None:
+            grace = timedelta(minutes=options['grace_minutes'])
+        if not options['dry_run']:
+            uploads = prune_stale_uploads()
+            self.stdout.write(f'Deleted {uploads} idle uploads')
+        blobs, size = collect_garbage(grace, dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {blobs} blobs ({size} bytes)'))
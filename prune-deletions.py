@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.tasks.changes import prune_deletion_log
+
+
+class Command(BaseCommand):
+    help = 'Delete task tombstones older than TASK_DELETION_LOG_RETENTION'
+
+    def handle(self, *args, **options):
+        deleted = prune_deletion_log()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} task tombstones'))
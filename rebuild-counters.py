@@ -0,0 +1,55 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Count, Sum
+from datetime import timedelta
+
+from apps.tasks.models import Task, TaskCounter
+from apps.tasks.quantiles import QuantileSketch
+from apps.tasks.stats import COMPLETION_CHUNK_SIZE, COMPLETION_TIME
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized TaskCounter table from the tasks table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of counter rows per INSERT'
+        )
+
+    def handle(self, *args, **options):
+        completed = Q(status='completed', completed_at__isnull=False)
+        groups = (
+            Task.objects.order_by()
+            .values('assigned_to_id', 'category_id', 'status', 'priority')
+            .annotate(count=Count('id'), completion_time=Sum(COMPLETION_TIME, filter=completed))
+        )
+
+        keys = ('assigned_to_id', 'category_id', 'status', 'priority')
+        sketches = defaultdict(QuantileSketch)
+        durations = Task.objects.order_by().filter(completed).annotate(duration=COMPLETION_TIME)
+        for *key, duration in durations.values_list(*keys, 'duration').iterator(chunk_size=COMPLETION_CHUNK_SIZE):
+            sketches[tuple(key)].add(duration.total_seconds())
+
+        counters = []
+        for group in groups:
+            sketch = sketches.get(tuple(group[key] for key in keys))
+            counters.append(TaskCounter(
+                assigned_to_id=group['assigned_to_id'],
+                category_id=group['category_id'],
+                status=group['status'],
+                priority=group['priority'],
+                count=group['count'],
+                completion_time=group['completion_time'] or timedelta(0),
+                completion_sketch=sketch.to_dict() if sketch else None,
+            ))
+
+        with transaction.atomic():
+            deleted, _ = TaskCounter.objects.all().delete()
+            TaskCounter.objects.bulk_create(counters, batch_size=options['batch_size'])
+
+        self.stdout.write(f'Removed {deleted} counter rows')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(counters)} counter rows'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.tasks.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Create the task full-text search index if needed and refill it from the tasks table'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.install()
+        indexed = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {backend.name} search index ({indexed} tasks)'))
@@ -1,14 +1,56 @@
 from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 import random
 from faker import Faker
 
-from apps.tasks.models import Task, Category, Comment
+from apps.tasks.models import (
+    Task, Category, Comment, Attachment, AttachmentUpload, Blob, TaskCounter, TaskHistory, TaskDeletion,
+    TaskStatsSnapshot, TaskTrendRollup, TaskTrendRefresh,
+)
+from apps.tasks.cache import invalidate_stats_cache
+from apps.tasks.search import get_search_backend
 
 fake = Faker()
 
+TASK_TITLES = [
+    'Implement user authentication',
+    'Design landing page',
+    'Fix login bug',
+    'Write API documentation',
+    'Optimize database queries',
+    'Create unit tests',
+    'Update user interface',
+    'Add search functionality',
+    'Implement email notifications',
+    'Create admin dashboard',
+    'Fix responsive design issues',
+    'Add data validation',
+    'Implement file upload',
+    'Create backup system',
+    'Update security measures',
+    'Add analytics tracking',
+    'Implement caching',
+    'Create mobile app',
+    'Update documentation',
+    'Fix performance issues'
+]
+
+PRIORITIES = ['low', 'medium', 'high', 'urgent']
+STATUSES = ['pending', 'in_progress', 'completed', 'cancelled']
+# More pending/in_progress than completed/cancelled
+STATUS_WEIGHTS = [40, 30, 25, 5]
+
+TEST_PASSWORD = 'testpass123'
+
+# Faker text is the slowest part of seeding; --bulk samples from a pool
+TEXT_POOL_SIZE = 1000
+
+
 class Command(BaseCommand):
     help = 'Seed database with sample data for development and testing'
 
@@ -37,22 +79,50 @@ class Command(BaseCommand):
             default=50,
             help='Number of tasks to create'
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Insert users, tasks and comments with bulk_create in batches'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows per bulk_create batch (with --bulk)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed for a reproducible dataset'
+        )
 
     def handle(self, *args, **options):
         mode = options['mode']
         
+        clear_data = self.bulk_clear_data if options['bulk'] else self.clear_data
         if mode == 'clear':
-            self.clear_data()
+            clear_data()
             self.stdout.write(self.style.SUCCESS('Database cleared successfully'))
             return
         
         if mode == 'refresh':
-            self.clear_data()
+            clear_data()
             self.stdout.write(self.style.SUCCESS('Database cleared'))
         
-        self.create_users(options['users'])
-        self.create_categories(options['categories'])
-        self.create_tasks(options['tasks'])
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+            Faker.seed(options['seed'])
+        
+        if options['bulk']:
+            self.batch_size = options['batch_size']
+            self.bulk_create_users(options['users'])
+            self.create_categories(options['categories'])
+            self.bulk_create_tasks(options['tasks'])
+        else:
+            self.create_users(options['users'])
+            self.create_categories(options['categories'])
+            self.create_tasks(options['tasks'])
         
         self.stdout.write(self.style.SUCCESS('Database seeded successfully'))
 
@@ -70,6 +140,29 @@ class Command(BaseCommand):
         
         self.stdout.write('Data cleared')
 
+    def bulk_clear_data(self):
+        """Clear all sample data with plain DELETEs, skipping the per-row signals and cascades"""
+        self.stdout.write('Clearing existing data...')
+        
+        # Few rows, and their signals remove the partial upload files
+        AttachmentUpload.objects.all().delete()
+        # Dependents first; no deletion tombstones are written, and the
+        # derived tables are emptied rather than decremented row by row
+        with transaction.atomic():
+            for model in [
+                TaskHistory, Comment, Attachment, TaskCounter, TaskDeletion, TaskStatsSnapshot,
+                TaskTrendRollup, TaskTrendRefresh, Task, Category,
+            ]:
+                model.objects.all()._raw_delete(model.objects.db)
+            # Their attachments are gone; gc_attachments removes the files
+            Blob.objects.update(ref_count=0, updated_at=timezone.now())
+        call_command('rebuild_search_index', stdout=self.stdout)
+        invalidate_stats_cache()
+        
+        User.objects.filter(is_superuser=False).delete()
+        
+        self.stdout.write('Data cleared')
+
     def create_users(self, count):
         """Create sample users"""
         self.stdout.write(f'Creating {count} users...')
@@ -86,7 +179,7 @@ class Command(BaseCommand):
                 email=fake.email(),
                 first_name=fake.first_name(),
                 last_name=fake.last_name(),
-                password='testpass123'
+                password=TEST_PASSWORD
             )
             users.append(user)
         
@@ -130,37 +223,11 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('No users found. Create users first.'))
             return
         
-        task_titles = [
-            'Implement user authentication',
-            'Design landing page',
-            'Fix login bug',
-            'Write API documentation',
-            'Optimize database queries',
-            'Create unit tests',
-            'Update user interface',
-            'Add search functionality',
-            'Implement email notifications',
-            'Create admin dashboard',
-            'Fix responsive design issues',
-            'Add data validation',
-            'Implement file upload',
-            'Create backup system',
-            'Update security measures',
-            'Add analytics tracking',
-            'Implement caching',
-            'Create mobile app',
-            'Update documentation',
-            'Fix performance issues'
-        ]
-        
-        priorities = ['low', 'medium', 'high', 'urgent']
-        statuses = ['pending', 'in_progress', 'completed', 'cancelled']
-        
         tasks = []
         for i in range(count):
             # Random task title with some variety
-            title = random.choice(task_titles)
-            if i > len(task_titles):
+            title = random.choice(TASK_TITLES)
+            if i > len(TASK_TITLES):
                 title = f"{title} #{i}"
             
             # Random due date (some past, some future)
@@ -171,11 +238,7 @@ class Command(BaseCommand):
             )
             
             # Random status with weighted distribution
-            status = random.choices(
-                statuses,
-                weights=[40, 30, 25, 5],  # More pending/in_progress than completed/cancelled
-                k=1
-            )[0]
+            status = random.choices(STATUSES, weights=STATUS_WEIGHTS, k=1)[0]
             
             task = Task.objects.create(
                 title=title,
@@ -183,7 +246,7 @@ class Command(BaseCommand):
                 category=random.choice(categories) if categories else None,
                 assigned_to=random.choice(users),
                 created_by=random.choice(users),
-                priority=random.choice(priorities),
+                priority=random.choice(PRIORITIES),
                 status=status,
                 due_date=due_date,
                 estimated_hours=random.randint(1, 40),
@@ -212,12 +275,112 @@ class Command(BaseCommand):
             tasks.append(task)
         
         self.stdout.write(f'Created {len(tasks)} tasks')
+        self.write_credentials()
         
-        # Create some task history entries
+        return tasks
+
+    def write_credentials(self):
         self.stdout.write('Sample data created successfully!')
         self.stdout.write('')
         self.stdout.write('Sample login credentials:')
         self.stdout.write('Username: any of the created users')
-        self.stdout.write('Password: testpass123')
+        self.stdout.write(f'Password: {TEST_PASSWORD}')
+
+    def bulk_create_users(self, count):
+        """Create sample users with bulk_create, hashing the shared password once"""
+        self.stdout.write(f'Creating {count} users...')
+        
+        password = make_password(TEST_PASSWORD)
+        taken = set(User.objects.values_list('username', flat=True))
+        usernames = []
+        while len(usernames) < count:
+            username = fake.user_name()
+            if username in taken:
+                # Faker's pool of names is small next to large seeds
+                username = f'{username}{len(taken)}'
+            if username not in taken:
+                taken.add(username)
+                usernames.append(username)
+        
+        users = [
+            User(
+                username=username,
+                email=fake.email(),
+                first_name=fake.first_name(),
+                last_name=fake.last_name(),
+                password=password
+            )
+            for username in usernames
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        
+        self.stdout.write(f'Created {len(users)} users')
+
+    def bulk_create_tasks(self, count):
+        """Create sample tasks and comments with bulk_create in batches"""
+        self.stdout.write(f'Creating {count} tasks...')
+        
+        user_ids = list(User.objects.values_list('id', flat=True))
+        category_ids = list(Category.objects.values_list('id', flat=True))
+        
+        if not user_ids:
+            self.stdout.write(self.style.ERROR('No users found. Create users first.'))
+            return
+        
+        tz = timezone.get_current_timezone()
+        descriptions = [fake.text(max_nb_chars=500) for _ in range(TEXT_POOL_SIZE)]
+        comment_texts = [fake.text(max_nb_chars=300) for _ in range(TEXT_POOL_SIZE)]
+        search = get_search_backend()
+        created = 0
+        comment_count = 0
+        while created < count:
+            size = min(self.batch_size, count - created)
+            # created_at is stamped by auto_now_add on insert; completed tasks
+            # finish shortly after it, as in create_tasks
+            now = timezone.now()
+            tasks = []
+            for i in range(created, created + size):
+                title = random.choice(TASK_TITLES)
+                if i > len(TASK_TITLES):
+                    title = f"{title} #{i}"
+                status = random.choices(STATUSES, weights=STATUS_WEIGHTS, k=1)[0]
+                tasks.append(Task(
+                    title=title,
+                    description=random.choice(descriptions),
+                    category_id=random.choice(category_ids) if category_ids else None,
+                    assigned_to_id=random.choice(user_ids),
+                    created_by_id=random.choice(user_ids),
+                    priority=random.choice(PRIORITIES),
+                    status=status,
+                    due_date=fake.date_time_between(start_date='-30d', end_date='+60d', tzinfo=tz),
+                    estimated_hours=random.randint(1, 40),
+                    actual_hours=random.randint(1, 45) if status == 'completed' else None,
+                    completed_at=now + timedelta(seconds=random.uniform(1, 60)) if status == 'completed' else None
+                ))
+            
+            with transaction.atomic():
+                Task.objects.bulk_create(tasks)
+                comments = [
+                    Comment(
+                        task_id=task.pk,
+                        author_id=random.choice(user_ids),
+                        content=random.choice(comment_texts)
+                    )
+                    for task in tasks
+                    if random.random() < 0.6  # 60% chance of having comments
+                    for _ in range(random.randint(1, 5))
+                ]
+                Comment.objects.bulk_create(comments)
+                # bulk_create skips the signal that indexes each saved task
+                search.index_tasks(tasks)
+            
+            created += size
+            comment_count += len(comments)
+            self.stdout.write(f'  {created}/{count} tasks')
+        
+        self.stdout.write(f'Created {created} tasks and {comment_count} comments')
         
-        return tasks
\ No newline at end of file
+        # One grouped rebuild instead of per-row counter signals
+        call_command('rebuild_counters', stdout=self.stdout)
+        invalidate_stats_cache()
+        self.write_credentials()
\ No newline at end of file
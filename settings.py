@@ -7,6 +7,7 @@ Generated by 'django-admin startproject' using Django 4.2.7.
 from pathlib import Path
 from datetime import timedelta
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -82,6 +83,75 @@ DATABASES = {
     }
 }
 
+# Cache: per-process locmem by default, shared redis when REDIS_URL is set
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Task stats response cache (entries are also invalidated on task/comment writes)
+TASK_STATS_CACHE = 'default'
+TASK_STATS_CACHE_TTL = int(os.getenv('TASK_STATS_CACHE_TTL', 60))
+TASK_STATS_CACHE_LOCK_TIMEOUT = 10
+
+# How often the Celery beat job refreshes the stats snapshots served by
+# /api/tasks/tasks/stats/?fresh=false (a full recompute also runs daily)
+TASK_STATS_SNAPSHOT_INTERVAL = timedelta(seconds=int(os.getenv('TASK_STATS_SNAPSHOT_INTERVAL', 300)))
+
+# Trends (/api/tasks/tasks/trends/): days shown without ?start=, and the
+# most buckets one response may hold
+TASK_TRENDS_DEFAULT_DAYS = 30
+TASK_TRENDS_MAX_BUCKETS = 1100
+
+# Task field changes recorded in TaskHistory: 'immediate' (in the update's
+# transaction), 'on_commit' (written after it commits), 'deferred' (queued
+# for a Celery worker once the update commits) or 'off'
+TASK_HISTORY_MODE = os.getenv('TASK_HISTORY_MODE', 'immediate')
+
+# Most recent comments/attachments/history inlined by task detail ?expand=
+TASK_DETAIL_EXPAND_LIMIT = 20
+
+# Delta sync (/api/tasks/tasks/changes/): tasks per response, how far the
+# watermark stays behind now so late-committing writes aren't skipped, and
+# how long deletions are remembered (older watermarks get 410 Gone)
+TASK_CHANGES_PAGE_SIZE = 500
+TASK_CHANGES_MARGIN = timedelta(seconds=5)
+TASK_DELETION_LOG_RETENTION = timedelta(days=30)
+
+# Rows fetched per database round trip by /api/tasks/tasks/export/
+TASK_EXPORT_CHUNK_SIZE = 2000
+
+# Largest list accepted by the /api/tasks/tasks/bulk/ endpoint
+TASK_BULK_MAX_ITEMS = int(os.getenv('TASK_BULK_MAX_ITEMS', 1000))
+
+# Attachments: largest accepted file, where resumable uploads collect their
+# chunks and how long an idle one is kept, how long a PATCH may take to
+# copy its chunk in before another can take over the session, and whether
+# identical content (by SHA-256) reuses the stored file
+TASK_ATTACHMENT_MAX_SIZE = int(os.getenv('TASK_ATTACHMENT_MAX_SIZE', 1024 ** 3))
+TASK_UPLOAD_DIR = Path(os.getenv('TASK_UPLOAD_DIR', BASE_DIR / 'uploads'))
+TASK_UPLOAD_EXPIRY = timedelta(hours=24)
+TASK_UPLOAD_LEASE = timedelta(minutes=5)
+TASK_ATTACHMENT_DEDUP = os.getenv('TASK_ATTACHMENT_DEDUP', 'true').lower() == 'true'
+
+# How long gc_attachments leaves an unreferenced blob before deleting it
+TASK_BLOB_GC_GRACE = timedelta(hours=1)
+
+# Attachment downloads: 'django' (FileResponse with Range support),
+# 'x-sendfile' (Apache/lighttpd) or 'x-accel' (nginx, with an internal
+# location at TASK_ATTACHMENT_ACCEL_PREFIX aliased to MEDIA_ROOT)
+TASK_ATTACHMENT_SERVE_MODE = os.getenv('TASK_ATTACHMENT_SERVE_MODE', 'django')
+TASK_ATTACHMENT_ACCEL_PREFIX = '/protected/'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -98,6 +168,38 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing profiles. The first hasher hashes new passwords; the rest
+# only verify existing hashes, which Django re-hashes with the first one on
+# the next successful login. 'fast' is for tests, seeding and load tests:
+# its MD5 hashes are only accepted when it is selected or DEBUG is on.
+PASSWORD_HASHER_PROFILES = {
+    'argon2': ['django.contrib.auth.hashers.Argon2PasswordHasher'],
+    'bcrypt': ['django.contrib.auth.hashers.BCryptSHA256PasswordHasher'],
+    'pbkdf2': ['django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+    'fast': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+}
+
+try:
+    import argon2  # noqa: F401
+    DEFAULT_PASSWORD_HASHER_PROFILE = 'argon2'
+except ImportError:
+    DEFAULT_PASSWORD_HASHER_PROFILE = 'pbkdf2'
+
+PASSWORD_HASHER_PROFILE = os.getenv('PASSWORD_HASHER_PROFILE', DEFAULT_PASSWORD_HASHER_PROFILE)
+if PASSWORD_HASHER_PROFILE not in PASSWORD_HASHER_PROFILES:
+    raise ImproperlyConfigured(
+        f"PASSWORD_HASHER_PROFILE must be one of: {', '.join(PASSWORD_HASHER_PROFILES)}"
+    )
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE] + [
+    hasher
+    for name, hashers in PASSWORD_HASHER_PROFILES.items()
+    if name != PASSWORD_HASHER_PROFILE and (name != 'fast' or DEBUG)
+    for hasher in hashers
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -108,13 +210,39 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Uploaded files
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    # Attachment files, stored once per distinct content under MEDIA_ROOT/blobs/
+    'attachments': {
+        'BACKEND': 'apps.tasks.storage.ContentAddressedStorage',
+    },
+}
+
+# Multipart uploads larger than FILE_UPLOAD_MAX_MEMORY_SIZE stream to a temp
+# file in FILE_UPLOAD_TEMP_DIR (system default when unset) instead of memory
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 2621440))
+FILE_UPLOAD_TEMP_DIR = os.getenv('FILE_UPLOAD_TEMP_DIR') or None
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.authentication.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -126,6 +254,38 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20
 }
 
+# Serve the hot read endpoints (task list/detail/my_tasks/stats and
+# auth/me/) with async views. asgi.py turns this on; under WSGI each async
+# view would need its own event loop, so it stays off there.
+ASYNC_API_VIEWS = os.getenv('ASYNC_API_VIEWS', 'false').lower() == 'true'
+
+# Task event streams (/api/tasks/tasks/events/, ASGI only). 'local' only
+# reaches streams in the writing process; 'redis' shares events between
+# workers over pub/sub. Streams end after TASK_EVENTS_MAX_AGE seconds (the
+# client reconnects), and get a keepalive every TASK_EVENTS_HEARTBEAT.
+TASK_EVENTS_BACKEND = os.getenv('TASK_EVENTS_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'local')
+TASK_EVENTS_REDIS_URL = os.getenv('REDIS_URL')
+TASK_EVENTS_CHANNEL = 'task-events'
+TASK_EVENTS_QUEUE_SIZE = 100
+TASK_EVENTS_HEARTBEAT = 15
+TASK_EVENTS_MAX_AGE = int(os.getenv('TASK_EVENTS_MAX_AGE', 300))
+
+# Task search: 'auto' picks SQLite FTS5 or PostgreSQL tsvector from the
+# database engine; 'icontains' forces the unindexed fallback
+TASK_SEARCH_BACKEND = os.getenv('TASK_SEARCH_BACKEND', 'auto')
+
+# Recently validated users, per process: within the TTL, API requests build
+# the user from token claims instead of querying it (0 disables)
+AUTH_USER_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 60))
+
+# Refresh-token blacklist: checked through a per-process Bloom filter that
+# re-syncs from the database when the shared version key changes, or at
+# least every TOKEN_BLACKLIST_SYNC_INTERVAL seconds
+TOKEN_BLACKLIST_CACHE = 'default'
+TOKEN_BLACKLIST_SYNC_INTERVAL = 5
+TOKEN_BLACKLIST_FILTER_CAPACITY = 100000
+
 # Simple JWT configuration
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -180,6 +340,54 @@ SWAGGER_SETTINGS = {
 
 # Email configuration (for development)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+
+# Link in password reset emails, filled with the user's uid and token
+PASSWORD_RESET_URL = os.getenv('PASSWORD_RESET_URL', 'http://localhost:3000/reset-password?uid={uid}&token={token}')
+
+# Celery: without a broker tasks run eagerly in the web process, which
+# suits development and tests. Tasks are acknowledged after they finish, so
+# a crashed worker's tasks are redelivered; each task is safe to rerun.
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', os.getenv('REDIS_URL', ''))
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'collect-attachment-garbage': {
+        'task': 'apps.tasks.tasks.collect_attachment_garbage',
+        'schedule': timedelta(hours=1),
+    },
+    'refresh-stats-snapshots': {
+        'task': 'apps.tasks.tasks.refresh_stats',
+        'schedule': TASK_STATS_SNAPSHOT_INTERVAL,
+    },
+    'rebuild-stats-snapshots': {
+        'task': 'apps.tasks.tasks.refresh_stats',
+        'schedule': timedelta(days=1),
+        'kwargs': {'full': True},
+    },
+    'refresh-trend-rollup': {
+        'task': 'apps.tasks.tasks.refresh_trends',
+        'schedule': timedelta(hours=1),
+    },
+    'rebuild-trend-rollup': {
+        'task': 'apps.tasks.tasks.refresh_trends',
+        'schedule': timedelta(days=7),
+        'kwargs': {'full': True},
+    },
+    'prune-deletions': {
+        'task': 'apps.tasks.tasks.prune_deletions',
+        'schedule': timedelta(days=1),
+    },
+    'prune-tokens': {
+        'task': 'apps.authentication.tasks.prune_tokens',
+        'schedule': timedelta(days=1),
+    },
+}
 
 # Logging
 LOGGING = {
@@ -0,0 +1,156 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+
+from apps.authentication.async_views import AsyncDispatchMixin
+from apps.authentication.authentication import QueryTokenJWTAuthentication
+from .cache import aget_cached_stats
+from .conditional import acollection_validators, atask_validators, conditional_response, set_validators
+from .events import EventStreamRenderer, get_broadcaster, stream_events
+from .export import CSVRenderer, NDJSONRenderer, astream_export
+from .pagination import apaginate_queryset
+from .serializers import TaskStatsSerializer
+from .snapshots import aget_stats_snapshot
+from .stats import alist, acompute_counter_stats, acompute_task_stats, acategory_task_counts, task_category_ids
+from .views import TaskViewSet
+
+
+class AsyncTaskViewSet(AsyncDispatchMixin, TaskViewSet):
+    """TaskViewSet with async list, retrieve, my_tasks, stats and export, plus the events stream.
+
+    Routed instead of TaskViewSet when ASYNC_API_VIEWS is on, as it is by
+    default under asgi.py. Independent queries behind a response are issued
+    together with asyncio.gather; all other actions run the TaskViewSet
+    code in a worker thread.
+    """
+
+    async def aget_queryset(self):
+        # Search backends may query the database to check for their index
+        if self.request.query_params.get('search'):
+            return await sync_to_async(self.get_queryset)()
+        return self.get_queryset()
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(await self.aget_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def aget_collection_validators(self, request):
+        query = sorted(request.query_params.lists())
+        return await acollection_validators(self.action, request.user.pk, query)
+
+    async def alist_response(self, queryset):
+        """Serialized page of queryset, with the task counts of the categories on it"""
+        if self.paginator is None:
+            page = await alist(queryset)
+            self.task_counts_by_category = await acategory_task_counts(task_category_ids(page))
+            return Response(self.get_serializer(page, many=True).data)
+
+        page = await apaginate_queryset(self.paginator, queryset, self.request, view=self)
+        self.task_counts_by_category = await acategory_task_counts(task_category_ids(page))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    async def list(self, request, *args, **kwargs):
+        etag, last_modified = await self.aget_collection_validators(request)
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = await self.alist_response(await self.aget_queryset())
+        return set_validators(response, etag, last_modified)
+
+    async def retrieve(self, request, *args, **kwargs):
+        validators = await atask_validators(self.kwargs['pk'], self.get_expand())
+        if validators is None:
+            raise Http404
+
+        etag, last_modified = validators
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            task = await self.aget_object()
+            self.task_counts_by_category = await acategory_task_counts(task_category_ids([task]))
+            response = Response(self.get_serializer(task).data)
+        return set_validators(response, etag, last_modified)
+
+    @action(detail=False, methods=['get'])
+    async def my_tasks(self, request):
+        """Get tasks assigned to current user"""
+        etag, last_modified = await self.aget_collection_validators(request)
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            queryset = (await self.aget_queryset()).filter(assigned_to=request.user)
+            response = await self.alist_response(queryset)
+        return set_validators(response, etag, last_modified)
+
+    @swagger_auto_schema(
+        method='get',
+        manual_parameters=[
+            openapi.Parameter(
+                'fresh', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                description='false serves the last snapshot (without filters, or with assigned_to only)'
+            )
+        ],
+        responses={200: TaskStatsSerializer}
+    )
+    @action(detail=False, methods=['get'])
+    async def stats(self, request):
+        """Get task statistics"""
+        if self.wants_stats_snapshot():
+            snapshot = await aget_stats_snapshot(request.query_params.get('assigned_to'))
+            if snapshot is not None:
+                return self.get_snapshot_response(request, *snapshot)
+
+        etag = self.get_stats_etag((await self.aget_collection_validators(request))[0])
+        response = conditional_response(request, etag, None)
+        if response is not None:
+            return set_validators(response, etag, None)
+
+        stats, hit = await aget_cached_stats(request.user, request.query_params, self.acompute_stats)
+        return self.get_stats_response(stats, hit, etag)
+
+    async def acompute_stats(self):
+        counters = self.get_counter_queryset()
+        queryset = await self.aget_queryset()
+        if counters is not None:
+            return await acompute_counter_stats(counters, queryset)
+        return await acompute_task_stats(queryset)
+
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    async def export(self, request):
+        """Stream the tasks matching the list filters as CSV or NDJSON"""
+        return self.get_export_response(
+            request, astream_export(await self.aget_queryset(), request.accepted_renderer.format, self.wants_gzip())
+        )
+
+    @action(
+        detail=False, methods=['get'],
+        renderer_classes=[EventStreamRenderer],
+        authentication_classes=[QueryTokenJWTAuthentication],
+    )
+    async def events(self, request):
+        """Stream task.created/updated/deleted events for the user's tasks (Server-Sent Events).
+
+        Covers tasks the user is assigned to or created. Events carry the
+        task's list fields with category and users as ids. A 'reset' event
+        means some were dropped and the client should refetch. The stream
+        ends when the access token expires, or after TASK_EVENTS_MAX_AGE.
+        """
+        lifetime = getattr(settings, 'TASK_EVENTS_MAX_AGE', 300)
+        if request.auth is not None and 'exp' in request.auth:
+            lifetime = min(lifetime, request.auth['exp'] - timezone.now().timestamp())
+        subscription = get_broadcaster().subscribe(request.user.pk)
+        response = StreamingHttpResponse(stream_events(subscription, lifetime), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Don't let nginx buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
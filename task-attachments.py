@@ -0,0 +1,373 @@
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse, UnreadablePostError
+from django.utils import timezone
+from django.utils.http import content_disposition_header, http_date
+
+from .conditional import make_etag, conditional_response, set_validators
+from .models import Attachment, AttachmentUpload, Blob
+from .storage import ContentAddressedStorage, file_digest
+
+
+# Bytes read per step when copying, hashing or serving files, so memory use
+# doesn't depend on the file or request size
+COPY_CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Computes the SHA-256 of each uploaded file as it streams past.
+
+    Insert it before the handlers that store the file: chunks are passed on
+    unchanged, and digests are kept in self.digests by field name.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+        self.hash = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests[self.field_name] = self.hash.hexdigest()
+        return None
+
+
+class PartFile(File):
+    """A finished upload temp file; FileSystemStorage moves it into place instead of copying"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def find_duplicate(digest, size):
+    """Storage name of an existing attachment with this content, or None"""
+    if not digest or not getattr(settings, 'TASK_ATTACHMENT_DEDUP', True):
+        return None
+    name = (
+        Attachment.objects
+        .filter(sha256=digest, file_size=size)
+        .exclude(file='')
+        .values_list('file', flat=True)
+        .first()
+    )
+    if name and Attachment.file.field.storage.exists(name):
+        return name
+    return None
+
+
+def create_attachment(task, user, file, filename, digest=''):
+    """Attachment for an uploaded file, reusing the stored copy of identical content"""
+    attachment = Attachment(
+        task=task,
+        uploaded_by=user,
+        filename=filename,
+        file_size=file.size,
+        sha256=digest,
+    )
+    duplicate = find_duplicate(digest, file.size)
+    if duplicate:
+        attachment.file = duplicate
+    else:
+        # Lets a content-addressed storage skip hashing, or writing a known blob
+        file.sha256 = digest
+        attachment.file.save(filename, file, save=False)
+    attachment.save()
+    return attachment
+
+
+def get_blob_storage():
+    """The attachment storage if it is content-addressed, else None"""
+    storage = Attachment.file.field.storage
+    return storage if isinstance(storage, ContentAddressedStorage) else None
+
+
+def add_blob_reference(name, size, delta):
+    """Add delta to the reference count of the blob stored under name"""
+    storage = get_blob_storage()
+    if storage is None or not storage.is_blob(name):
+        return
+    now = timezone.now()
+    if Blob.objects.filter(name=name).update(ref_count=F('ref_count') + delta, updated_at=now):
+        return
+    if delta <= 0:
+        return
+    try:
+        with transaction.atomic():
+            Blob.objects.create(name=name, size=size, ref_count=delta)
+    except IntegrityError:
+        # A concurrent upload of the same content created the row first
+        Blob.objects.filter(name=name).update(ref_count=F('ref_count') + delta, updated_at=now)
+
+
+def collect_garbage(grace, dry_run=False):
+    """Delete blobs no attachment has referenced for `grace`; returns (blobs, bytes) freed.
+
+    Covers Blob rows whose count dropped to zero, blob files with no row
+    (an upload that failed after storing its file) and stale temp files.
+    The grace period, checked against both the row and the file's mtime,
+    keeps blobs that a new upload is just starting to reuse.
+    """
+    storage = get_blob_storage()
+    if storage is None:
+        return 0, 0
+    cutoff = timezone.now() - grace
+    freed = [0, 0]
+
+    def remove(name):
+        path = storage.path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return True
+        if stat.st_mtime >= cutoff.timestamp():
+            return False
+        if not dry_run:
+            storage.delete(name)
+        freed[0] += 1
+        freed[1] += stat.st_size
+        return True
+
+    orphans = Blob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff)
+    for name in orphans.values_list('name', flat=True).iterator():
+        if dry_run:
+            remove(name)
+            continue
+        with transaction.atomic():
+            # Skip blobs referenced again since the query above
+            blob = Blob.objects.select_for_update().filter(pk=name, ref_count__lte=0, updated_at__lt=cutoff)
+            if blob.exists() and remove(name):
+                blob.delete()
+
+    # Files without a Blob row, including temp files of interrupted saves
+    for names in batched(walk_blobs(storage), 1000):
+        blobs = [name for name in names if storage.is_blob(name)]
+        tracked = set(Blob.objects.filter(name__in=blobs).values_list('name', flat=True))
+        for name in names:
+            if name not in tracked:
+                remove(name)
+    return tuple(freed)
+
+
+def walk_blobs(storage, directory=None):
+    directory = directory or storage.prefix
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for file in files:
+        yield f'{directory}/{file}'
+    for subdirectory in directories:
+        yield from walk_blobs(storage, f'{directory}/{subdirectory}')
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prune_stale_uploads(now=None):
+    """Delete uploads idle for longer than TASK_UPLOAD_EXPIRY, with their temp files"""
+    cutoff = (now or timezone.now()) - settings.TASK_UPLOAD_EXPIRY
+    return AttachmentUpload.objects.filter(updated_at__lt=cutoff).delete()[0]
+
+
+def start_upload(task, user, filename, size):
+    os.makedirs(settings.TASK_UPLOAD_DIR, exist_ok=True)
+    upload = AttachmentUpload.objects.create(task=task, uploaded_by=user, filename=filename, size=size)
+    open(upload.temp_path, 'wb').close()
+    return upload
+
+
+def read_chunk(upload, stream, offset):
+    """Spool stream into an anonymous temp file; returns (file, bytes read) with the file rewound.
+
+    Stops at the declared upload size. If the client disconnects, what
+    arrived is kept and the client resumes from the new offset. Nothing is
+    locked meanwhile, however slow the client.
+    """
+    remaining = upload.size - offset
+    read = 0
+    chunk = tempfile.TemporaryFile(dir=settings.TASK_UPLOAD_DIR)
+    while stream is not None and read < remaining:
+        try:
+            data = stream.read(min(COPY_CHUNK_SIZE, remaining - read))
+        except UnreadablePostError:
+            break
+        if not data:
+            break
+        chunk.write(data)
+        read += len(data)
+    chunk.seek(0)
+    return chunk, read
+
+
+def claim_upload(upload, offset):
+    """Lease the session to write from offset; returns the lease, or None if the offset moved or another writer holds it.
+
+    A lease older than TASK_UPLOAD_LEASE (its writer died) can be taken over.
+    """
+    writer = uuid.uuid4()
+    now = timezone.now()
+    claimed = AttachmentUpload.objects.filter(
+        Q(writer=None) | Q(updated_at__lt=now - settings.TASK_UPLOAD_LEASE), pk=upload.pk, offset=offset
+    ).update(writer=writer, updated_at=now)
+    return writer if claimed else None
+
+
+def write_chunk(upload, chunk, offset):
+    """Copy a spooled chunk into the upload's temp file at offset"""
+    with open(upload.temp_path, 'r+b') as part:
+        part.seek(offset)
+        shutil.copyfileobj(chunk, part, COPY_CHUNK_SIZE)
+
+
+def advance_upload(upload, writer, offset, written):
+    """Move the session past a written chunk and release the lease; False if the lease was lost"""
+    return bool(AttachmentUpload.objects.filter(pk=upload.pk, writer=writer, offset=offset).update(
+        offset=offset + written, writer=None, updated_at=timezone.now()
+    ))
+
+
+def release_upload(upload, writer):
+    AttachmentUpload.objects.filter(pk=upload.pk, writer=writer).update(writer=None)
+
+
+def complete_upload(upload, task):
+    """Turn a fully received upload into an Attachment and delete the session"""
+    digest = file_digest(upload.temp_path)
+    with open(upload.temp_path, 'rb') as part:
+        attachment = create_attachment(task, upload.uploaded_by, PartFile(part), upload.filename, digest)
+    upload.delete()
+    return attachment
+
+
+def discard_part(upload):
+    try:
+        os.remove(upload.temp_path)
+    except FileNotFoundError:
+        pass
+
+
+def parse_range(header, size):
+    """Inclusive (start, end) of a single-range 'bytes=' header, or None to send the whole file.
+
+    Multi-range and malformed headers are ignored, as RFC 9110 allows.
+    Raises ValueError if the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError('Unsatisfiable range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError('Unsatisfiable range')
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(COPY_CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def attachment_response(request, attachment):
+    """Response serving an attachment's file as TASK_ATTACHMENT_SERVE_MODE says.
+
+    'django' streams it with FileResponse and honours single byte ranges;
+    'x-sendfile' and 'x-accel' hand the file to the web server, which then
+    handles ranges itself.
+    """
+    etag = make_etag(attachment.pk, attachment.file.name, attachment.sha256)
+    last_modified = attachment.uploaded_at
+    response = conditional_response(request, etag, last_modified)
+    if response is not None:
+        return set_validators(response, etag, last_modified)
+
+    disposition = content_disposition_header(True, attachment.filename)
+    content_type = mimetypes.guess_type(attachment.filename)[0] or 'application/octet-stream'
+    mode = getattr(settings, 'TASK_ATTACHMENT_SERVE_MODE', 'django')
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = attachment.file.path
+    elif mode == 'x-accel':
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'TASK_ATTACHMENT_ACCEL_PREFIX', '/protected/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(attachment.file.name)
+    else:
+        response = file_response(request, attachment, etag, content_type)
+    response['Content-Disposition'] = disposition
+    response['Accept-Ranges'] = 'bytes'
+    return set_validators(response, etag, last_modified)
+
+
+def file_response(request, attachment, etag, content_type):
+    file = attachment.file.storage.open(attachment.file.name, 'rb')
+    size = file.size
+
+    # A Range conditioned on a different version of the file gets it whole
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range not in (etag, http_date(attachment.uploaded_at.timestamp())):
+        byte_range = None
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        return FileResponse(file, content_type=content_type)
+
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        read_range(file, start, end - start + 1), status=206, content_type=content_type
+    )
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+STATS_FILTER_PARAMS = ['status', 'priority', 'category', 'assigned_to', 'search', 'overdue']
+
+GENERATION_KEY = 'task_stats:generation'
+HITS_KEY = 'task_stats:hits'
+MISSES_KEY = 'task_stats:misses'
+
+
+def get_stats_cache():
+    return caches[getattr(settings, 'TASK_STATS_CACHE', 'default')]
+
+
+def incr(cache, key, delta=1):
+    """Increment a counter key, creating it when missing or evicted"""
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key, delta)
+
+
+async def aincr(cache, key, delta=1):
+    try:
+        return await cache.aincr(key, delta)
+    except ValueError:
+        await cache.aadd(key, 0, timeout=None)
+        return await cache.aincr(key, delta)
+
+
+def get_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Start from the clock, never 0, so entries cached under a generation
+        # that was since evicted can't be served again
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def aget_generation(cache):
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def invalidate_stats_cache():
+    """Invalidate every cached stats response once the current transaction commits"""
+    def bump():
+        cache = get_stats_cache()
+        get_generation(cache)
+        incr(cache, GENERATION_KEY)
+    # If the cache is down the error is logged and entries age out with
+    # their timeout; the committed write still succeeds
+    transaction.on_commit(bump, robust=True)
+
+
+def stats_cache_key(user, query_params, generation):
+    filters = '&'.join(
+        f'{name}={query_params.get(name)}'
+        for name in STATS_FILTER_PARAMS if query_params.get(name)
+    )
+    digest = hashlib.sha1(filters.encode()).hexdigest()
+    return f'task_stats:{generation}:{user.pk}:{digest}'
+
+
+def get_cached_stats(user, query_params, compute):
+    """Return (stats, hit) for a user and filter set, computing at most once per entry.
+
+    On a miss only the caller that wins the lock computes the aggregate;
+    concurrent callers wait briefly for its result before computing
+    themselves.
+    """
+    cache = get_stats_cache()
+    key = stats_cache_key(user, query_params, get_generation(cache))
+    stats = cache.get(key)
+    if stats is not None:
+        incr(cache, HITS_KEY)
+        return stats, True
+
+    incr(cache, MISSES_KEY)
+    ttl = getattr(settings, 'TASK_STATS_CACHE_TTL', 60)
+    lock_timeout = getattr(settings, 'TASK_STATS_CACHE_LOCK_TIMEOUT', 10)
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, timeout=lock_timeout):
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            stats = cache.get(key)
+            if stats is not None:
+                return stats, False
+            if cache.get(lock_key) is None:
+                break
+        return compute(), False
+
+    try:
+        stats = compute()
+        cache.set(key, stats, timeout=ttl)
+    finally:
+        cache.delete(lock_key)
+    return stats, False
+
+
+async def aget_cached_stats(user, query_params, acompute):
+    """get_cached_stats() for async views; acompute is a coroutine function"""
+    cache = get_stats_cache()
+    key = stats_cache_key(user, query_params, await aget_generation(cache))
+    stats = await cache.aget(key)
+    if stats is not None:
+        await aincr(cache, HITS_KEY)
+        return stats, True
+
+    await aincr(cache, MISSES_KEY)
+    ttl = getattr(settings, 'TASK_STATS_CACHE_TTL', 60)
+    lock_timeout = getattr(settings, 'TASK_STATS_CACHE_LOCK_TIMEOUT', 10)
+    lock_key = f'{key}:lock'
+    if not await cache.aadd(lock_key, 1, timeout=lock_timeout):
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            stats = await cache.aget(key)
+            if stats is not None:
+                return stats, False
+            if await cache.aget(lock_key) is None:
+                break
+        return await acompute(), False
+
+    try:
+        stats = await acompute()
+        await cache.aset(key, stats, timeout=ttl)
+    finally:
+        await cache.adelete(lock_key)
+    return stats, False
+
+
+def get_stats_cache_counters():
+    cache = get_stats_cache()
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': (hits / total * 100) if total > 0 else 0,
+    }
@@ -0,0 +1,104 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+
+from .models import TaskDeletion
+
+
+class WatermarkExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Watermark is older than the deletion log; sync again without ?since='
+    default_code = 'watermark_expired'
+
+
+def encode_watermark(task_position, deletion_position):
+    payload = {
+        't': [task_position[0].isoformat(), task_position[1]],
+        'd': [deletion_position[0].isoformat(), deletion_position[1]],
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_watermark(token):
+    """(task position, deletion position) of a watermark; each is a (timestamp, id) pair"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        positions = [(parse_datetime(payload[key][0]), int(payload[key][1])) for key in ('t', 'd')]
+    except (TypeError, ValueError, KeyError, IndexError):
+        raise ParseError('Invalid watermark')
+    if any(value is None or timezone.is_naive(value) for value, _ in positions):
+        raise ParseError('Invalid watermark')
+    return positions
+
+
+def rows_after(queryset, field, position):
+    """queryset in (field, id) order, starting after position if given"""
+    if position is None:
+        return queryset.order_by(field, 'id')
+    value, pk = position
+    return queryset.filter(
+        Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk})
+    ).order_by(field, 'id')
+
+
+def caught_up(position, cutoff):
+    """Where the next sync resumes a stream that has returned everything up to now.
+
+    Rows written within TASK_CHANGES_MARGIN of now may belong to
+    transactions that commit later with an earlier timestamp than rows
+    already visible. So the position stops at the margin: such rows are
+    returned next time, at the cost of repeating recent ones.
+    """
+    floor = (cutoff, 0)
+    return max(position, floor) if position is not None else floor
+
+
+def get_changes(queryset, since=None, now=None):
+    """(changed tasks, deleted task ids, next watermark, has_more) after the watermark `since`.
+
+    Without `since` every task in queryset is returned, oldest change first.
+    Both streams are range scans on (timestamp, id) indexes, so a sync
+    reads only what changed. Raises WatermarkExpired once deletions the
+    client hasn't seen may have been pruned from the log.
+    """
+    now = now or timezone.now()
+    cutoff = now - settings.TASK_CHANGES_MARGIN
+    limit = settings.TASK_CHANGES_PAGE_SIZE
+    if since:
+        task_position, deletion_position = decode_watermark(since)
+        if deletion_position[0] < now - settings.TASK_DELETION_LOG_RETENTION:
+            raise WatermarkExpired()
+    else:
+        # A full sync starts now; earlier deletions are of tasks it won't send
+        task_position, deletion_position = None, (cutoff, 0)
+
+    tasks = list(rows_after(queryset, 'updated_at', task_position)[:limit + 1])
+    deletions = list(
+        rows_after(TaskDeletion.objects.all(), 'deleted_at', deletion_position)
+        .values_list('deleted_at', 'id', 'task_id')[:limit + 1]
+    )
+    more_tasks, more_deletions = len(tasks) > limit, len(deletions) > limit
+    tasks, deletions = tasks[:limit], deletions[:limit]
+
+    if more_tasks:
+        task_position = (tasks[-1].updated_at, tasks[-1].pk)
+    else:
+        task_position = caught_up(task_position, cutoff)
+    if more_deletions:
+        deletion_position = deletions[-1][:2]
+    else:
+        deletion_position = caught_up(deletion_position, cutoff)
+    watermark = encode_watermark(task_position, deletion_position)
+    return tasks, [task_id for _, _, task_id in deletions], watermark, more_tasks or more_deletions
+
+
+def prune_deletion_log(now=None):
+    """Delete tombstones older than TASK_DELETION_LOG_RETENTION"""
+    cutoff = (now or timezone.now()) - settings.TASK_DELETION_LOG_RETENTION
+    return TaskDeletion.objects.filter(deleted_at__lt=cutoff).delete()[0]
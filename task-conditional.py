@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, IntegerField, DateTimeField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from .models import Task, Comment, Attachment, TaskHistory, TaskCounter, TaskDeletion
+from .stats import alist
+
+
+# Statuses is_overdue never reports as overdue
+CLOSED_STATUSES = ['completed', 'cancelled']
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def latest_deletion():
+    return TaskDeletion.objects.order_by('-id').values_list('id', 'deleted_at')[:1]
+
+
+def overdue_tasks_due(now):
+    """Open tasks already due at now; the latest due_date among them is when is_overdue last flipped"""
+    # Excluding the closed statuses, as is_overdue does, rather than
+    # filtering on the open ones keeps SQLite on the due_date index
+    return Task.objects.filter(due_date__lt=now).exclude(status__in=CLOSED_STATUSES)
+
+
+def latest_task_state(now):
+    """(latest updated_at, latest due_date passed by an open task) in one query of index lookups"""
+    last_due = overdue_tasks_due(now).order_by('-due_date').values('due_date')[:1]
+    return Task.objects.order_by('-updated_at').values_list('updated_at', Subquery(last_due))[:1]
+
+
+def collection_fingerprint(state, deletion, parts):
+    last_updated, last_due = state[0] if state else (None, None)
+    deletion_id, deleted_at = deletion[0] if deletion else (None, None)
+    last_modified = max(filter(None, [last_updated, last_due, deleted_at]), default=None)
+    return make_etag(last_updated, last_due, deletion_id, *parts), last_modified
+
+
+def collection_validators(*parts):
+    """(ETag, Last-Modified) for task collection responses, keyed by parts.
+
+    List pages nest category task counts that change when any task changes,
+    so the whole table is fingerprinted rather than the filtered rows: the
+    latest task write and the latest deletion, both index lookups. Edits to
+    a category or user bump updated_at on their tasks (see signals.py).
+    is_overdue changes with the clock rather than a write, so the latest
+    due_date an open task has passed is folded in too.
+    """
+    state = list(latest_task_state(timezone.now()))
+    return collection_fingerprint(state, list(latest_deletion()), parts)
+
+
+async def acollection_validators(*parts):
+    state, deletion = await asyncio.gather(
+        alist(latest_task_state(timezone.now())),
+        alist(latest_deletion()),
+    )
+    return collection_fingerprint(state, deletion, parts)
+
+
+def related_fingerprint(model, field, timestamp):
+    totals = (
+        model.objects.filter(task=OuterRef('pk'))
+        .order_by()
+        .values('task')
+        .annotate(count=Count('pk'), last=Max(timestamp))
+    )
+    return {
+        f'{field}_count': Coalesce(Subquery(totals.values('count'), output_field=IntegerField()), 0),
+        f'{field}_last': Subquery(totals.values('last'), output_field=DateTimeField()),
+    }
+
+
+def task_validators(pk, expand=()):
+    """(ETag, Last-Modified) of a task as rendered with expand, or None if it doesn't exist.
+
+    Fingerprints the task row, its comments, attachments and history, and
+    its category's task count in one query. The count has no timestamp of
+    its own, so Last-Modified also moves with the latest task write or
+    deletion anywhere; the ETag stays specific to the task. Once the task
+    falls overdue both move to its due_date.
+    """
+    return fingerprint_validators(task_fingerprint(pk).first(), expand)
+
+
+async def atask_validators(pk, expand=()):
+    return fingerprint_validators(await task_fingerprint(pk).afirst(), expand)
+
+
+def task_fingerprint(pk):
+    try:
+        pk = Task._meta.pk.to_python(pk)
+    except ValidationError:
+        return Task.objects.none()
+    category_tasks = (
+        TaskCounter.objects.filter(category=OuterRef('category'))
+        .order_by()
+        .values('category')
+        .annotate(total=Sum('count'))
+        .values('total')
+    )
+    return (
+        Task.objects.filter(pk=pk)
+        .annotate(
+            **related_fingerprint(Comment, 'comments', 'updated_at'),
+            **related_fingerprint(Attachment, 'attachments', 'uploaded_at'),
+            **related_fingerprint(TaskHistory, 'history', 'changed_at'),
+            category_tasks=Subquery(category_tasks, output_field=IntegerField()),
+            tasks_last=Subquery(Task.objects.order_by('-updated_at').values('updated_at')[:1]),
+            deletions_last=Subquery(latest_deletion().values('deleted_at')),
+        )
+        .values(
+            'updated_at', 'due_date', 'status', 'comments_count', 'comments_last', 'attachments_count',
+            'attachments_last', 'history_count', 'history_last', 'category_tasks',
+            'tasks_last', 'deletions_last',
+        )
+    )
+
+
+def fingerprint_validators(fingerprint, expand=()):
+    if fingerprint is None:
+        return None
+
+    # is_overdue flips when the clock passes due_date, with no write
+    due_date, status = fingerprint.pop('due_date'), fingerprint.pop('status')
+    overdue = bool(due_date and due_date < timezone.now() and status not in CLOSED_STATUSES)
+    fingerprint['overdue'] = overdue
+    timestamps = [
+        fingerprint.pop('tasks_last'), fingerprint.pop('deletions_last'),
+        fingerprint['updated_at'], fingerprint['comments_last'],
+        fingerprint['attachments_last'], fingerprint['history_last'],
+        due_date if overdue else None,
+    ]
+    last_modified = max(timestamp for timestamp in timestamps if timestamp)
+    return make_etag(*sorted(fingerprint.items()), *sorted(expand)), last_modified
+
+
+def conditional_response(request, etag, last_modified):
+    """A 304 response if the request's validators match, else None"""
+    # HTTP dates have one-second resolution
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
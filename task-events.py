@@ -0,0 +1,240 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from rest_framework.renderers import BaseRenderer
+
+
+logger = logging.getLogger(__name__)
+
+# How long EventSource waits before reconnecting to a stream that ended
+RECONNECT_DELAY_MS = 2000
+
+# Task columns sent with each event; clients resolve the *_id fields
+# against the categories and users they already hold
+EVENT_FIELDS = [
+    'id', 'title', 'status', 'priority', 'due_date', 'category_id',
+    'assigned_to_id', 'created_by_id', 'created_at', 'updated_at',
+]
+
+
+def task_event(action, task):
+    data = {field: getattr(task, field) for field in EVENT_FIELDS}
+    data['is_overdue'] = task.is_overdue
+    return {'type': f'task.{action}', 'task': data}
+
+
+def event_recipients(task):
+    """Users whose stream gets events for task: its assignee, creator and, after a reassignment, the previous assignee"""
+    users = {task.assigned_to_id, task.created_by_id}
+    previous = getattr(task, '_previous_assignee_id', None)
+    if previous is not None:
+        users.add(previous)
+    return sorted(users)
+
+
+def publish_task_events(action, tasks):
+    """Broadcast a 'task.<action>' event per task once the current transaction commits"""
+    messages = [(event_recipients(task), task_event(action, task)) for task in tasks]
+    if messages:
+        # Serialized now, while the instances still hold the written values
+        messages = json.loads(json.dumps(messages, cls=DjangoJSONEncoder))
+        # robust: the write has committed; a broker outage only loses the
+        # events and is logged, it doesn't turn the request into a 500
+        transaction.on_commit(lambda: get_broadcaster().publish(messages), robust=True)
+
+
+def format_event(event_type, data):
+    """One Server-Sent Events message"""
+    return f'event: {event_type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Renders error responses of event stream views as an SSE 'error' event"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event('error', data).encode(self.charset)
+
+
+class Subscription:
+    """One open event stream: a bounded queue on the event loop serving it"""
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        """Queue event for the stream; safe to call from any thread"""
+        try:
+            self.loop.call_soon_threadsafe(self.put_nowait, event)
+        except RuntimeError:
+            # The stream's event loop has shut down
+            pass
+
+    def put_nowait(self, event):
+        # None marks events as possibly lost, as does a full queue when the
+        # client isn't keeping up; the client is told to refetch instead
+        if event is None:
+            self.overflowed = True
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class LocalBroadcaster:
+    """Fans task events out to the event streams open in this process.
+
+    Each stream costs one Subscription (a small queue) and no thread, so a
+    worker can hold thousands of idle ones. Events published in other
+    processes are not seen; use RedisBroadcaster with several workers.
+    """
+    name = 'local'
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Subscription to the events of user_id's tasks; call from the event loop serving the stream"""
+        subscription = Subscription(user_id, self.queue_size)
+        with self.lock:
+            self.subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscribers[subscription.user_id]
+
+    def publish(self, messages):
+        """Deliver (recipient user ids, event) messages"""
+        self.dispatch(messages)
+
+    def dispatch(self, messages):
+        for users, event in messages:
+            with self.lock:
+                subscriptions = [
+                    subscription for user_id in users for subscription in self.subscribers.get(user_id, ())
+                ]
+            for subscription in subscriptions:
+                subscription.put(event)
+
+    def reset(self):
+        """Tell every open stream that events may have been lost"""
+        with self.lock:
+            subscriptions = [subscription for group in self.subscribers.values() for subscription in group]
+        for subscription in subscriptions:
+            subscription.put(None)
+
+
+class RedisBroadcaster(LocalBroadcaster):
+    """Shares task events between workers through a redis pub/sub channel.
+
+    publish() sends messages to the channel instead of delivering them.
+    Each event loop keeps a single subscription to the channel and hands
+    what arrives to its local streams, so streams don't cost a redis
+    connection each.
+    """
+    name = 'redis'
+
+    def __init__(self, url, channel, queue_size=100):
+        import redis
+
+        super().__init__(queue_size)
+        self.url = url
+        self.channel = channel
+        self.client = redis.Redis.from_url(url)
+        self.listeners = {}
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        listener = self.listeners.get(subscription.loop)
+        if listener is None or listener.done():
+            self.listeners[subscription.loop] = subscription.loop.create_task(self.listen())
+        return subscription
+
+    def publish(self, messages):
+        self.client.publish(self.channel, json.dumps(messages))
+
+    async def listen(self):
+        import redis.asyncio
+
+        while True:
+            try:
+                async with redis.asyncio.Redis.from_url(self.url) as client:
+                    async with client.pubsub() as pubsub:
+                        await pubsub.subscribe(self.channel)
+                        async for message in pubsub.listen():
+                            if message['type'] == 'message':
+                                self.dispatch(json.loads(message['data']))
+            except redis.RedisError:
+                logger.warning('Lost the task event channel, reconnecting', exc_info=True)
+                self.reset()
+                await asyncio.sleep(1)
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    """This process's broadcaster, as configured by TASK_EVENTS_BACKEND"""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            queue_size = getattr(settings, 'TASK_EVENTS_QUEUE_SIZE', 100)
+            if getattr(settings, 'TASK_EVENTS_BACKEND', 'local') == RedisBroadcaster.name:
+                _broadcaster = RedisBroadcaster(
+                    settings.TASK_EVENTS_REDIS_URL, settings.TASK_EVENTS_CHANNEL, queue_size
+                )
+            else:
+                _broadcaster = LocalBroadcaster(queue_size)
+        return _broadcaster
+
+
+async def stream_events(subscription, lifetime):
+    """SSE body for a subscription, ending after lifetime seconds.
+
+    Idle streams get a comment every TASK_EVENTS_HEARTBEAT seconds to keep
+    proxies from timing them out. The lifetime bounds streams whose client
+    went away unnoticed; EventSource reconnects by itself.
+    """
+    heartbeat = getattr(settings, 'TASK_EVENTS_HEARTBEAT', 15)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lifetime
+    try:
+        yield f'retry: {RECONNECT_DELAY_MS}\n\n'
+        while True:
+            if subscription.overflowed:
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.overflowed = False
+                yield format_event('reset', {})
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is not None:
+                yield format_event(event['type'], event['task'])
+    finally:
+        get_broadcaster().unsubscribe(subscription)
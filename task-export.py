@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+import re
+import zlib
+from datetime import date
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+# (column, lookup) of each exported field; related names are read through
+# the joins, so rows need no model or serializer instances
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('title', 'title'),
+    ('description', 'description'),
+    ('status', 'status'),
+    ('priority', 'priority'),
+    ('due_date', 'due_date'),
+    ('estimated_hours', 'estimated_hours'),
+    ('actual_hours', 'actual_hours'),
+    ('category', 'category__name'),
+    ('assigned_to', 'assigned_to__username'),
+    ('created_by', 'created_by__username'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('completed_at', 'completed_at'),
+]
+
+# Encoded bytes gathered before a chunk is sent (and compressed)
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+accepts_gzip = re.compile(r'\bgzip\b')
+
+
+class CSVRenderer(BaseRenderer):
+    """Renders error responses of the export view as a one-row CSV"""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if isinstance(data, dict):
+            writer.writerow(data.keys())
+            writer.writerow(data.values())
+        return buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Renders error responses of the export view as one JSON line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return (json.dumps(data, cls=DjangoJSONEncoder) + '\n').encode(self.charset)
+
+
+def export_rows(queryset, named=False):
+    """queryset as tuples of EXPORT_COLUMNS values, in id order"""
+    return queryset.order_by('pk').values_list(*[lookup for _, lookup in EXPORT_COLUMNS], named=named)
+
+
+class ExportEncoder:
+    """Encodes export rows as CSV or NDJSON in chunks of about EXPORT_CHUNK_BYTES.
+
+    With compress, chunks are one gzip stream, compressed as they are
+    produced, so neither the export nor its compressed form is ever held
+    in memory.
+    """
+
+    def __init__(self, format, compress=False):
+        self.format = format
+        self.columns = [column for column, _ in EXPORT_COLUMNS]
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+        self.json = DjangoJSONEncoder()
+        if format == CSVRenderer.format:
+            self.writer.writerow(self.columns)
+
+    def add(self, row):
+        """Encode a row; returns a chunk to send, or b'' while one is being gathered"""
+        if self.format == CSVRenderer.format:
+            # Dates as in NDJSON and the JSON API
+            self.writer.writerow([self.json.default(value) if isinstance(value, date) else value for value in row])
+        else:
+            self.buffer.write(self.json.encode(dict(zip(self.columns, row))) + '\n')
+        if self.buffer.tell() < EXPORT_CHUNK_BYTES:
+            return b''
+        return self.flush()
+
+    def flush(self, final=False):
+        data = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+            if final:
+                data += self.compressor.flush()
+        return data
+
+
+def stream_export(queryset, format, compress=False):
+    """Response body of an export: the rows of queryset, fetched TASK_EXPORT_CHUNK_SIZE at a time"""
+    encoder = ExportEncoder(format, compress)
+    for row in export_rows(queryset).iterator(chunk_size=settings.TASK_EXPORT_CHUNK_SIZE):
+        chunk = encoder.add(row)
+        if chunk:
+            yield chunk
+    yield encoder.flush(final=True)
+
+
+async def astream_export(queryset, format, compress=False):
+    """stream_export() for async views; ASGI servers would buffer a sync iterator whole"""
+    encoder = ExportEncoder(format, compress)
+    # Plain values_list() rows are fetched as soon as they're iterated,
+    # before aiterator() moves the fetch to a thread; named rows aren't
+    async for row in export_rows(queryset, named=True).aiterator(chunk_size=settings.TASK_EXPORT_CHUNK_SIZE):
+        chunk = encoder.add(row)
+        if chunk:
+            yield chunk
+    yield encoder.flush(final=True)
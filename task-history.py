@@ -0,0 +1,80 @@
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from task_manager.celery import enqueue_on_commit
+from .models import TaskHistory
+from .tasks import write_task_history
+
+
+# Task columns recorded in TaskHistory, with the field name shown for each
+HISTORY_FIELDS = {
+    'title': 'title',
+    'description': 'description',
+    'status': 'status',
+    'priority': 'priority',
+    'due_date': 'due_date',
+    'estimated_hours': 'estimated_hours',
+    'actual_hours': 'actual_hours',
+    'category_id': 'category',
+    'assigned_to_id': 'assigned_to',
+}
+
+
+def history_value(value):
+    return '' if value is None else str(value)
+
+
+def task_changes(task):
+    """(field name, old, new) for each tracked column changed since the task was fetched"""
+    loaded = getattr(task, '_loaded_values', {})
+    return [
+        (name, loaded[attname], task.__dict__[attname])
+        for attname, name in HISTORY_FIELDS.items()
+        if attname in loaded and attname in task.__dict__ and loaded[attname] != task.__dict__[attname]
+    ]
+
+
+def record_task_history(tasks, user):
+    """Write a TaskHistory row per changed field of tasks, in one bulk_create.
+
+    Values are diffed against those loaded when each task was fetched, so
+    no extra SELECT is needed. TASK_HISTORY_MODE 'immediate' writes the rows
+    in the caller's transaction, 'on_commit' defers the write until it
+    commits (and drops it on rollback), 'deferred' queues it for a worker
+    once it commits, and 'off' skips history.
+    """
+    mode = getattr(settings, 'TASK_HISTORY_MODE', 'immediate')
+    if mode == 'off':
+        return []
+
+    rows = []
+    for task in tasks:
+        for name, old, new in task_changes(task):
+            rows.append(TaskHistory(
+                task=task,
+                changed_by=user,
+                field_name=name,
+                old_value=history_value(old),
+                new_value=history_value(new),
+            ))
+        if hasattr(task, '_loaded_values'):
+            # Later saves of the same instance diff against what was just written
+            task._loaded_values.update(
+                (attname, task.__dict__[attname]) for attname in HISTORY_FIELDS if attname in task.__dict__
+            )
+
+    if not rows:
+        return rows
+    if mode == 'deferred':
+        changes = [(row.task_id, row.field_name, row.old_value, row.new_value) for row in rows]
+        enqueue_on_commit(
+            write_task_history, uuid.uuid4().hex, user.pk, changes, timezone.now().isoformat()
+        )
+    elif mode == 'on_commit':
+        transaction.on_commit(lambda: TaskHistory.objects.bulk_create(rows))
+    else:
+        TaskHistory.objects.bulk_create(rows)
+    return rows
@@ -1,6 +1,13 @@
-from django.db import models
+import os
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
+from datetime import timedelta
+
+from .storage import attachment_storage
 
 
 class Category(models.Model):
@@ -54,17 +61,39 @@ class Task(models.Model):
             models.Index(fields=['status', 'priority']),
             models.Index(fields=['assigned_to', 'status']),
             models.Index(fields=['due_date']),
+            # Delta sync (/tasks/changes/) scans (updated_at, id) ranges
+            models.Index(fields=['updated_at', 'id'], name='task_updated_id_idx'),
+            # Keyset pagination over (created_at, id), globally and per assignee
+            models.Index(fields=['-created_at', '-id'], name='task_created_id_idx'),
+            models.Index(fields=['assigned_to', '-created_at', '-id'], name='task_assignee_created_id_idx'),
         ]
     
     def __str__(self):
         return f"{self.title} - {self.get_status_display()}"
     
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Column values as fetched, which history.py diffs against on update
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def update_completed_at(self):
+        """Stamp completed_at on completion and clear it otherwise"""
         if self.status == 'completed' and not self.completed_at:
             self.completed_at = timezone.now()
         elif self.status != 'completed':
             self.completed_at = None
-        super().save(*args, **kwargs)
+    
+    def save(self, *args, **kwargs):
+        self.update_completed_at()
+        # Keep the row and its TaskCounter update (post_save) in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
     
     @property
     def is_overdue(self):
@@ -84,6 +113,10 @@ class Comment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Per-task keyset pages, newest first
+            models.Index(fields=['task', '-created_at', '-id'], name='comment_task_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"Comment by {self.author.username} on {self.task.title}"
@@ -93,15 +126,62 @@ class Attachment(models.Model):
     """Task attachment model"""
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='attachments')
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
-    file = models.FileField(upload_to='attachments/')
+    file = models.FileField(upload_to='attachments/', storage=attachment_storage)
     filename = models.CharField(max_length=255)
-    file_size = models.PositiveIntegerField()  # in bytes
+    file_size = models.PositiveBigIntegerField()  # in bytes
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', '-uploaded_at', '-id'], name='attachment_task_upload_id_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.filename} - {self.task.title}"
 
 
+class Blob(models.Model):
+    """A stored attachment file, shared by every Attachment with the same content.
+
+    ref_count is maintained by the Attachment signals in signals.py;
+    gc_attachments deletes blobs that have had no references for a while.
+    """
+    name = models.CharField(max_length=100, primary_key=True)  # storage name
+    size = models.PositiveBigIntegerField()  # in bytes
+    ref_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'], name='blob_ref_count_updated_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class AttachmentUpload(models.Model):
+    """Resumable attachment upload in progress; chunks are appended to temp_path"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='uploads')
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()  # in bytes
+    offset = models.PositiveBigIntegerField(default=0)  # bytes received so far
+    # Lease of the PATCH copying a chunk in; see claim_upload() in attachments.py
+    writer = models.UUIDField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+    
+    @property
+    def temp_path(self):
+        return os.path.join(settings.TASK_UPLOAD_DIR, f'{self.pk}.part')
+
+
 class TaskHistory(models.Model):
     """Track task changes"""
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='history')
@@ -110,10 +190,140 @@ class TaskHistory(models.Model):
     old_value = models.TextField(blank=True)
     new_value = models.TextField(blank=True)
     changed_at = models.DateTimeField(auto_now_add=True)
+    # Set by TASK_HISTORY_MODE 'deferred', so a redelivered batch is written once
+    batch_id = models.UUIDField(null=True, blank=True, editable=False)
     
     class Meta:
         ordering = ['-changed_at']
         verbose_name_plural = "Task Histories"
+        indexes = [
+            models.Index(fields=['task', '-changed_at', '-id'], name='history_task_changed_id_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['batch_id', 'task', 'field_name'], name='unique_history_batch_change'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.task.title} - {self.field_name} changed by {self.changed_by.username}"
+
+
+class TaskDeletion(models.Model):
+    """Tombstone of a deleted task, so delta sync can report the deletion.
+
+    Written by the Task post_delete signal; rows older than
+    TASK_DELETION_LOG_RETENTION are removed by prune_deletions.
+    """
+    task_id = models.BigIntegerField(db_index=True)  # Task uses a BigAutoField
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='deletion_deleted_id_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Task {self.task_id} deleted at {self.deleted_at}"
+
+
+class TaskCounter(models.Model):
+    """Denormalized task counts per (assignee, category, status, priority).
+
+    Completed rows also sum and sketch their tasks' completion times.
+    Maintained by the Task signals in signals.py; bulk writes and
+    queryset.update() bypass them, so run ``rebuild_counters`` afterwards.
+    Deleting a category folds its rows into the uncategorized ones.
+    """
+    assigned_to = models.ForeignKey(User, on_delete=models.CASCADE, related_name='task_counters')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=15, choices=Task.STATUS_CHOICES)
+    priority = models.CharField(max_length=10, choices=Task.PRIORITY_CHOICES)
+    count = models.IntegerField(default=0)
+    completion_time = models.DurationField(default=timedelta(0), help_text="Sum of completed_at - created_at")
+    completion_sketch = models.JSONField(null=True, blank=True, help_text="QuantileSketch of completion seconds")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['assigned_to', 'category', 'status', 'priority'],
+                name='unique_task_counter_group'
+            ),
+            # NULLs compare distinct in the constraint above
+            models.UniqueConstraint(
+                fields=['assigned_to', 'status', 'priority'],
+                condition=models.Q(category__isnull=True),
+                name='unique_task_counter_uncategorized'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.assigned_to_id}/{self.category_id}/{self.status}/{self.priority}: {self.count}"
+
+
+class TaskStatsSnapshot(models.Model):
+    """Precomputed TaskStatsSerializer figures for one assignee, or for all tasks when user is null.
+
+    Written by refresh_stats_snapshots() in snapshots.py. Assignee rows also
+    keep their grouped totals and completion sketch, which the all-tasks
+    row is folded from.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='task_stats_snapshot'
+    )
+    stats = models.JSONField()
+    groups = models.JSONField(default=list)
+    completion_sketch = models.JSONField(null=True, blank=True, help_text="QuantileSketch of completion seconds")
+    refreshed_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Stats of {self.user_id or 'all tasks'} at {self.refreshed_at}"
+
+
+class TaskTrendRollup(models.Model):
+    """Daily task throughput per (assignee, category), summed by the trends endpoint.
+
+    Written by refresh_trend_rollup() in trends.py for days before the
+    last refresh; later days are computed from the tasks table.
+    """
+    day = models.DateField()
+    assigned_to = models.ForeignKey(User, on_delete=models.CASCADE, related_name='trend_rollups')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    overdue = models.IntegerField(default=0, help_text="Tasks due that day and not done by then")
+    completion_time = models.DurationField(default=timedelta(0), help_text="Sum of completed_at - created_at")
+    completion_sketch = models.JSONField(null=True, blank=True, help_text="QuantileSketch of completion seconds")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'assigned_to', 'category'],
+                condition=models.Q(category__isnull=False),
+                name='unique_trend_rollup_group'
+            ),
+            # NULLs compare distinct in the constraint above
+            models.UniqueConstraint(
+                fields=['day', 'assigned_to'],
+                condition=models.Q(category__isnull=True),
+                name='unique_trend_rollup_uncategorized'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['assigned_to', 'day'], name='trend_assignee_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.assigned_to_id}/{self.category_id}: +{self.created} -{self.completed}"
+
+
+class TaskTrendRefresh(models.Model):
+    """When the trend rollup was last refreshed (a single row).
+
+    TaskTrendRollup is complete for days before complete_before.
+    """
+    refreshed_at = models.DateTimeField()
+    complete_before = models.DateField()
     
     def __str__(self):
-        return f"{self.task.title} - {self.field_name} changed by {self.changed_by.username}"
\ No newline at end of file
+        return f"Trend rollup complete before {self.complete_before}"
@@ -0,0 +1,196 @@
+import asyncio
+import base64
+import json
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .stats import alist
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination over (ordering_field, id), newest first.
+
+    Each page is a range scan on an (ordering_field, id) index, so latency
+    does not grow with page depth, and COUNT(*) only runs when ?count=true.
+    """
+    ordering_field = 'created_at'
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
+    mode_query_param = 'pagination'
+    mode = 'keyset'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request)
+        if self.wants_count(request):
+            self.count = queryset.count()
+        return self.set_page(list(page_queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request)
+        rows = alist(page_queryset[:self.page_size + 1])
+        if self.wants_count(request):
+            self.count, rows = await asyncio.gather(queryset.acount(), rows)
+        else:
+            rows = await rows
+        return self.set_page(rows)
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() == 'true'
+
+    def get_page_queryset(self, queryset, request):
+        """The queryset of the requested page, with one extra row to detect a following page"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.count = None
+
+        field = self.ordering_field
+        self.position, self.reverse = self.decode_cursor(request)
+        if self.position is None:
+            return queryset.order_by(f'-{field}', '-id')
+        value, pk = self.position
+        if self.reverse:
+            return queryset.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk})
+            ).order_by(field, 'id')
+        return queryset.filter(
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+        ).order_by(f'-{field}', '-id')
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        # Moving backwards always leaves a next page behind us, and moving
+        # forwards from a cursor always leaves a previous page
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = self.position is not None if not self.reverse else has_more
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        token = self.encode_token(obj, reverse)
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    @classmethod
+    def encode_token(cls, obj, reverse=False):
+        payload = {'c': getattr(obj, cls.ordering_field).isoformat(), 'i': obj.pk}
+        if reverse:
+            payload['r'] = 1
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            value = parse_datetime(payload['c'])
+            pk = int(payload['i'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (value, pk), bool(payload.get('r'))
+
+
+class CommentPagination(KeysetPagination):
+    ordering_field = 'created_at'
+
+
+class HistoryPagination(KeysetPagination):
+    ordering_field = 'changed_at'
+
+
+class AttachmentPagination(KeysetPagination):
+    ordering_field = 'uploaded_at'
+
+
+async def apaginate_queryset(paginator, queryset, request, view=None):
+    """paginator.paginate_queryset() for async views"""
+    if isinstance(paginator, KeysetPagination):
+        return await paginator.apaginate_queryset(queryset, request, view)
+    if isinstance(paginator, PageNumberPagination):
+        return await apaginate_page_number(paginator, queryset, request, view)
+    return await sync_to_async(paginator.paginate_queryset)(queryset, request, view)
+
+
+async def apaginate_page_number(paginator, queryset, request, view=None):
+    """PageNumberPagination.paginate_queryset() with the count and the page fetched together"""
+    page_size = paginator.get_page_size(request)
+    if not page_size:
+        return None
+
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    page_number = request.query_params.get(paginator.page_query_param) or 1
+    try:
+        number = int(page_number)
+    except ValueError:
+        # 'last' or an invalid number, resolved once the count is known
+        number = 0
+    if number > 0:
+        bottom = (number - 1) * page_size
+        count, rows = await asyncio.gather(queryset.acount(), alist(queryset[bottom:bottom + page_size]))
+    else:
+        count, rows = await queryset.acount(), None
+    # Paginator.count is a cached_property, so the page below doesn't count again
+    django_paginator.count = count
+    if page_number in paginator.last_page_strings:
+        page_number = django_paginator.num_pages
+
+    try:
+        page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        msg = paginator.invalid_page_message.format(page_number=page_number, message=str(exc))
+        raise NotFound(msg)
+    if rows is None:
+        rows = await alist(page.object_list)
+    page.object_list = rows
+
+    if django_paginator.num_pages > 1 and paginator.template is not None:
+        paginator.display_page_controls = True
+    paginator.page = page
+    paginator.request = request
+    return list(page)
@@ -0,0 +1,77 @@
+import math
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch of positive values, with bounded relative error.
+
+    Values are counted in logarithmic bins (as in DDSketch): every quantile
+    is within relative_accuracy of a true value, and the sketch holds one
+    counter per occupied bin whatever the number of values. Sketches with
+    the same accuracy merge by adding their bins, so per-day sketches can
+    be stored and summed over any range. Counts may be negative, which
+    takes values back out of a stored sketch.
+    """
+
+    def __init__(self, relative_accuracy=0.01, bins=None, zero_count=0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = dict(bins or {})
+        self.zero_count = zero_count
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.bins.values())
+
+    def __bool__(self):
+        return bool(self.bins or self.zero_count)
+
+    def add(self, value, count=1):
+        if value <= 0:
+            self.zero_count += count
+        else:
+            self.add_to_bin(math.ceil(math.log(value) / self.log_gamma), count)
+
+    def add_to_bin(self, index, count):
+        count += self.bins.pop(index, 0)
+        if count:
+            self.bins[index] = count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches of different accuracy')
+        for index, count in other.bins.items():
+            self.add_to_bin(index, count)
+        self.zero_count += other.zero_count
+
+    def quantile(self, q):
+        """Estimate of the q-quantile (0 <= q <= 1), or None if the sketch is empty"""
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # Midpoint of the bin (gamma**(index - 1), gamma**index]
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self):
+        """JSON-storable form; JSON object keys are strings"""
+        return {
+            'accuracy': self.relative_accuracy,
+            'zero': self.zero_count,
+            'bins': {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['accuracy'],
+            {int(index): count for index, count in data['bins'].items()},
+            data['zero'],
+        )
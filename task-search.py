@@ -0,0 +1,221 @@
+import re
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+from django.db.models import F, FloatField, Func, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Task
+
+
+SEARCH_TABLE = 'tasks_task_search'
+SEARCH_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(search):
+    """Split a search string into word tokens for prefix matching"""
+    return SEARCH_TERM_RE.findall(search.lower())
+
+
+class FTSRank(Func):
+    """bm25() rank of each task's FTS5 match for match, lower for better matches.
+
+    The ranked matches are a subquery of their own, which SQLite evaluates
+    once and then looks each task up in; LIMIT -1 stops it from flattening
+    that into a MATCH ... AND rowid = id per task, which would rerun the
+    full-text match for every row. The task id is compiled by the ORM, so
+    the expression survives aliasing, .only() and prefetches.
+    """
+    output_field = FloatField()
+
+    def __init__(self, match):
+        super().__init__(F('pk'))
+        self.match = match
+
+    def as_sql(self, compiler, connection, **extra_context):
+        pk_sql, params = compiler.compile(self.get_source_expressions()[0])
+        sql = (
+            f'(SELECT ranked.rank FROM (SELECT rowid, rank FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s LIMIT -1) ranked WHERE ranked.rowid = {pk_sql})'
+        )
+        return sql, [self.match, *params]
+
+
+class IContainsSearch:
+    """Unindexed substring search, used when no full-text index is available"""
+    name = 'icontains'
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def filter(self, queryset, search, rank=False):
+        return queryset.filter(
+            Q(title__icontains=search) |
+            Q(description__icontains=search)
+        )
+
+    def install(self):
+        """Create the index if needed; return True if it was just created"""
+        return False
+
+    def rebuild(self):
+        return 0
+
+    def index_task(self, task):
+        pass
+
+    def index_tasks(self, tasks):
+        for task in tasks:
+            self.index_task(task)
+
+    def remove_task(self, pk):
+        pass
+
+
+class SQLiteFTSSearch(IContainsSearch):
+    """SQLite FTS5 index over title/description, keyed by task id"""
+    name = 'fts5'
+    installed = {}
+
+    def is_installed(self):
+        if self.using not in self.installed:
+            with connections[self.using].cursor() as cursor:
+                cursor.execute('SELECT 1 FROM sqlite_master WHERE name = %s', [SEARCH_TABLE])
+                self.installed[self.using] = cursor.fetchone() is not None
+        return self.installed[self.using]
+
+    def filter(self, queryset, search, rank=False):
+        terms = search_terms(search)
+        if not terms or not self.is_installed():
+            return super().filter(queryset, search)
+
+        # Every term must match, each as a prefix: "fix" "logi"*
+        match = ' '.join(f'"{term}"*' for term in terms)
+        queryset = queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match])
+        )
+        if rank:
+            queryset = queryset.annotate(search_rank=FTSRank(match)).order_by('search_rank', '-created_at')
+        return queryset
+
+    def install(self):
+        self.installed.pop(self.using, None)
+        if self.is_installed():
+            return False
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE {SEARCH_TABLE} '
+                f'USING fts5(title, description, tokenize="unicode61")'
+            )
+        self.installed[self.using] = True
+        return True
+
+    def rebuild(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE}(rowid, title, description) '
+                f'SELECT id, title, description FROM {Task._meta.db_table}'
+            )
+            return cursor.rowcount
+
+    def index_task(self, task):
+        if not self.is_installed():
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {SEARCH_TABLE}(rowid, title, description) VALUES (%s, %s, %s)',
+                [task.pk, task.title, task.description]
+            )
+
+    def index_tasks(self, tasks):
+        if not self.is_installed():
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {SEARCH_TABLE}(rowid, title, description) VALUES (%s, %s, %s)',
+                [(task.pk, task.title, task.description) for task in tasks]
+            )
+
+    def remove_task(self, pk):
+        if not self.is_installed():
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [pk])
+
+
+class PostgresSearch(IContainsSearch):
+    """PostgreSQL tsvector search backed by a GIN expression index.
+
+    The index is on an expression of the task columns, so PostgreSQL keeps
+    it current on every write and no per-save work is needed.
+    """
+    name = 'tsvector'
+    config = 'english'
+
+    def vector_sql(self, qualify=True):
+        prefix = f'{Task._meta.db_table}.' if qualify else ''
+        return (
+            f"to_tsvector('{self.config}', coalesce({prefix}title, '') || ' ' || "
+            f"coalesce({prefix}description, ''))"
+        )
+
+    def filter(self, queryset, search, rank=False):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+        terms = search_terms(search)
+        if not terms:
+            return super().filter(queryset, search)
+
+        query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms), config=self.config, search_type='raw'
+        )
+        queryset = queryset.annotate(
+            search_vector=RawSQL(self.vector_sql(), [], output_field=SearchVectorField())
+        ).filter(search_vector=query)
+        if rank:
+            queryset = queryset.annotate(
+                search_rank=SearchRank('search_vector', query)
+            ).order_by('-search_rank', '-created_at')
+        return queryset
+
+    def install(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_gin '
+                f'ON {Task._meta.db_table} USING GIN ({self.vector_sql(qualify=False)})'
+            )
+        return False
+
+
+SEARCH_BACKENDS = {
+    'icontains': IContainsSearch,
+    'fts5': SQLiteFTSSearch,
+    'tsvector': PostgresSearch,
+}
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSSearch,
+    'postgresql': PostgresSearch,
+}
+
+
+def get_search_backend(using='default'):
+    """Search backend from TASK_SEARCH_BACKEND, or picked by database vendor for 'auto'"""
+    name = getattr(settings, 'TASK_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        backend_class = VENDOR_BACKENDS.get(connections[using].vendor, IContainsSearch)
+    else:
+        backend_class = SEARCH_BACKENDS[name]
+    return backend_class(using)
+
+
+def install_search_index(sender, using='default', **kwargs):
+    """post_migrate handler creating (and on first install, filling) the search index"""
+    backend = get_search_backend(using)
+    try:
+        if backend.install():
+            backend.rebuild()
+    except DatabaseError:
+        # e.g. SQLite built without FTS5; searches fall back to icontains
+        pass
@@ -1,6 +1,12 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Task, Category, Comment, Attachment, TaskHistory
+from django.db import transaction
+from django.utils import timezone
+from .models import Task, Category, Comment, Attachment, AttachmentUpload, TaskHistory
+from .history import record_task_history
+from .signals import sync_bulk_tasks
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -26,6 +32,13 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'task_count']
     
     def get_task_count(self, obj):
+        # Prefer the CategoryViewSet annotation, then counts precomputed by
+        # TaskViewSet for nested categories, before counting rows
+        if hasattr(obj, 'task_count'):
+            return obj.task_count
+        counts = self.context.get('category_task_counts')
+        if counts is not None:
+            return counts.get(obj.pk, 0)
         return obj.task_set.count()
 
 
@@ -50,15 +63,34 @@ class AttachmentSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Attachment
-        fields = ['id', 'filename', 'file_size', 'file_url', 'uploaded_by', 'uploaded_at']
-        read_only_fields = ['id', 'filename', 'file_size', 'uploaded_by', 'uploaded_at']
+        fields = ['id', 'filename', 'file_size', 'sha256', 'file_url', 'uploaded_by', 'uploaded_at']
+        read_only_fields = ['id', 'filename', 'file_size', 'sha256', 'uploaded_by', 'uploaded_at']
     
     def get_file_url(self, obj):
         if obj.file:
-            return obj.file.url
+            return reverse(
+                'task-download-attachment',
+                kwargs={'pk': obj.task_id, 'attachment_id': obj.pk},
+                request=self.context.get('request')
+            )
         return None
 
 
+class AttachmentUploadSerializer(serializers.ModelSerializer):
+    """Resumable attachment upload session"""
+    
+    class Meta:
+        model = AttachmentUpload
+        fields = ['id', 'filename', 'size', 'offset', 'created_at']
+        read_only_fields = ['id', 'offset', 'created_at']
+    
+    def validate_size(self, value):
+        max_size = settings.TASK_ATTACHMENT_MAX_SIZE
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(f"Size must be between 1 and {max_size} bytes")
+        return value
+
+
 class TaskHistorySerializer(serializers.ModelSerializer):
     """Task history serializer"""
     changed_by = UserSerializer(read_only=True)
@@ -86,7 +118,13 @@ class TaskListSerializer(serializers.ModelSerializer):
 
 
 class TaskDetailSerializer(serializers.ModelSerializer):
-    """Task detail serializer (all fields)"""
+    """Task detail serializer (all fields).
+
+    comments, attachments and history are only included when named in
+    context['expand']; the full collections have their own paginated
+    endpoints.
+    """
+    expandable_fields = ['comments', 'attachments', 'history']
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     assigned_to = UserSerializer(read_only=True)
@@ -108,14 +146,85 @@ class TaskDetailSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'created_by', 'completed_at']
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get('expand', ())
+        for name in self.expandable_fields:
+            if name not in expand:
+                self.fields.pop(name)
+    
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
 
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Resolves ids from objects TaskBulkSerializer loaded up front, if any"""
+    
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded_related', {}).get(self.field_name, {})
+        if isinstance(data, int) and data in preloaded:
+            return preloaded[data]
+        # Unknown or malformed ids take the usual path and its error messages
+        return super().to_internal_value(data)
+
+
+class TaskBulkSerializer(serializers.ListSerializer):
+    """Writes many tasks with one bulk_create/bulk_update in a transaction"""
+    
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.preload_related(data)
+        return super().to_internal_value(data)
+    
+    def preload_related(self, data):
+        """Fetch every referenced related object with one query per field"""
+        preloaded = {}
+        for name, field in self.child.fields.items():
+            if not isinstance(field, PreloadedPrimaryKeyRelatedField):
+                continue
+            pks = {
+                item.get(name) for item in data
+                if isinstance(item, dict) and isinstance(item.get(name), int)
+            }
+            preloaded[name] = field.get_queryset().in_bulk(list(pks)) if pks else {}
+        self.context['preloaded_related'] = preloaded
+    
+    def create(self, validated_data):
+        user = self.context['request'].user
+        tasks = [Task(created_by=user, **item) for item in validated_data]
+        for task in tasks:
+            task.update_completed_at()
+        
+        with transaction.atomic():
+            Task.objects.bulk_create(tasks)
+            sync_bulk_tasks([], tasks)
+        return tasks
+    
+    def update(self, instances, validated_data):
+        old_contributions = [task._counter_snapshot for task in instances]
+        fields = {'completed_at', 'updated_at'}
+        now = timezone.now()
+        for task, item in zip(instances, validated_data):
+            for field, value in item.items():
+                setattr(task, field, value)
+            fields.update(item)
+            task.update_completed_at()
+            # bulk_update() does not apply auto_now
+            task.updated_at = now
+        
+        with transaction.atomic():
+            Task.objects.bulk_update(instances, sorted(fields))
+            sync_bulk_tasks(old_contributions, instances)
+            record_task_history(instances, self.context['request'].user)
+        return instances
+
+
 class TaskCreateUpdateSerializer(serializers.ModelSerializer):
     """Task serializer for create/update operations"""
     
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
+    
     class Meta:
         model = Task
         fields = [
@@ -123,12 +232,21 @@ class TaskCreateUpdateSerializer(serializers.ModelSerializer):
             'estimated_hours', 'actual_hours', 'category', 'assigned_to'
         ]
         read_only_fields = ['id']
+        list_serializer_class = TaskBulkSerializer
     
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
 
+class CompletionTimeSerializer(serializers.Serializer):
+    """Mean and percentiles of completed_at - created_at, in hours"""
+    mean = serializers.FloatField(allow_null=True)
+    p50 = serializers.FloatField(allow_null=True)
+    p90 = serializers.FloatField(allow_null=True)
+    p99 = serializers.FloatField(allow_null=True)
+
+
 class TaskStatsSerializer(serializers.Serializer):
     """Serializer for task statistics"""
     total_tasks = serializers.IntegerField()
@@ -139,4 +257,23 @@ class TaskStatsSerializer(serializers.Serializer):
     tasks_by_priority = serializers.DictField()
     tasks_by_category = serializers.DictField()
     completion_rate = serializers.FloatField()
-    average_completion_time = serializers.FloatField()
\ No newline at end of file
+    average_completion_time = serializers.FloatField()
+    # Absent from stats snapshots written before it was added
+    completion_hours = CompletionTimeSerializer(required=False)
+
+
+class TrendBucketSerializer(serializers.Serializer):
+    """Task throughput of one day or week"""
+    date = serializers.DateField()
+    created = serializers.IntegerField()
+    completed = serializers.IntegerField()
+    overdue = serializers.IntegerField()
+    completion_hours = CompletionTimeSerializer()
+
+
+class TaskTrendsSerializer(serializers.Serializer):
+    """Serializer for task trends"""
+    interval = serializers.CharField()
+    start = serializers.DateField()
+    end = serializers.DateField()
+    buckets = TrendBucketSerializer(many=True)
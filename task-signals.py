@@ -0,0 +1,287 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .attachments import add_blob_reference, discard_part
+from .cache import invalidate_stats_cache
+from .events import publish_task_events
+from .models import (
+    Task, Category, Comment, Attachment, AttachmentUpload, TaskCounter, TaskDeletion, TaskTrendRollup,
+)
+from .quantiles import QuantileSketch
+from .search import get_search_backend
+
+
+COUNTER_FIELDS = ['assigned_to_id', 'category_id', 'status', 'priority', 'created_at', 'completed_at']
+
+# User fields nested in task responses by UserSerializer
+USER_DISPLAY_FIELDS = ['username', 'email', 'first_name', 'last_name']
+
+
+def counter_contribution(values):
+    """Return the (counter key, completion time or None) a task contributes to TaskCounter"""
+    key = (values['assigned_to_id'], values['category_id'], values['status'], values['priority'])
+    completion_time = None
+    if values['status'] == 'completed' and values['completed_at'] and values['created_at']:
+        completion_time = values['completed_at'] - values['created_at']
+    return key, completion_time
+
+
+def counter_deltas(removed, added):
+    """Net {key: (count, completion_time, sketch)} of counter contributions leaving and joining groups"""
+    deltas = defaultdict(lambda: [0, timedelta(0), QuantileSketch()])
+    for contributions, sign in ((removed, -1), (added, 1)):
+        for key, completion_time in contributions:
+            delta = deltas[key]
+            delta[0] += sign
+            if completion_time is not None:
+                delta[1] += sign * completion_time
+                delta[2].add(completion_time.total_seconds(), sign)
+    return deltas
+
+
+def apply_counter_deltas(removed, added):
+    for key, (count, completion_time, sketch) in counter_deltas(removed, added).items():
+        if count or completion_time or sketch:
+            apply_counter_delta(key, count, completion_time, sketch)
+
+
+def apply_counter_delta(key, count, completion_time, sketch=None):
+    """Add count/completion_time, and the completion sketch delta if any, to the counter row for key"""
+    assigned_to_id, category_id, status, priority = key
+    lookup = {
+        'assigned_to_id': assigned_to_id,
+        'category_id': category_id,
+        'status': status,
+        'priority': priority,
+    }
+    pk = TaskCounter.objects.filter(**lookup).order_by('pk').values_list('pk', flat=True).first()
+    if pk is None:
+        if count <= 0:
+            # Nothing to decrement, e.g. the counter was cascade-deleted with its user
+            return
+        try:
+            with transaction.atomic():
+                TaskCounter.objects.create(
+                    count=count, completion_time=completion_time,
+                    completion_sketch=sketch.to_dict() if sketch else None, **lookup
+                )
+            return
+        except IntegrityError:
+            # A concurrent writer created the row first
+            pk = TaskCounter.objects.filter(**lookup).values_list('pk', flat=True).first()
+    counters = TaskCounter.objects.filter(pk=pk)
+    if not sketch:
+        counters.update(count=F('count') + count, completion_time=F('completion_time') + completion_time)
+        return
+    with transaction.atomic():
+        # The sketch is merged in Python, so hold the row until it is written back
+        stored = counters.select_for_update().values_list('completion_sketch', flat=True).first()
+        merged = QuantileSketch.from_dict(stored) if stored else QuantileSketch()
+        merged.merge(sketch)
+        counters.update(
+            count=F('count') + count,
+            completion_time=F('completion_time') + completion_time,
+            completion_sketch=merged.to_dict() if merged else None,
+        )
+
+
+def sync_bulk_tasks(old_contributions, tasks):
+    """Bring counters, search index and stats cache up to date after a bulk write.
+
+    bulk_create/bulk_update skip the model signals below; callers pass the
+    counter contributions of the rows before the write (empty for inserts)
+    and the written tasks, in the same order.
+    """
+    for task in tasks:
+        task._counter_snapshot = counter_contribution(task.__dict__)
+    apply_counter_deltas(old_contributions, [task._counter_snapshot for task in tasks])
+
+    get_search_backend().index_tasks(tasks)
+    invalidate_stats_cache()
+    for task, (key, _) in zip(tasks, old_contributions):
+        task._previous_assignee_id = key[0]
+    publish_task_events('updated' if old_contributions else 'created', tasks)
+
+
+@receiver(post_init, sender=Task)
+def snapshot_task_counter(sender, instance, **kwargs):
+    # Read __dict__ directly so deferred fields are never loaded here
+    if instance.pk is None or any(field not in instance.__dict__ for field in COUNTER_FIELDS):
+        instance._counter_snapshot = None
+    else:
+        instance._counter_snapshot = counter_contribution(instance.__dict__)
+
+
+@receiver(pre_save, sender=Task)
+@receiver(pre_delete, sender=Task)
+def load_task_counter_snapshot(sender, instance, **kwargs):
+    if instance.pk is not None and instance._counter_snapshot is None:
+        values = Task.objects.filter(pk=instance.pk).values(*COUNTER_FIELDS).first()
+        if values is not None:
+            instance._counter_snapshot = counter_contribution(values)
+
+
+@receiver(pre_save, sender=Task)
+def remember_task_assignee(sender, instance, **kwargs):
+    # Lets the previous assignee's event stream see a reassignment
+    snapshot = instance._counter_snapshot
+    instance._previous_assignee_id = snapshot[0][0] if snapshot else None
+
+
+@receiver(post_save, sender=Task)
+def update_task_counter(sender, instance, created, **kwargs):
+    old = None if created else instance._counter_snapshot
+    new = counter_contribution({field: getattr(instance, field) for field in COUNTER_FIELDS})
+    if old != new:
+        apply_counter_deltas([old] if old is not None else [], [new])
+    instance._counter_snapshot = new
+
+
+@receiver(post_delete, sender=Task)
+def remove_task_counter(sender, instance, **kwargs):
+    old = instance._counter_snapshot
+    if old is not None:
+        apply_counter_deltas([old], [])
+
+
+@receiver(post_save, sender=Task)
+def index_task_search(sender, instance, **kwargs):
+    get_search_backend(kwargs.get('using') or 'default').index_task(instance)
+
+
+@receiver(post_delete, sender=Task)
+def remove_task_search(sender, instance, **kwargs):
+    get_search_backend(kwargs.get('using') or 'default').remove_task(instance.pk)
+
+
+@receiver(post_delete, sender=Task)
+def log_task_deletion(sender, instance, **kwargs):
+    # Tombstone for delta sync (/tasks/changes/)
+    TaskDeletion.objects.create(task_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Category)
+def fold_category_counters(sender, instance, **kwargs):
+    # Move the category's counts onto the uncategorized rows its tasks are
+    # about to join, rather than letting SET_NULL add a second row per group
+    counters = TaskCounter.objects.filter(category=instance)
+    for counter in counters:
+        key = (counter.assigned_to_id, None, counter.status, counter.priority)
+        sketch = QuantileSketch.from_dict(counter.completion_sketch) if counter.completion_sketch else None
+        apply_counter_delta(key, counter.count, counter.completion_time, sketch)
+    counters.delete()
+
+
+@receiver(pre_delete, sender=Category)
+def fold_category_trend_rollup(sender, instance, **kwargs):
+    # As for counters: merge the category's days into the uncategorized
+    # rows for the same day and assignee, which SET_NULL would duplicate
+    rows = list(TaskTrendRollup.objects.filter(category=instance))
+    if not rows:
+        return
+    targets = {
+        (target.day, target.assigned_to_id): target
+        for target in TaskTrendRollup.objects.filter(
+            category=None, day__in={row.day for row in rows},
+            assigned_to__in={row.assigned_to_id for row in rows},
+        )
+    }
+    folded, merged = [], []
+    for row in rows:
+        target = targets.get((row.day, row.assigned_to_id))
+        if target is None:
+            continue
+        target.created += row.created
+        target.completed += row.completed
+        target.overdue += row.overdue
+        target.completion_time += row.completion_time
+        if row.completion_sketch:
+            sketch = QuantileSketch.from_dict(target.completion_sketch) if target.completion_sketch else QuantileSketch()
+            sketch.merge(QuantileSketch.from_dict(row.completion_sketch))
+            target.completion_sketch = sketch.to_dict()
+        folded.append(row.pk)
+        merged.append(target)
+    TaskTrendRollup.objects.bulk_update(
+        merged, ['created', 'completed', 'overdue', 'completion_time', 'completion_sketch']
+    )
+    TaskTrendRollup.objects.filter(pk__in=folded).delete()
+
+
+@receiver(pre_delete, sender=Category)
+def touch_category_tasks(sender, instance, **kwargs):
+    # SET_NULL clears the tasks' category with an UPDATE that skips
+    # auto_now and post_save; bump updated_at so delta sync and list ETags
+    # see it, and drop cached stats still counting the category
+    Task.objects.filter(category=instance).update(updated_at=timezone.now())
+    invalidate_stats_cache()
+
+
+@receiver(post_save, sender=Category)
+def touch_edited_category_tasks(sender, instance, created, **kwargs):
+    # Task responses nest the category; bump its tasks so delta sync and
+    # list/detail ETags see a rename, and drop cached stats, which count
+    # tasks by category name
+    if not created:
+        Task.objects.filter(category=instance).update(updated_at=timezone.now())
+        invalidate_stats_cache()
+
+
+@receiver(pre_save, sender=User)
+def remember_user_display(sender, instance, update_fields=None, **kwargs):
+    # Logins save last_login alone; skip the lookup for those
+    instance._display_changed = False
+    if instance.pk is None or (update_fields is not None and not set(update_fields) & set(USER_DISPLAY_FIELDS)):
+        return
+    old = User.objects.filter(pk=instance.pk).values(*USER_DISPLAY_FIELDS).first()
+    instance._display_changed = old is not None and any(
+        old[field] != getattr(instance, field) for field in USER_DISPLAY_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def touch_user_tasks(sender, instance, **kwargs):
+    # As for categories: task responses nest their assignee and creator
+    if getattr(instance, '_display_changed', False):
+        Task.objects.filter(Q(assigned_to=instance) | Q(created_by=instance)).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Task)
+def publish_task_saved(sender, instance, created, **kwargs):
+    publish_task_events('created' if created else 'updated', [instance])
+
+
+@receiver(post_delete, sender=Task)
+def publish_task_deleted(sender, instance, **kwargs):
+    publish_task_events('deleted', [instance])
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_task_stats(sender, **kwargs):
+    invalidate_stats_cache()
+
+
+@receiver(post_delete, sender=AttachmentUpload)
+def remove_upload_part(sender, instance, **kwargs):
+    discard_part(instance)
+
+
+@receiver(post_save, sender=Attachment)
+def reference_attachment_blob(sender, instance, created, **kwargs):
+    if created:
+        add_blob_reference(instance.file.name, instance.file_size, 1)
+
+
+@receiver(post_delete, sender=Attachment)
+def release_attachment_blob(sender, instance, **kwargs):
+    # The blob stays until gc_attachments finds it unreferenced
+    add_blob_reference(instance.file.name, instance.file_size, -1)
@@ -0,0 +1,187 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .cache import get_stats_cache
+from .models import Category, Task, TaskCounter, TaskStatsSnapshot
+from .quantiles import QuantileSketch
+from .stats import (
+    ACTIVE_STATUSES, COMPLETION_CHUNK_SIZE, COMPLETION_TIME, alist, completed_tasks, fold_task_stats,
+    sketch_percentiles, summarize_completion, task_stats_groups
+)
+
+
+# Held while a refresh runs, so overlapping runs don't both write
+REFRESH_LOCK_KEY = 'task_stats:snapshot_lock'
+REFRESH_LOCK_TIMEOUT = 10 * 60
+
+
+def snapshot_groups(queryset, now):
+    """Map assignee id to its task_stats_groups(), in the JSON form stored on snapshots"""
+    groups = defaultdict(list)
+    for group in task_stats_groups(queryset, now, group_by=('assigned_to', 'priority', 'category')):
+        completion_time = group['completion_time']
+        group['completion_time'] = completion_time.total_seconds() if completion_time else 0
+        groups[group.pop('assigned_to')].append(group)
+    return groups
+
+
+def completion_sketches(queryset):
+    """Map assignee id to a QuantileSketch of its completed tasks' completion seconds"""
+    sketches = defaultdict(QuantileSketch)
+    durations = completed_tasks(queryset).annotate(duration=COMPLETION_TIME).values_list('assigned_to', 'duration')
+    for user_id, duration in durations.iterator(chunk_size=COMPLETION_CHUNK_SIZE):
+        sketches[user_id].add(duration.total_seconds())
+    return sketches
+
+
+def fold_snapshot_groups(groups, sketch, category_names):
+    """TaskStatsSerializer figures of stored snapshot groups and completion sketch"""
+    stats = fold_task_stats(
+        dict(
+            group,
+            category__name=category_names.get(group['category']),
+            completion_time=timedelta(seconds=group['completion_time']),
+        )
+        for group in groups
+    )
+    stats['completion_hours'] = summarize_completion(
+        sum(group['completion_count'] for group in groups),
+        timedelta(seconds=sum(group['completion_time'] for group in groups)),
+        sketch_percentiles(sketch),
+    )
+    return stats
+
+
+def changed_assignees(since, now):
+    """Assignees whose figures may have changed between since and now.
+
+    Tasks written since then (less TASK_CHANGES_MARGIN, for transactions
+    that commit late) and tasks that fell overdue are index range scans.
+    Deleting or reassigning a task leaves no row behind for its previous
+    assignee, so assignees whose TaskCounter total no longer matches their
+    snapshot are added too; a change that keeps their total also writes
+    one of their tasks.
+    """
+    users = set(
+        Task.objects.filter(updated_at__gte=since - settings.TASK_CHANGES_MARGIN)
+        .values_list('assigned_to', flat=True).distinct()
+    )
+    users.update(
+        Task.objects.filter(due_date__gte=since, due_date__lt=now, status__in=ACTIVE_STATUSES)
+        .values_list('assigned_to', flat=True).distinct()
+    )
+
+    totals = dict(
+        TaskCounter.objects.order_by().values('assigned_to')
+        .annotate(total=Sum('count')).values_list('assigned_to', 'total')
+    )
+    snapshots = dict(
+        TaskStatsSnapshot.objects.filter(user__isnull=False).values_list('user', 'stats__total_tasks')
+    )
+    for user_id in totals.keys() | snapshots.keys():
+        if totals.get(user_id, 0) != snapshots.get(user_id, 0):
+            users.add(user_id)
+    return users
+
+
+def refresh_stats_snapshots(full=False, now=None):
+    """Bring the stats snapshots up to date.
+
+    Only assignees whose tasks changed since the last refresh are
+    recomputed, with one grouped query and one pass over the durations of
+    their completed tasks; full=True (or
+    the first run) recomputes everyone. The all-tasks row is then folded
+    from the assignee rows, without reading the tasks table. Returns the
+    number of assignees recomputed, or None if another refresh is running.
+    """
+    cache = get_stats_cache()
+    if not cache.add(REFRESH_LOCK_KEY, 1, timeout=REFRESH_LOCK_TIMEOUT):
+        return None
+    try:
+        now = now or timezone.now()
+        latest = TaskStatsSnapshot.objects.filter(user=None).first()
+        if full or latest is None:
+            users = None
+            tasks = Task.objects.all()
+        else:
+            users = changed_assignees(latest.refreshed_at, now)
+            tasks = Task.objects.filter(assigned_to__in=users)
+        groups = snapshot_groups(tasks, now)
+        sketches = completion_sketches(tasks)
+        category_names = dict(Category.objects.values_list('id', 'name'))
+
+        with transaction.atomic():
+            rows = TaskStatsSnapshot.objects.filter(user__isnull=False)
+            if users is not None:
+                rows = rows.filter(user__in=users)
+            existing = {row.user_id: row for row in rows.only('id', 'user')}
+            # Assignees left without tasks
+            rows.exclude(user__in=list(groups)).delete()
+
+            created, updated = [], []
+            for user_id, user_groups in groups.items():
+                row = existing.get(user_id)
+                if row is None:
+                    row = TaskStatsSnapshot(user_id=user_id)
+                    created.append(row)
+                else:
+                    updated.append(row)
+                sketch = sketches[user_id]
+                row.stats = fold_snapshot_groups(user_groups, sketch, category_names)
+                row.groups = user_groups
+                row.completion_sketch = sketch.to_dict()
+                row.refreshed_at = now
+            TaskStatsSnapshot.objects.bulk_create(created)
+            TaskStatsSnapshot.objects.bulk_update(updated, ['stats', 'groups', 'completion_sketch', 'refreshed_at'])
+
+            all_groups, all_sketch = [], QuantileSketch()
+            user_rows = TaskStatsSnapshot.objects.filter(user__isnull=False).values_list('groups', 'completion_sketch')
+            for user_groups, sketch in user_rows:
+                all_groups.extend(user_groups)
+                if sketch:
+                    all_sketch.merge(QuantileSketch.from_dict(sketch))
+            TaskStatsSnapshot.objects.update_or_create(user=None, defaults={
+                'stats': fold_snapshot_groups(all_groups, all_sketch, category_names),
+                'completion_sketch': all_sketch.to_dict(),
+                'refreshed_at': now,
+            })
+        return len(groups) if users is None else len(users)
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+
+
+def snapshot_rows(user_id):
+    return TaskStatsSnapshot.objects.filter(Q(user=None) | Q(user=user_id)).only('user', 'stats', 'refreshed_at')
+
+
+def read_snapshot(rows, user_id):
+    rows = {row.user_id: row for row in rows}
+    latest = rows.get(None)
+    if latest is None:
+        return None
+    row = rows.get(user_id)
+    if row is None:
+        # The assignee had no tasks at the last refresh
+        return fold_snapshot_groups([], QuantileSketch(), {}), latest.refreshed_at, latest.refreshed_at
+    return row.stats, row.refreshed_at, latest.refreshed_at
+
+
+def get_stats_snapshot(user_id=None):
+    """(stats, last modified, as of) from the snapshot of an assignee, or of all tasks.
+
+    Last modified is when the figures last changed; as of is the last
+    refresh, when they were last known to be current. None before the
+    first refresh.
+    """
+    user_id = int(user_id) if user_id else None
+    return read_snapshot(snapshot_rows(user_id), user_id)
+
+
+async def aget_stats_snapshot(user_id=None):
+    user_id = int(user_id) if user_id else None
+    return read_snapshot(await alist(snapshot_rows(user_id)), user_id)
@@ -0,0 +1,324 @@
+import asyncio
+from datetime import timedelta
+
+from django.db import connections
+from django.db.models import (
+    Q, F, Aggregate, Count, Sum, DurationField, ExpressionWrapper, IntegerField, OuterRef, Subquery
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import TaskCounter
+from .quantiles import QuantileSketch
+
+
+ACTIVE_STATUSES = ['pending', 'in_progress']
+
+COMPLETION_TIME = ExpressionWrapper(
+    F('completed_at') - F('created_at'), output_field=DurationField()
+)
+
+COMPLETION_QUANTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+# Completed tasks fetched per round trip when streaming durations
+COMPLETION_CHUNK_SIZE = 2000
+
+
+class PercentileCont(Aggregate):
+    """PostgreSQL percentile_cont: the interpolated fraction-quantile of expression"""
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+async def alist(queryset):
+    return [item async for item in queryset]
+
+
+def compute_task_stats(queryset, now=None):
+    """Compute TaskStatsSerializer figures for a task queryset"""
+    stats = fold_task_stats(task_stats_groups(queryset, now))
+    stats['completion_hours'] = completion_summary(queryset)
+    return stats
+
+
+async def acompute_task_stats(queryset, now=None):
+    groups, summary = await asyncio.gather(
+        alist(task_stats_groups(queryset, now)),
+        acompletion_summary(queryset),
+    )
+    stats = fold_task_stats(groups)
+    stats['completion_hours'] = summary
+    return stats
+
+
+def completed_tasks(queryset):
+    return queryset.order_by().prefetch_related(None).filter(status='completed', completed_at__isnull=False)
+
+
+def summarize_completion(count, total, percentiles):
+    """CompletionTimeSerializer figures in hours, from a count, total duration and {name: seconds} percentiles"""
+    hours = {'mean': None, **dict.fromkeys(COMPLETION_QUANTILES)}
+    if count:
+        hours['mean'] = total.total_seconds() / count / 3600
+        for name in COMPLETION_QUANTILES:
+            hours[name] = percentiles[name] / 3600
+    return hours
+
+
+def sketch_percentiles(sketch):
+    return {name: sketch.quantile(fraction) for name, fraction in COMPLETION_QUANTILES.items()}
+
+
+def percentile_completion_time():
+    return {
+        'count': Count('id'),
+        'total': Sum(COMPLETION_TIME),
+        **{
+            name: PercentileCont(COMPLETION_TIME, fraction, output_field=DurationField())
+            for name, fraction in COMPLETION_QUANTILES.items()
+        },
+    }
+
+
+def aggregate_summary(figures):
+    percentiles = {name: figures[name].total_seconds() for name in COMPLETION_QUANTILES if figures[name]}
+    return summarize_completion(figures['count'], figures['total'], percentiles)
+
+
+def completion_summary(queryset):
+    """Mean and p50/p90/p99 of completed_at - created_at over queryset's completed tasks, in hours.
+
+    PostgreSQL computes exact percentiles in one aggregate query. Other
+    databases stream the durations into a QuantileSketch (within 1%), so
+    memory stays bounded however many tasks completed.
+    """
+    completed = completed_tasks(queryset)
+    if connections[completed.db].vendor == 'postgresql':
+        return aggregate_summary(completed.aggregate(**percentile_completion_time()))
+
+    count, total, sketch = 0, timedelta(0), QuantileSketch()
+    durations = completed.annotate(duration=COMPLETION_TIME).values_list('duration', flat=True)
+    for duration in durations.iterator(chunk_size=COMPLETION_CHUNK_SIZE):
+        count += 1
+        total += duration
+        sketch.add(duration.total_seconds())
+    return summarize_completion(count, total, sketch_percentiles(sketch))
+
+
+async def acompletion_summary(queryset):
+    completed = completed_tasks(queryset)
+    if connections[completed.db].vendor == 'postgresql':
+        return aggregate_summary(await completed.aaggregate(**percentile_completion_time()))
+
+    count, total, sketch = 0, timedelta(0), QuantileSketch()
+    durations = completed.annotate(duration=COMPLETION_TIME).values_list('duration', flat=True)
+    async for duration in durations.aiterator(chunk_size=COMPLETION_CHUNK_SIZE):
+        count += 1
+        total += duration
+        sketch.add(duration.total_seconds())
+    return summarize_completion(count, total, sketch_percentiles(sketch))
+
+
+def task_stats_groups(queryset, now=None, group_by=('priority', 'category__name')):
+    now = now or timezone.now()
+    completed = Q(status='completed', completed_at__isnull=False)
+
+    # One GROUP BY (priority, category) with conditional aggregates; the
+    # per-status totals are rolled up from the groups in fold_task_stats.
+    return (
+        queryset.order_by()
+        .prefetch_related(None)
+        .values(*group_by)
+        .annotate(
+            total=Count('id'),
+            pending=Count('id', filter=Q(status='pending')),
+            in_progress=Count('id', filter=Q(status='in_progress')),
+            completed=Count('id', filter=Q(status='completed')),
+            overdue=Count('id', filter=Q(due_date__lt=now, status__in=ACTIVE_STATUSES)),
+            completion_count=Count('id', filter=completed),
+            completion_time=Sum(COMPLETION_TIME, filter=completed),
+        )
+    )
+
+
+def fold_task_stats(groups):
+    stats = {
+        'total_tasks': 0,
+        'pending_tasks': 0,
+        'in_progress_tasks': 0,
+        'completed_tasks': 0,
+        'overdue_tasks': 0,
+        'tasks_by_priority': {},
+        'tasks_by_category': {},
+    }
+    completion_count = 0
+    completion_time = timedelta(0)
+
+    for group in groups:
+        stats['total_tasks'] += group['total']
+        stats['pending_tasks'] += group['pending']
+        stats['in_progress_tasks'] += group['in_progress']
+        stats['completed_tasks'] += group['completed']
+        stats['overdue_tasks'] += group['overdue']
+
+        priority = group['priority']
+        stats['tasks_by_priority'][priority] = stats['tasks_by_priority'].get(priority, 0) + group['total']
+        category = group['category__name'] or 'Uncategorized'
+        stats['tasks_by_category'][category] = stats['tasks_by_category'].get(category, 0) + group['total']
+
+        if group['completion_count']:
+            completion_count += group['completion_count']
+            completion_time += group['completion_time']
+
+    stats['tasks_by_priority'] = dict(sorted(stats['tasks_by_priority'].items()))
+    stats['tasks_by_category'] = dict(sorted(stats['tasks_by_category'].items()))
+
+    # Completion rate
+    completed_count = stats['completed_tasks']
+    total = stats['total_tasks']
+    stats['completion_rate'] = (completed_count / total * 100) if total > 0 else 0
+
+    # Average completion time (in days)
+    if completion_count:
+        stats['average_completion_time'] = (completion_time / completion_count).days
+    else:
+        stats['average_completion_time'] = 0
+
+    return stats
+
+
+def compute_counter_stats(counters, queryset, now=None):
+    """Compute TaskStatsSerializer figures from TaskCounter rows.
+
+    Only the overdue figure depends on the clock, so it is the one count
+    still taken from the tasks table (a range scan on the due_date index).
+    Completion percentiles come from merging the completed rows' sketches
+    (within 1% on every database), so no completed task is read.
+    """
+    stats = fold_counter_stats(
+        counter_stats_groups(counters),
+        overdue_tasks(queryset, now).count(),
+    )
+    stats['completion_hours'] = counter_completion_summary(counter_completion_rows(counters))
+    return stats
+
+
+async def acompute_counter_stats(counters, queryset, now=None):
+    groups, overdue, completion_rows = await asyncio.gather(
+        alist(counter_stats_groups(counters)),
+        overdue_tasks(queryset, now).acount(),
+        alist(counter_completion_rows(counters)),
+    )
+    stats = fold_counter_stats(groups, overdue)
+    stats['completion_hours'] = counter_completion_summary(completion_rows)
+    return stats
+
+
+def counter_completion_rows(counters):
+    return counters.order_by().filter(status='completed').values_list('completion_time', 'completion_sketch')
+
+
+def counter_completion_summary(rows):
+    """Completion summary of (completion_time, completion_sketch) TaskCounter rows"""
+    total, sketch = timedelta(0), QuantileSketch()
+    for completion_time, stored in rows:
+        total += completion_time
+        if stored:
+            sketch.merge(QuantileSketch.from_dict(stored))
+    return summarize_completion(sketch.count, total, sketch_percentiles(sketch))
+
+
+def counter_stats_groups(counters):
+    return (
+        counters.order_by()
+        .values('status', 'priority', 'category__name')
+        .annotate(total=Sum('count'), completion_time=Sum('completion_time'))
+    )
+
+
+def overdue_tasks(queryset, now=None):
+    return queryset.filter(due_date__lt=now or timezone.now(), status__in=ACTIVE_STATUSES)
+
+
+def fold_counter_stats(groups, overdue):
+    stats = {
+        'total_tasks': 0,
+        'pending_tasks': 0,
+        'in_progress_tasks': 0,
+        'completed_tasks': 0,
+        'overdue_tasks': overdue,
+        'tasks_by_priority': {},
+        'tasks_by_category': {},
+    }
+    completion_time = timedelta(0)
+
+    for group in groups:
+        total = group['total']
+        if not total:
+            continue
+        stats['total_tasks'] += total
+        if group['status'] in ('pending', 'in_progress', 'completed'):
+            stats[f"{group['status']}_tasks"] += total
+        if group['status'] == 'completed':
+            completion_time += group['completion_time']
+
+        priority = group['priority']
+        stats['tasks_by_priority'][priority] = stats['tasks_by_priority'].get(priority, 0) + total
+        category = group['category__name'] or 'Uncategorized'
+        stats['tasks_by_category'][category] = stats['tasks_by_category'].get(category, 0) + total
+
+    stats['tasks_by_priority'] = dict(sorted(stats['tasks_by_priority'].items()))
+    stats['tasks_by_category'] = dict(sorted(stats['tasks_by_category'].items()))
+
+    completed_count = stats['completed_tasks']
+    total = stats['total_tasks']
+    stats['completion_rate'] = (completed_count / total * 100) if total > 0 else 0
+
+    if completed_count:
+        stats['average_completion_time'] = (completion_time / completed_count).days
+    else:
+        stats['average_completion_time'] = 0
+
+    return stats
+
+
+def task_category_ids(tasks):
+    """Ids of the categories of tasks"""
+    return {task.category_id for task in tasks if task.category_id is not None}
+
+
+def category_task_counts(category_ids):
+    """Map each of category_ids to its task count, read from TaskCounter"""
+    if not category_ids:
+        return {}
+    return {group['category_id']: group['total'] for group in category_count_groups(category_ids)}
+
+
+async def acategory_task_counts(category_ids):
+    if not category_ids:
+        return {}
+    return {group['category_id']: group['total'] async for group in category_count_groups(category_ids)}
+
+
+def category_count_groups(category_ids):
+    return (
+        TaskCounter.objects.order_by()
+        .filter(category_id__in=category_ids)
+        .values('category_id')
+        .annotate(total=Sum('count'))
+    )
+
+
+def category_task_count_subquery():
+    """Subquery annotating a Category queryset with its task count"""
+    totals = (
+        TaskCounter.objects.order_by()
+        .filter(category=OuterRef('pk'))
+        .values('category')
+        .annotate(total=Sum('count'))
+        .values('total')
+    )
+    return Coalesce(Subquery(totals, output_field=IntegerField()), 0)
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def attachment_storage():
+    return storages['attachments']
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File storage that keeps each distinct content once, under its SHA-256.
+
+    The name passed to save() is ignored. Content is hashed while it is
+    written to a temp file, which is renamed to blobs/<ab>/<cd>/<digest>, or
+    dropped if that blob already exists. Content that carries a ``sha256``
+    attribute is trusted and not written at all when its blob exists.
+
+    Blobs are shared, so nothing should delete() one that an Attachment
+    still references; Blob rows count the references and gc_attachments
+    removes unreferenced blobs.
+    """
+    prefix = 'blobs'
+
+    def blob_name(self, digest):
+        return f'{self.prefix}/{digest[:2]}/{digest[2:4]}/{digest}'
+
+    def is_blob(self, name):
+        return bool(name) and name.startswith(f'{self.prefix}/') and not self.is_temp(name)
+
+    def is_temp(self, name):
+        return name.startswith(f'{self.prefix}/tmp/')
+
+    def get_available_name(self, name, max_length=None):
+        # _save names the file after its content
+        return name
+
+    def _save(self, name, content):
+        temp_dir = self.path(f'{self.prefix}/tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+
+        digest = getattr(content, 'sha256', '')
+        if digest and self.reuse(self.blob_name(digest)):
+            return self.blob_name(digest)
+
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                # Already on disk: move it rather than copy
+                os.close(fd)
+                file_move_safe(content.temporary_file_path(), temp_path, allow_overwrite=True)
+                if not digest:
+                    digest = file_digest(temp_path)
+            else:
+                hasher = hashlib.sha256()
+                with os.fdopen(fd, 'wb') as temp:
+                    for chunk in content.chunks():
+                        hasher.update(chunk)
+                        temp.write(chunk)
+                digest = hasher.hexdigest()
+
+            name = self.blob_name(digest)
+            if not self.reuse(name):
+                path = self.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                # Atomic, and harmless if a concurrent save of the same content won
+                os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def reuse(self, name):
+        """True if the blob exists, marking it recently used so GC leaves it alone"""
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,62 @@
+from celery import shared_task
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils.dateparse import parse_datetime
+
+from .attachments import collect_garbage, prune_stale_uploads
+from .changes import prune_deletion_log
+from .models import Task, TaskHistory
+from .snapshots import refresh_stats_snapshots
+from .trends import refresh_trend_rollup
+
+
+@shared_task(autoretry_for=(DatabaseError,), retry_backoff=True, max_retries=5)
+def write_task_history(batch_id, user_id, changes, changed_at):
+    """Write the TaskHistory rows of one update, queued in TASK_HISTORY_MODE 'deferred'.
+
+    changes are (task id, field name, old value, new value). Rows are
+    written in one transaction and stamped with the time of the update,
+    not of this run. They carry batch_id, unique per task and field, so a
+    batch redelivered to any worker is written once.
+    """
+    if TaskHistory.objects.filter(batch_id=batch_id).exists():
+        return 0
+
+    # Tasks deleted in the meantime took their history with them
+    live = set(Task.objects.filter(pk__in={change[0] for change in changes}).values_list('pk', flat=True))
+    rows = [
+        TaskHistory(
+            task_id=task_id, changed_by_id=user_id, field_name=name, old_value=old, new_value=new,
+            batch_id=batch_id,
+        )
+        for task_id, name, old, new in changes if task_id in live
+    ]
+    with transaction.atomic():
+        # A concurrent run of the same batch conflicts on the constraint
+        TaskHistory.objects.bulk_create(rows, ignore_conflicts=True)
+        # changed_at is auto_now_add, which bulk_create can't override
+        TaskHistory.objects.filter(batch_id=batch_id).update(changed_at=parse_datetime(changed_at))
+    return len(rows)
+
+
+@shared_task
+def collect_attachment_garbage():
+    """Delete idle resumable uploads, then blobs unreferenced for TASK_BLOB_GC_GRACE"""
+    uploads = prune_stale_uploads()
+    blobs, size = collect_garbage(settings.TASK_BLOB_GC_GRACE)
+    return {'uploads': uploads, 'blobs': blobs, 'bytes': size}
+
+
+@shared_task
+def refresh_stats(full=False):
+    return refresh_stats_snapshots(full=full)
+
+
+@shared_task
+def refresh_trends(full=False):
+    return refresh_trend_rollup(full=full)
+
+
+@shared_task
+def prune_deletions():
+    return prune_deletion_log()
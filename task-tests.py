@@ -0,0 +1,1240 @@
+import csv
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from io import StringIO
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+
+from apps.authentication.async_views import CurrentUserView
+from apps.authentication.views import current_user
+from .async_views import AsyncTaskViewSet
+from django.core.management import call_command
+from django.db.models import Count, Sum
+from django.test import TestCase
+
+from . import attachments, cache as stats_cache, events, export, signals, snapshots, stats, views
+from .changes import prune_deletion_log
+from .models import (
+    Attachment, AttachmentUpload, Blob, Category, Comment, Task, TaskCounter, TaskDeletion, TaskHistory,
+    TaskTrendRollup,
+)
+from .pagination import CommentPagination, KeysetPagination
+from .search import SEARCH_TABLE, SQLiteFTSSearch, get_search_backend
+from .serializers import TaskDetailSerializer, TaskListSerializer
+from .tasks import write_task_history
+from .trends import refresh_trend_rollup
+
+
+class TaskQueryTestCase(APITestCase):
+    """Tasks spread over two assignees and categories, with a few comments"""
+    tasks_per_user = 6
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'pw', first_name='Alice')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'pw', first_name='Bob')
+        categories = [
+            Category.objects.create(name='Development', color='#007bff'),
+            Category.objects.create(name='Design', color='#28a745'),
+        ]
+        for user in (cls.user, cls.other):
+            for i in range(cls.tasks_per_user):
+                task = Task.objects.create(
+                    title=f'Task {i}', description='Details', assigned_to=user, created_by=cls.user,
+                    category=categories[i % 2], priority=['low', 'medium', 'high'][i % 3],
+                )
+                Comment.objects.create(task=task, author=cls.other, content='Looks good')
+        cls.task = Task.objects.filter(assigned_to=cls.user).first()
+
+    def setUp(self):
+        # Stats responses are cached across requests
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, path, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+
+class TaskActionQueryCountTests(TaskQueryTestCase):
+    """Queries issued per request by each task action"""
+
+    def assertActionQueries(self, count, path, params=None):
+        self.assertEqual(self.count_queries(path, params), count, f'GET {path} {params or ""}')
+
+    def test_list(self):
+        self.assertActionQueries(5, '/api/tasks/tasks/')
+
+    def test_list_filtered(self):
+        self.assertActionQueries(5, '/api/tasks/tasks/', {'status': 'pending', 'priority': 'high'})
+
+    def test_list_keyset(self):
+        self.assertActionQueries(4, '/api/tasks/tasks/', {'pagination': 'keyset'})
+
+    def test_my_tasks(self):
+        self.assertActionQueries(5, '/api/tasks/tasks/my_tasks/')
+
+    def test_retrieve(self):
+        self.assertActionQueries(3, f'/api/tasks/tasks/{self.task.pk}/')
+
+    def test_retrieve_expanded(self):
+        self.assertActionQueries(
+            6, f'/api/tasks/tasks/{self.task.pk}/', {'expand': 'comments,attachments,history'}
+        )
+
+    def test_comments(self):
+        self.assertActionQueries(2, f'/api/tasks/tasks/{self.task.pk}/comments/')
+
+    def test_history(self):
+        self.assertActionQueries(2, f'/api/tasks/tasks/{self.task.pk}/history/')
+
+    def test_stats(self):
+        self.assertActionQueries(5, '/api/tasks/tasks/stats/')
+
+    def test_changes(self):
+        self.assertActionQueries(3, '/api/tasks/tasks/changes/')
+
+    def test_categories(self):
+        self.assertActionQueries(2, '/api/tasks/categories/')
+
+
+class NestedCategoryCountTests(TaskQueryTestCase):
+    """Task counts of nested categories cost one query whatever is on the page"""
+
+    def add_categorized_tasks(self, count):
+        for i in range(Category.objects.count(), Category.objects.count() + count):
+            category = Category.objects.create(name=f'Extra {i}')
+            Task.objects.create(title=f'Extra {i}', assigned_to=self.user, created_by=self.user, category=category)
+
+    def test_list_queries_constant_in_page_size(self):
+        for path in ('/api/tasks/tasks/', '/api/tasks/tasks/my_tasks/'):
+            with self.subTest(path=path):
+                before = self.count_queries(path)
+                self.add_categorized_tasks(8)
+                self.assertEqual(self.count_queries(path), before)
+
+    def test_counts_only_rendered_categories(self):
+        self.add_categorized_tasks(3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tasks/tasks/', {'category': self.task.category_id})
+        counter_queries = [query['sql'] for query in queries if 'tasks_taskcounter' in query['sql']]
+        self.assertEqual(len(counter_queries), 1)
+        self.assertIn(f'IN ({self.task.category_id})', counter_queries[0])
+        self.assertEqual(
+            {task['category']['task_count'] for task in response.data['results']},
+            {Task.objects.filter(category=self.task.category_id).count()}
+        )
+
+    def test_uncategorized_page_skips_counts(self):
+        Task.objects.update(category=None)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/tasks/tasks/')
+        self.assertFalse([query for query in queries if 'GROUP BY "tasks_taskcounter"' in query['sql']])
+
+
+class KeysetPaginationTests(TaskQueryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Half the tasks share a timestamp, so pages split ties by id
+        now = timezone.now()
+        tasks = list(Task.objects.order_by('pk'))
+        Task.objects.filter(pk__in=[task.pk for task in tasks[:6]]).update(created_at=now)
+        for minutes, task in enumerate(tasks[6:], start=1):
+            Task.objects.filter(pk=task.pk).update(created_at=now - timedelta(minutes=minutes))
+        self.expected = list(Task.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        patcher = mock.patch.object(KeysetPagination, 'page_size', 5)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def walk(self, url, params, link):
+        pages = []
+        data = self.get(url, params)
+        while True:
+            pages.append([task['id'] for task in data['results']])
+            if not data[link]:
+                return pages, data
+            data = self.get(data[link])
+
+    def test_pages_cover_every_task_once(self):
+        pages, last = self.walk('/api/tasks/tasks/', {'pagination': 'keyset'}, 'next')
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertNotIn('count', last)
+
+        # Walking back from the last page returns the same pages
+        back = [pages[-1]]
+        data = last
+        while data['previous']:
+            data = self.get(data['previous'])
+            back.append([task['id'] for task in data['results']])
+        self.assertEqual(back[::-1], pages)
+
+    def test_new_tasks_do_not_shift_later_pages(self):
+        first = self.get('/api/tasks/tasks/', {'pagination': 'keyset'})
+        Task.objects.create(title='Newest', assigned_to=self.user, created_by=self.user)
+        second = self.get(first['next'])
+        self.assertEqual([task['id'] for task in second['results']], self.expected[5:10])
+
+    def test_count_and_my_tasks(self):
+        data = self.get('/api/tasks/tasks/', {'pagination': 'keyset', 'count': 'true'})
+        self.assertEqual(data['count'], 12)
+
+        mine = [pk for pk in self.expected if Task.objects.filter(pk=pk, assigned_to=self.user).exists()]
+        pages, _ = self.walk('/api/tasks/tasks/my_tasks/', {'pagination': 'keyset'}, 'next')
+        self.assertEqual(sum(pages, []), mine)
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-base64!', 'eyJjIjogIm5vcGUiLCAiaSI6IDF9'):
+            response = self.client.get('/api/tasks/tasks/', {'pagination': 'keyset', 'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+
+class MyTasksTests(TaskQueryTestCase):
+
+    def test_renders_task_detail_fields(self):
+        response = self.client.get('/api/tasks/tasks/my_tasks/')
+        results = response.data['results']
+        self.assertEqual(len(results), self.tasks_per_user)
+        self.assertEqual(
+            set(results[0]),
+            set(TaskDetailSerializer.Meta.fields) - {'category_id', 'assigned_to_id', 'comments', 'attachments', 'history'}
+        )
+
+    def test_expand(self):
+        response = self.client.get('/api/tasks/tasks/my_tasks/', {'expand': 'comments'})
+        self.assertEqual([len(task['comments']) for task in response.data['results']], [1] * self.tasks_per_user)
+
+
+class ConditionalGetTests(TaskQueryTestCase):
+    """ETag/Last-Modified validators of task lists and detail"""
+
+    def setUp(self):
+        super().setUp()
+        # Last-Modified has one-second resolution; keep test writes later
+        Task.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        Comment.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        self.detail_path = f'/api/tasks/tasks/{self.task.pk}/'
+
+    def assertNotModified(self, path, response, params=None):
+        revalidated = self.client.get(
+            path, params, HTTP_IF_NONE_MATCH=response['ETag'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(revalidated.status_code, 304)
+
+    def assertModified(self, path, response, params=None):
+        for header, value in [('HTTP_IF_NONE_MATCH', response['ETag']),
+                              ('HTTP_IF_MODIFIED_SINCE', response['Last-Modified'])]:
+            with self.subTest(header=header):
+                self.assertEqual(self.client.get(path, params, **{header: value}).status_code, 200)
+
+    def test_not_modified_skips_serialization(self):
+        for path, serializer_class in [
+            ('/api/tasks/tasks/', TaskListSerializer),
+            ('/api/tasks/tasks/my_tasks/', TaskDetailSerializer),
+            (self.detail_path, TaskDetailSerializer),
+        ]:
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                with mock.patch.object(serializer_class, 'to_representation') as to_representation:
+                    self.assertNotModified(path, response)
+                to_representation.assert_not_called()
+
+    def test_delete_invalidates_list(self):
+        response = self.client.get('/api/tasks/tasks/')
+        Task.objects.exclude(pk=self.task.pk).first().delete()
+        self.assertModified('/api/tasks/tasks/', response)
+
+    def test_category_edit_invalidates_list_and_detail(self):
+        responses = {path: self.client.get(path) for path in ('/api/tasks/tasks/', self.detail_path)}
+        category = self.task.category
+        category.name = 'Engineering'
+        category.save()
+        for path, response in responses.items():
+            with self.subTest(path=path):
+                self.assertModified(path, response)
+                self.assertEqual(self.client.get(self.detail_path).data['category']['name'], 'Engineering')
+
+    def test_user_edit_invalidates_list(self):
+        response = self.client.get('/api/tasks/tasks/')
+        self.other.first_name = 'Robert'
+        self.other.save()
+        self.assertModified('/api/tasks/tasks/', response)
+
+    def test_login_keeps_validators(self):
+        response = self.client.get('/api/tasks/tasks/')
+        self.other.last_login = timezone.now()
+        self.other.save(update_fields=['last_login'])
+        self.assertNotModified('/api/tasks/tasks/', response)
+
+    def test_category_count_change_invalidates_detail(self):
+        response = self.client.get(self.detail_path)
+        Task.objects.create(title='New', assigned_to=self.other, created_by=self.other, category=self.task.category)
+        self.assertModified(self.detail_path, response)
+
+    def test_expand_has_own_etag(self):
+        plain = self.client.get(self.detail_path)
+        expanded = self.client.get(self.detail_path, {'expand': 'comments'})
+        self.assertNotEqual(plain['ETag'], expanded['ETag'])
+        response = self.client.get(self.detail_path, {'expand': 'comments'}, HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_falling_overdue_invalidates(self):
+        Task.objects.filter(pk=self.task.pk).update(due_date=timezone.now() + timedelta(hours=1))
+        responses = {path: self.client.get(path) for path in ('/api/tasks/tasks/', self.detail_path)}
+        self.assertFalse(responses[self.detail_path].data['is_overdue'])
+        for path, response in responses.items():
+            self.assertNotModified(path, response)
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(hours=2)):
+            for path, response in responses.items():
+                with self.subTest(path=path):
+                    self.assertModified(path, response)
+            self.assertTrue(self.client.get(self.detail_path).data['is_overdue'])
+
+    def test_invalid_pk_is_not_found(self):
+        self.assertEqual(self.client.get('/api/tasks/tasks/abc/').status_code, 404)
+
+        request = APIRequestFactory().get('/api/tasks/tasks/abc/')
+        force_authenticate(request, user=self.user)
+        view = AsyncTaskViewSet.as_view({'get': 'retrieve'})
+        self.assertEqual(async_to_sync(view)(request, pk='abc').status_code, 404)
+
+
+class DeltaSyncTests(TaskQueryTestCase):
+    url = '/api/tasks/tasks/changes/'
+
+    def setUp(self):
+        super().setUp()
+        overrides = self.settings(TASK_CHANGES_MARGIN=timedelta(0))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def sync(self, since=None, status_code=200):
+        response = self.client.get(self.url, {'since': since} if since else None)
+        self.assertEqual(response.status_code, status_code, response.content)
+        return response.data
+
+    def sync_all(self, since=None):
+        changed, deleted = [], []
+        while True:
+            data = self.sync(since)
+            changed += [task['id'] for task in data['changed']]
+            deleted += data['deleted']
+            since = data['watermark']
+            if not data['has_more']:
+                return changed, deleted, since
+
+    def test_full_then_incremental_sync(self):
+        data = self.sync()
+        self.assertEqual([task['id'] for task in data['changed']],
+                         list(Task.objects.order_by('updated_at', 'id').values_list('pk', flat=True)))
+        self.assertEqual((data['deleted'], data['has_more']), ([], False))
+
+        edited, removed = Task.objects.order_by('pk')[:2]
+        edited.title = 'Edited'
+        edited.save()
+        removed_pk = removed.pk
+        removed.delete()
+        created = Task.objects.create(title='New', assigned_to=self.user, created_by=self.user)
+
+        data = self.sync(data['watermark'])
+        self.assertEqual([task['id'] for task in data['changed']], [edited.pk, created.pk])
+        self.assertEqual(data['changed'][0]['title'], 'Edited')
+        self.assertEqual(data['deleted'], [removed_pk])
+
+        # Nothing new since
+        data = self.sync(data['watermark'])
+        self.assertEqual((data['changed'], data['deleted']), ([], []))
+
+    def test_pages_return_every_change_once(self):
+        _, _, since = self.sync_all()
+        for task in Task.objects.order_by('pk')[:7]:
+            task.delete()
+        Task.objects.exclude(title__startswith='Task 0').update(updated_at=timezone.now())
+
+        with self.settings(TASK_CHANGES_PAGE_SIZE=2):
+            changed, deleted, _ = self.sync_all(since)
+        touched = Task.objects.exclude(title__startswith='Task 0').values_list('pk', flat=True)
+        self.assertEqual(sorted(changed), sorted(touched))
+        self.assertEqual(len(deleted), 7)
+        self.assertEqual(set(deleted), set(TaskDeletion.objects.values_list('task_id', flat=True)))
+
+    def test_expired_and_invalid_watermarks(self):
+        since = self.sync()['watermark']
+        later = timezone.now() + settings.TASK_DELETION_LOG_RETENTION + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.sync(since, status_code=410)
+        self.sync('not-a-watermark', status_code=400)
+
+    def test_prune_keeps_tombstones_within_retention(self):
+        old, recent = Task.objects.order_by('pk').values_list('pk', flat=True)[:2]
+        Task.objects.filter(pk__in=[old, recent]).delete()
+        TaskDeletion.objects.filter(task_id=old).update(
+            deleted_at=timezone.now() - settings.TASK_DELETION_LOG_RETENTION - timedelta(hours=1)
+        )
+        self.assertEqual(prune_deletion_log(), 1)
+        self.assertEqual(list(TaskDeletion.objects.values_list('task_id', flat=True)), [recent])
+
+
+class TaskEventStreamTests(TaskQueryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.carol = User.objects.create_user('carol', 'carol@example.com', 'pw')
+        self.broadcaster = events.LocalBroadcaster(queue_size=2)
+        patcher = mock.patch.object(events, '_broadcaster', self.broadcaster)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def save(self, task, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            for field, value in fields.items():
+                setattr(task, field, value)
+            task.save()
+
+    @staticmethod
+    def parse(message):
+        lines = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+        return lines['event'], json.loads(lines['data'])
+
+    def test_events_reach_the_tasks_users(self):
+        task = Task.objects.filter(assigned_to=self.other).first()
+
+        async def scenario():
+            streams = {user.pk: self.broadcaster.subscribe(user.pk) for user in (self.user, self.other, self.carol)}
+            await sync_to_async(self.save)(task, title='Renamed')
+            await sync_to_async(self.save)(task, assigned_to=self.carol)
+            received = {}
+            for user_id, subscription in streams.items():
+                stream = events.stream_events(subscription, lifetime=0.05)
+                received[user_id] = [self.parse(chunk) for chunk in [chunk async for chunk in stream][1:]
+                                     if chunk.startswith('event:')]
+            return received
+
+        received = async_to_sync(scenario)()
+        # alice created the task, bob was its assignee until the move to carol
+        self.assertEqual([(event, data['title']) for event, data in received[self.user.pk]],
+                         [('task.updated', 'Renamed'), ('task.updated', 'Renamed')])
+        self.assertEqual(received[self.other.pk], received[self.user.pk])
+        self.assertEqual([(event, data['assigned_to_id']) for event, data in received[self.carol.pk]],
+                         [('task.updated', self.carol.pk)])
+        self.assertEqual(received[self.user.pk][0][1]['id'], task.pk)
+        # Streams unsubscribe when they end
+        self.assertEqual(dict(self.broadcaster.subscribers), {})
+
+    def test_overflow_sends_reset(self):
+        async def scenario():
+            subscription = self.broadcaster.subscribe(self.user.pk)
+            for i in range(3):
+                await sync_to_async(self.save)(self.task, title=f'Edit {i}')
+            stream = events.stream_events(subscription, lifetime=0.05)
+            return [chunk async for chunk in stream]
+
+        chunks = async_to_sync(scenario)()
+        self.assertEqual(chunks[0], f'retry: {events.RECONNECT_DELAY_MS}\n\n')
+        # The queued events are dropped in favour of one reset
+        self.assertEqual([self.parse(chunk)[0] for chunk in chunks if chunk.startswith('event:')], ['reset'])
+
+    def test_idle_stream_sends_keepalives_until_its_lifetime(self):
+        async def scenario():
+            stream = events.stream_events(self.broadcaster.subscribe(self.user.pk), lifetime=0.25)
+            return [chunk async for chunk in stream]
+
+        with self.settings(TASK_EVENTS_HEARTBEAT=0.1):
+            chunks = async_to_sync(scenario)()
+        self.assertEqual(chunks[1:], [': keepalive\n\n'] * (len(chunks) - 1))
+        self.assertIn(len(chunks) - 1, (2, 3))
+
+
+class AsyncViewParityTests(TaskQueryTestCase):
+    """AsyncTaskViewSet answers like TaskViewSet, for its async and its threaded actions"""
+
+    def call(self, view_class, actions, params=None, user=None, **kwargs):
+        method = next(iter(actions))
+        request = getattr(APIRequestFactory(), method)('/api/tasks/tasks/', params, format='json')
+        force_authenticate(request, user=user or self.user)
+        view = view_class.as_view(actions)
+        if view_class is AsyncTaskViewSet:
+            response = async_to_sync(view)(request, **kwargs)
+        else:
+            response = view(request, **kwargs)
+        cache.clear()  # so each variant computes its own stats
+        return response
+
+    def assertSameResponse(self, actions, params=None, **kwargs):
+        sync = self.call(views.TaskViewSet, actions, params, **kwargs)
+        async_ = self.call(AsyncTaskViewSet, actions, params, **kwargs)
+        self.assertEqual(async_.status_code, sync.status_code)
+        self.assertEqual(async_.data, sync.data)
+        self.assertEqual(async_.get('ETag'), sync.get('ETag'))
+        return async_
+
+    def test_async_actions_match(self):
+        response = self.assertSameResponse({'get': 'list'}, {'priority': 'high'})
+        self.assertEqual(
+            [task['id'] for task in response.data['results']],
+            list(Task.objects.filter(priority='high').order_by('-created_at').values_list('pk', flat=True))
+        )
+        self.assertSameResponse({'get': 'list'}, {'pagination': 'keyset', 'count': 'true'})
+        self.assertSameResponse({'get': 'list'}, {'search': 'Task 1'})
+        self.assertSameResponse({'get': 'retrieve'}, {'expand': 'comments'}, pk=self.task.pk)
+        self.assertSameResponse({'get': 'my_tasks'})
+        self.assertSameResponse({'get': 'stats'})
+        self.assertSameResponse({'get': 'stats'}, {'search': 'Task'})
+
+    def test_sync_actions_run_in_a_thread(self):
+        self.assertSameResponse({'get': 'history'}, pk=self.task.pk)
+        self.assertSameResponse({'get': 'comments'}, pk=self.task.pk)
+        response = self.call(
+            AsyncTaskViewSet, {'post': 'create'},
+            {'title': 'From async', 'assigned_to': self.user.pk}
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(Task.objects.filter(title='From async', created_by=self.user).exists())
+
+    def test_current_user_matches(self):
+        request = APIRequestFactory().get('/api/auth/me/')
+        force_authenticate(request, user=self.user)
+        async_response = async_to_sync(CurrentUserView.as_view())(request)
+        request = APIRequestFactory().get('/api/auth/me/')
+        force_authenticate(request, user=self.user)
+        self.assertEqual(async_response.data, current_user(request).data)
+        self.assertEqual(
+            (async_response.data['tasks_assigned'], async_response.data['tasks_created']), (6, 12)
+        )
+
+    def test_errors_match(self):
+        self.assertEqual(self.assertSameResponse({'get': 'retrieve'}, pk=0).status_code, 404)
+
+        request = APIRequestFactory().get('/api/tasks/tasks/')
+        response = async_to_sync(AsyncTaskViewSet.as_view({'get': 'list'}))(request)
+        self.assertEqual(response.status_code, 401)
+
+
+class StatsAggregationTests(TaskQueryTestCase):
+    """Stats from the grouped aggregate and from counters match a count over the tasks"""
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        tasks = list(Task.objects.order_by('pk'))
+        for task in tasks[:3]:
+            Task.objects.filter(pk=task.pk).update(created_at=now - timedelta(days=3, hours=1))
+            task.refresh_from_db()
+            task.status = 'completed'
+            task.save()
+        for task in tasks[3:5]:
+            task.status = 'in_progress'
+            task.due_date = now - timedelta(days=1)
+            task.save()
+        tasks[5].due_date = now - timedelta(hours=1)
+        tasks[5].save()
+        tasks[6].due_date = now + timedelta(days=1)
+        tasks[6].save()
+        Task.objects.create(title='Loose end', assigned_to=self.other, created_by=self.user, priority='urgent')
+
+    def expected(self, tasks):
+        now = timezone.now()
+        tasks = list(tasks.select_related('category'))
+        completed = [task for task in tasks if task.status == 'completed']
+        by_priority, by_category = {}, {}
+        for task in tasks:
+            by_priority[task.priority] = by_priority.get(task.priority, 0) + 1
+            name = task.category.name if task.category else 'Uncategorized'
+            by_category[name] = by_category.get(name, 0) + 1
+        completion = sum((task.completed_at - task.created_at for task in completed), timedelta(0))
+        return {
+            'total_tasks': len(tasks),
+            'pending_tasks': sum(task.status == 'pending' for task in tasks),
+            'in_progress_tasks': sum(task.status == 'in_progress' for task in tasks),
+            'completed_tasks': len(completed),
+            'overdue_tasks': sum(
+                bool(task.due_date and task.due_date < now and task.status in stats.ACTIVE_STATUSES)
+                for task in tasks
+            ),
+            'tasks_by_priority': dict(sorted(by_priority.items())),
+            'tasks_by_category': dict(sorted(by_category.items())),
+            'completion_rate': len(completed) / len(tasks) * 100 if tasks else 0,
+            'average_completion_time': (completion / len(completed)).days if completed else 0,
+        }
+
+    def assertStats(self, params, tasks):
+        response = self.client.get('/api/tasks/tasks/stats/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        figures = {name: response.data[name] for name in self.expected(Task.objects.none())}
+        self.assertEqual(figures, self.expected(tasks))
+        return figures
+
+    def test_counter_stats_match_tasks(self):
+        figures = self.assertStats({}, Task.objects.all())
+        self.assertEqual(
+            (figures['completed_tasks'], figures['in_progress_tasks'], figures['overdue_tasks']), (3, 2, 3)
+        )
+        self.assertEqual(figures['average_completion_time'], 3)
+        self.assertEqual(figures['tasks_by_category']['Uncategorized'], 1)
+        self.assertStats({'assigned_to': self.user.pk, 'priority': 'low'},
+                         Task.objects.filter(assigned_to=self.user, priority='low'))
+
+    def test_grouped_aggregate_matches_tasks(self):
+        # search and overdue need the tasks table, so they skip the counters
+        self.assertStats({'search': 'Task'}, Task.objects.filter(title__icontains='Task'))
+        self.assertStats({'overdue': 'true'}, Task.objects.filter(
+            due_date__lt=timezone.now(), status__in=stats.ACTIVE_STATUSES
+        ))
+
+    def test_empty_selection(self):
+        self.assertStats({'status': 'cancelled'}, Task.objects.none())
+        self.assertStats({'search': 'nothing like this'}, Task.objects.none())
+
+
+class StatsSnapshotTests(TaskQueryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Changed well before the first refresh, and without the margin for
+        # late commits, so each refresh only picks up what the test changed
+        Task.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        overrides = self.settings(TASK_CHANGES_MARGIN=timedelta(0))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def stats(self, params=None, **headers):
+        response = self.client.get('/api/tasks/tasks/stats/', params, **headers)
+        self.assertIn(response.status_code, (200, 304), response.content)
+        return response
+
+    def assertSnapshotMatchesLive(self, assigned_to=None):
+        params = {'assigned_to': assigned_to} if assigned_to else {}
+        snapshot = self.stats({**params, 'fresh': 'false'})
+        self.assertIn('X-Snapshot-Time', snapshot)
+        cache.clear()
+        self.assertEqual(snapshot.data, self.stats(params).data)
+        return snapshot
+
+    def test_serves_live_stats_before_first_refresh(self):
+        response = self.stats({'fresh': 'false'})
+        self.assertNotIn('X-Snapshot-Time', response)
+        self.assertEqual(response.data['total_tasks'], 12)
+
+    def test_snapshot_matches_live_stats(self):
+        Task.objects.filter(pk=self.task.pk).update(created_at=timezone.now() - timedelta(days=2))
+        self.task.refresh_from_db()
+        self.task.status = 'completed'
+        self.task.save()
+        self.assertEqual(snapshots.refresh_stats_snapshots(full=True), 2)
+
+        self.assertSnapshotMatchesLive()
+        self.assertSnapshotMatchesLive(self.user.pk)
+        idle = User.objects.create_user('carol', 'carol@example.com', 'pw')
+        self.assertEqual(self.assertSnapshotMatchesLive(idle.pk).data['total_tasks'], 0)
+
+        # Other filters need the live figures
+        self.assertNotIn('X-Snapshot-Time', self.stats({'fresh': 'false', 'priority': 'high'}))
+
+    def test_incremental_refresh_recomputes_changed_assignees(self):
+        snapshots.refresh_stats_snapshots(full=True)
+        bob = self.stats({'assigned_to': self.other.pk, 'fresh': 'false'})
+
+        self.task.status = 'in_progress'
+        self.task.save()
+        self.assertEqual(snapshots.refresh_stats_snapshots(), 1)
+        alice = self.assertSnapshotMatchesLive(self.user.pk)
+        self.assertEqual(alice.data['in_progress_tasks'], 1)
+        self.assertSnapshotMatchesLive()
+        # Bob's figures did not change, and neither do their validators
+        unchanged = self.stats({'assigned_to': self.other.pk, 'fresh': 'false'}, HTTP_IF_NONE_MATCH=bob['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+
+        # A deleted task leaves no row for its assignee to be found by
+        Task.objects.filter(assigned_to=self.other).first().delete()
+        self.assertEqual(snapshots.refresh_stats_snapshots(), 1)
+        self.assertEqual(self.assertSnapshotMatchesLive(self.other.pk).data['total_tasks'], 5)
+        self.assertEqual(self.assertSnapshotMatchesLive().data['total_tasks'], 11)
+
+
+class StatsCacheTests(TaskQueryTestCase):
+
+    def by_category(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get('/api/tasks/tasks/stats/')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data['tasks_by_category']
+
+    def test_category_rename_and_delete_refresh_cached_stats(self):
+        self.assertEqual(self.by_category(), {'Design': 6, 'Development': 6})
+
+        category = Category.objects.get(name='Design')
+        with self.captureOnCommitCallbacks(execute=True):
+            category.name = 'Visual design'
+            category.save()
+        self.assertEqual(self.by_category(), {'Development': 6, 'Visual design': 6})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+        self.assertEqual(self.by_category(), {'Development': 6, 'Uncategorized': 6})
+
+
+class BulkTaskTests(TaskQueryTestCase):
+    url = '/api/tasks/tasks/bulk/'
+
+    def assertCountersMatchTasks(self):
+        groups = Task.objects.values('assigned_to', 'category', 'status', 'priority').annotate(total=Count('id'))
+        expected = {
+            (group['assigned_to'], group['category'], group['status'], group['priority']): group['total']
+            for group in groups
+        }
+        counters = {
+            (counter.assigned_to_id, counter.category_id, counter.status, counter.priority): counter.count
+            for counter in TaskCounter.objects.exclude(count=0)
+        }
+        self.assertEqual(counters, expected)
+
+    def new_tasks(self, count):
+        category = Category.objects.first()
+        return [
+            {'title': f'Bulk {i}', 'assigned_to': self.other.pk, 'category': category.pk, 'priority': 'urgent'}
+            for i in range(count)
+        ]
+
+    def test_create(self):
+        response = self.client.post(self.url, self.new_tasks(3), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        ids = [task['id'] for task in response.data]
+        self.assertEqual(
+            list(Task.objects.filter(pk__in=ids).order_by('pk').values_list('title', 'created_by')),
+            [(f'Bulk {i}', self.user.pk) for i in range(3)]
+        )
+        self.assertCountersMatchTasks()
+
+        # The write is a fixed number of queries however many tasks it holds
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(self.url, self.new_tasks(2), format='json')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(self.url, self.new_tasks(20), format='json')
+        self.assertEqual(len(many), len(few))
+
+    def test_update(self):
+        tasks = list(Task.objects.filter(assigned_to=self.user).order_by('pk')[:2])
+        before = tasks[0].updated_at
+        response = self.client.patch(self.url, [
+            {'id': tasks[0].pk, 'status': 'completed'},
+            {'id': tasks[1].pk, 'title': 'Renamed', 'assigned_to': self.other.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([task['id'] for task in response.data], [tasks[0].pk, tasks[1].pk])
+
+        tasks[0].refresh_from_db()
+        tasks[1].refresh_from_db()
+        self.assertEqual(tasks[0].status, 'completed')
+        self.assertIsNotNone(tasks[0].completed_at)
+        self.assertGreater(tasks[0].updated_at, before)
+        self.assertEqual((tasks[1].title, tasks[1].assigned_to_id), ('Renamed', self.other.pk))
+        self.assertTrue(TaskHistory.objects.filter(task=tasks[0], field_name='status', new_value='completed').exists())
+        self.assertCountersMatchTasks()
+
+    def test_invalid_item_writes_nothing(self):
+        task = self.task
+        response = self.client.patch(self.url, [
+            {'id': task.pk, 'status': 'completed'},
+            {'id': task.pk, 'status': 'pending'},
+            {'id': 0},
+            {'status': 'pending'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [
+            {}, {'id': ['Duplicate task id.']}, {'id': ['Task not found.']}, {'id': ['A valid task id is required.']},
+        ])
+
+        response = self.client.post(self.url, [*self.new_tasks(1), {'title': 'No assignee', 'priority': 'nope'}],
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('priority', response.data[1])
+
+        self.assertEqual(Task.objects.get(pk=task.pk).status, 'pending')
+        self.assertFalse(Task.objects.filter(title='Bulk 0').exists())
+        self.assertCountersMatchTasks()
+
+    def test_delete(self):
+        ids = list(Task.objects.filter(assigned_to=self.other).values_list('pk', flat=True)[:3])
+        response = self.client.delete(self.url, ids, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Task.objects.filter(pk__in=ids).exists())
+        self.assertEqual(set(TaskDeletion.objects.values_list('task_id', flat=True)), set(ids))
+        self.assertCountersMatchTasks()
+
+    def test_rejects_empty_and_oversized_requests(self):
+        for body in ([], {'title': 'Not a list'}):
+            self.assertEqual(self.client.post(self.url, body, format='json').status_code, 400)
+        with self.settings(TASK_BULK_MAX_ITEMS=2):
+            response = self.client.post(self.url, self.new_tasks(3), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Task.objects.count(), 12)
+
+
+class TaskSubResourceTests(TaskQueryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for i in range(7):
+            comment = Comment.objects.create(task=self.task, author=self.user, content=f'Note {i}')
+            Comment.objects.filter(pk=comment.pk).update(created_at=now + timedelta(minutes=i))
+        self.comments = list(
+            Comment.objects.filter(task=self.task).order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_detail_expands_only_requested_collections(self):
+        url = f'/api/tasks/tasks/{self.task.pk}/'
+        data = self.get(url)
+        self.assertFalse({'comments', 'attachments', 'history'} & set(data))
+
+        with self.settings(TASK_DETAIL_EXPAND_LIMIT=3):
+            data = self.get(url, {'expand': 'comments,history,bogus'})
+        self.assertEqual({'comments', 'history'} & set(data), {'comments', 'history'})
+        self.assertNotIn('attachments', data)
+        self.assertEqual([comment['id'] for comment in data['comments']], self.comments[:3])
+
+    def test_my_tasks_expands_each_tasks_latest_items(self):
+        with self.settings(TASK_DETAIL_EXPAND_LIMIT=2):
+            data = self.get('/api/tasks/tasks/my_tasks/', {'expand': 'comments'})
+        for task in data['results']:
+            expected = list(
+                Comment.objects.filter(task=task['id']).order_by('-created_at', '-id').values_list('pk', flat=True)[:2]
+            )
+            self.assertEqual([comment['id'] for comment in task['comments']], expected)
+
+    def test_comments_are_cursor_paginated(self):
+        url = f'/api/tasks/tasks/{self.task.pk}/comments/'
+        seen = []
+        with mock.patch.object(CommentPagination, 'page_size', 3):
+            data = self.get(url)
+            while True:
+                seen += [comment['id'] for comment in data['results']]
+                if not data['next']:
+                    break
+                data = self.get(data['next'])
+        self.assertEqual(seen, self.comments)
+
+    def test_history_lists_the_tasks_changes(self):
+        other = Task.objects.exclude(pk=self.task.pk).first()
+        self.client.patch(f'/api/tasks/tasks/{self.task.pk}/', {'status': 'in_progress'}, format='json')
+        self.client.patch(f'/api/tasks/tasks/{other.pk}/', {'priority': 'urgent'}, format='json')
+        data = self.get(f'/api/tasks/tasks/{self.task.pk}/history/')
+        changes = [(item['field_name'], item['new_value']) for item in data['results']]
+        self.assertIn(('status', 'in_progress'), changes)
+        self.assertNotIn(('priority', 'urgent'), changes)
+
+    def test_missing_task(self):
+        self.assertEqual(self.client.get('/api/tasks/tasks/0/comments/').status_code, 404)
+
+
+class DeferredHistoryTests(TaskQueryTestCase):
+
+    def test_redelivered_batch_is_written_once(self):
+        batch_id = uuid.uuid4().hex
+        changes = [(self.task.pk, 'status', 'pending', 'completed'), (self.task.pk, 'priority', 'low', 'high')]
+        changed_at = timezone.now() - timedelta(minutes=5)
+        self.assertEqual(write_task_history(batch_id, self.user.pk, changes, changed_at.isoformat()), 2)
+        cache.clear()  # as on another worker
+        self.assertEqual(write_task_history(batch_id, self.user.pk, changes, changed_at.isoformat()), 0)
+
+        history = TaskHistory.objects.filter(task=self.task)
+        self.assertEqual(history.count(), 2)
+        self.assertEqual(set(history.values_list('changed_at', flat=True)), {changed_at})
+
+
+class UploadSessionTests(TaskQueryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        overrides = self.settings(TASK_UPLOAD_DIR=temp_dir.name, MEDIA_ROOT=temp_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def start_upload(self, size):
+        response = self.client.post(
+            f'/api/tasks/tasks/{self.task.pk}/uploads/', {'filename': 'notes.txt', 'size': size}
+        )
+        return AttachmentUpload.objects.get(pk=response.data['id'])
+
+    def send_chunk(self, upload, data, offset):
+        return self.client.patch(
+            f'/api/tasks/tasks/{self.task.pk}/uploads/{upload.pk}/', data,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_losing_patch_leaves_part_file_alone(self):
+        upload = self.start_upload(11)
+        self.assertEqual(self.send_chunk(upload, b'hello', 0)['Upload-Offset'], '5')
+
+        # A PATCH that read the session before the first one advanced it
+        lookup = views.get_object_or_404
+        def stale_lookup(*args, **kwargs):
+            session = lookup(*args, **kwargs)
+            session.offset = 0
+            return session
+        with mock.patch.object(views, 'get_object_or_404', stale_lookup):
+            response = self.send_chunk(upload, b'XXXXX', 0)
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '5'))
+        with open(upload.temp_path, 'rb') as part:
+            self.assertEqual(part.read(5), b'hello')
+
+        self.assertEqual(self.send_chunk(upload, b' world', 5).status_code, 201)
+        self.assertFalse(os.path.exists(upload.temp_path))
+        attachment = self.task.attachments.get()
+        with attachment.file.open('rb') as file:
+            self.assertEqual(file.read(), b'hello world')
+
+    def test_leased_session_refuses_other_writers(self):
+        upload = self.start_upload(5)
+        AttachmentUpload.objects.filter(pk=upload.pk).update(writer=uuid.uuid4(), updated_at=timezone.now())
+        response = self.send_chunk(upload, b'XXXXX', 0)
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '0'))
+        with open(upload.temp_path, 'rb') as part:
+            self.assertEqual(part.read(), b'')
+
+        # The writer died; its lease lapses
+        AttachmentUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.send_chunk(upload, b'hello', 0).status_code, 201)
+
+
+class ContentAddressedAttachmentTests(TaskQueryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        overrides = self.settings(TASK_UPLOAD_DIR=temp_dir.name, MEDIA_ROOT=temp_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.storage = attachments.get_blob_storage()
+        if self.storage is None:
+            self.skipTest('Attachment storage is not content-addressed')
+
+    def attach(self, task, content, filename='notes.txt'):
+        response = self.client.post(
+            f'/api/tasks/tasks/{task.pk}/add_attachment/', {'file': SimpleUploadedFile(filename, content)}
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return Attachment.objects.get(pk=response.data['id'])
+
+    def age(self, name, hours=2):
+        # Past the GC grace period, for both the Blob row and the file
+        past = timezone.now() - timedelta(hours=hours)
+        Blob.objects.filter(name=name).update(updated_at=past)
+        os.utime(self.storage.path(name), (past.timestamp(), past.timestamp()))
+
+    def test_identical_content_is_stored_once(self):
+        other_task = Task.objects.exclude(pk=self.task.pk).first()
+        first = self.attach(self.task, b'same bytes', 'a.txt')
+        second = self.attach(other_task, b'same bytes', 'b.txt')
+        different = self.attach(self.task, b'other bytes')
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertNotEqual(first.file.name, different.file.name)
+        self.assertEqual(first.sha256, hashlib.sha256(b'same bytes').hexdigest())
+        self.assertTrue(first.file.name.endswith(first.sha256))
+        self.assertEqual((first.filename, second.filename), ('a.txt', 'b.txt'))
+        self.assertEqual(dict(Blob.objects.values_list('name', 'ref_count')), {
+            first.file.name: 2, different.file.name: 1,
+        })
+        self.assertEqual(sorted(attachments.walk_blobs(self.storage)), sorted([first.file.name, different.file.name]))
+
+    def test_garbage_collection_keeps_referenced_blobs(self):
+        kept = self.attach(self.task, b'kept')
+        dropped = self.attach(self.task, b'dropped')
+        recent = self.attach(self.task, b'recent')
+        orphan = self.storage.save('ignored', ContentFile(b'failed after storing'))
+        dropped.delete()
+        recent.delete()
+        self.assertEqual(Blob.objects.get(name=dropped.file.name).ref_count, 0)
+        # The grace period runs from when the last reference went
+        for name in (kept.file.name, dropped.file.name, orphan):
+            self.age(name)
+        self.assertEqual(attachments.collect_garbage(timedelta(hours=1), dry_run=True)[0], 2)
+        self.assertTrue(self.storage.exists(dropped.file.name))
+
+        self.assertEqual(
+            attachments.collect_garbage(timedelta(hours=1)),
+            (2, len(b'dropped') + len(b'failed after storing'))
+        )
+        self.assertFalse(self.storage.exists(dropped.file.name) or self.storage.exists(orphan))
+        self.assertFalse(Blob.objects.filter(name=dropped.file.name).exists())
+        # Still referenced, or unreferenced for less than the grace period
+        self.assertTrue(self.storage.exists(kept.file.name) and self.storage.exists(recent.file.name))
+        with kept.file.open('rb') as file:
+            self.assertEqual(file.read(), b'kept')
+
+
+class AfterCommitFailureTests(TaskQueryTestCase):
+
+    def test_broker_outage_does_not_fail_the_write(self):
+        outage = ConnectionError('Error 111 connecting to redis:6379')
+        with mock.patch.object(events, 'get_broadcaster') as get_broadcaster, \
+                mock.patch.object(stats_cache, 'get_generation', side_effect=outage), \
+                self.assertLogs('django.test', 'ERROR') as logs, \
+                self.captureOnCommitCallbacks(execute=True):
+            get_broadcaster.return_value.publish.side_effect = outage
+            response = self.client.patch(f'/api/tasks/tasks/{self.task.pk}/', {'status': 'completed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(Task.objects.get(pk=self.task.pk).status, 'completed')
+
+
+class ExportTests(TaskQueryTestCase):
+    url = '/api/tasks/tasks/export/'
+    fields = ['id', 'title', 'status', 'priority', 'category', 'assigned_to', 'created_by', 'due_date']
+
+    def setUp(self):
+        super().setUp()
+        self.task.title = 'Quotes "and", commas\nand lines'
+        self.task.due_date = timezone.now() + timedelta(days=1)
+        self.task.save()
+
+    def export(self, params=None, **headers):
+        response = self.client.get(self.url, params, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        if response.is_async:
+            return response, async_to_sync(self.collect)(response.streaming_content)
+        return response, b''.join(response.streaming_content)
+
+    @staticmethod
+    async def collect(stream):
+        return b''.join([chunk async for chunk in stream])
+
+    def expected(self, tasks):
+        rows = []
+        for task in tasks.order_by('pk').select_related('category', 'assigned_to', 'created_by'):
+            rows.append({
+                'id': task.pk, 'title': task.title, 'status': task.status, 'priority': task.priority,
+                'category': task.category.name if task.category else None,
+                'assigned_to': task.assigned_to.username, 'created_by': task.created_by.username,
+                'due_date': DjangoJSONEncoder().default(task.due_date) if task.due_date else None,
+            })
+        return rows
+
+    def test_csv_matches_filtered_tasks(self):
+        response, body = self.export({'assigned_to': self.user.pk})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="tasks-', response['Content-Disposition'])
+
+        reader = csv.DictReader(StringIO(body.decode()))
+        self.assertEqual(reader.fieldnames, [column for column, _ in export.EXPORT_COLUMNS])
+        rows = [{name: row[name] or None for name in self.fields} for row in reader]
+        for row in rows:
+            row['id'] = int(row['id'])
+        self.assertEqual(rows, self.expected(Task.objects.filter(assigned_to=self.user)))
+
+    def test_ndjson_by_format_or_accept_header(self):
+        expected = self.expected(Task.objects.filter(priority='high'))
+        for params, headers in (
+            ({'priority': 'high', 'format': 'ndjson'}, {}),
+            ({'priority': 'high'}, {'HTTP_ACCEPT': 'application/x-ndjson'}),
+        ):
+            with self.subTest(params=params, headers=headers):
+                response, body = self.export(params, **headers)
+                self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+                rows = [json.loads(line) for line in body.decode().splitlines()]
+                self.assertEqual([{name: row[name] for name in self.fields} for row in rows], expected)
+
+    def test_gzip_stream_decompresses_to_plain_export(self):
+        _, plain = self.export({'format': 'ndjson'})
+        with mock.patch.object(export, 'EXPORT_CHUNK_BYTES', 200):
+            response, compressed = self.export({'format': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_async_stream_matches(self):
+        with mock.patch.object(export, 'EXPORT_CHUNK_BYTES', 200):
+            for format, compress in (('csv', False), ('ndjson', True)):
+                with self.subTest(format=format, compress=compress):
+                    sync = b''.join(export.stream_export(Task.objects.all(), format, compress))
+                    async_ = async_to_sync(self.collect)(export.astream_export(Task.objects.all(), format, compress))
+                    self.assertEqual(async_, sync)
+
+
+class SearchTests(TaskQueryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = get_search_backend()
+        if not isinstance(self.backend, SQLiteFTSSearch) or not self.backend.is_installed():
+            self.skipTest('SQLite FTS5 index not installed')
+        self.strong = Task.objects.create(
+            title='Fix login redirect', description='Fix the login loop, then fix logout',
+            assigned_to=self.user, created_by=self.user,
+        )
+        self.weak = Task.objects.create(
+            title='Dashboard layout', description='Fix padding on small screens',
+            assigned_to=self.user, created_by=self.user,
+        )
+
+    def search(self, search):
+        response = self.client.get('/api/tasks/tasks/', {'search': search})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [task['id'] for task in response.data['results']]
+
+    def indexed_ids(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {SEARCH_TABLE}')
+            return {row[0] for row in cursor}
+
+    def test_matches_every_term_as_prefix(self):
+        self.assertEqual(self.search('logi redir'), [self.strong.pk])
+        self.assertEqual(self.search('nothing matches this'), [])
+
+    def test_ranks_stronger_matches_first(self):
+        self.assertEqual(self.search('fix'), [self.strong.pk, self.weak.pk])
+
+    def test_falls_back_to_icontains_without_index(self):
+        with mock.patch.object(SQLiteFTSSearch, 'is_installed', return_value=False):
+            # Substring matches the FTS index would not find as a prefix
+            self.assertEqual(self.search('ashboar'), [self.weak.pk])
+
+    def test_index_follows_save_and_delete(self):
+        self.weak.title = 'Dashboard spacing regression'
+        self.weak.save()
+        self.assertEqual(self.search('regression'), [self.weak.pk])
+
+        pk = self.weak.pk
+        self.weak.delete()
+        self.assertNotIn(pk, self.indexed_ids())
+        self.assertEqual(self.indexed_ids(), set(Task.objects.values_list('pk', flat=True)))
+        self.assertEqual(self.search('fix'), [self.strong.pk])
+
+
+class CounterCompletionStatsTests(TaskQueryTestCase):
+    """Completion percentiles of counter stats come from the counters' sketches"""
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for hours, task in enumerate(Task.objects.order_by('pk')[:8], start=1):
+            Task.objects.filter(pk=task.pk).update(created_at=now - timedelta(hours=hours * hours))
+            task.refresh_from_db()
+            task.status = 'completed'
+            task.save()
+
+    def assertStatsMatchTasks(self, params=None, tasks=None):
+        with mock.patch.object(stats, 'completion_summary') as completion_summary:
+            response = self.client.get('/api/tasks/tasks/stats/', params)
+        completion_summary.assert_not_called()
+        expected = stats.completion_summary(tasks if tasks is not None else Task.objects.all())
+        self.assertEqual(response.data['completion_hours'], expected)
+
+    def test_matches_completed_tasks(self):
+        self.assertStatsMatchTasks()
+        self.assertStatsMatchTasks({'assigned_to': self.user.pk}, Task.objects.filter(assigned_to=self.user))
+        self.assertStatsMatchTasks({'priority': 'high'}, Task.objects.filter(priority='high'))
+
+    def test_follows_reopened_and_deleted_tasks(self):
+        completed = Task.objects.filter(status='completed').order_by('pk')
+        reopened = completed[0]
+        reopened.status = 'pending'
+        reopened.save()
+        completed[1].delete()
+        cache.clear()
+        self.assertStatsMatchTasks()
+
+        sketches = dict(TaskCounter.objects.values_list('pk', 'completion_sketch'))
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(
+            sorted(filter(None, sketches.values()), key=str),
+            sorted(filter(None, TaskCounter.objects.values_list('completion_sketch', flat=True)), key=str)
+        )
+
+
+class TrendRollupTests(TaskQueryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.yesterday = timezone.now() - timedelta(days=1)
+        self.development = Category.objects.get(name='Development')
+        uncategorized = [
+            Task.objects.create(title=f'Loose {i}', assigned_to=self.user, created_by=self.user)
+            for i in range(3)
+        ]
+        Task.objects.filter(pk__in=[task.pk for task in uncategorized]).update(created_at=self.yesterday)
+        Task.objects.filter(assigned_to=self.user, category=self.development).update(created_at=self.yesterday)
+
+    def rollup(self, **filters):
+        return TaskTrendRollup.objects.filter(
+            day=timezone.localdate(self.yesterday), assigned_to=self.user, **filters
+        )
+
+    def test_refresh_keeps_one_uncategorized_row_per_day(self):
+        refresh_trend_rollup(full=True)
+        refresh_trend_rollup(full=True)
+        Task.objects.filter(title='Loose 0').update(updated_at=timezone.now())
+        refresh_trend_rollup()
+        self.assertEqual(list(self.rollup(category=None).values_list('created', flat=True)), [3])
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TaskTrendRollup.objects.create(day=timezone.localdate(self.yesterday), assigned_to=self.user)
+
+    def test_deleted_category_folds_into_uncategorized_row(self):
+        refresh_trend_rollup(full=True)
+        self.assertEqual(list(self.rollup(category=self.development).values_list('created', flat=True)), [3])
+
+        self.development.delete()
+        self.assertEqual(list(self.rollup().values_list('category', 'created')), [(None, 6)])
+
+
+class BulkSeedTests(TestCase):
+
+    def seed(self, tasks, **options):
+        call_command('seed_data', mode='refresh', bulk=True, users=3, categories=2, tasks=tasks, stdout=StringIO(), **options)
+
+    def test_refresh_clears_without_per_row_signals(self):
+        self.seed(40, seed=1)
+        with mock.patch.object(signals, 'publish_task_events') as publish:
+            self.seed(30, seed=2)
+        publish.assert_not_called()
+
+        self.assertEqual(Task.objects.count(), 30)
+        self.assertEqual(User.objects.count(), 3)
+        self.assertFalse(TaskDeletion.objects.exists())
+        self.assertEqual(TaskCounter.objects.aggregate(total=Sum('count'))['total'], 30)
+        if isinstance(get_search_backend(), SQLiteFTSSearch) and get_search_backend().is_installed():
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT rowid FROM {SEARCH_TABLE}')
+                self.assertEqual({row[0] for row in cursor}, set(Task.objects.values_list('pk', flat=True)))
+
+    def test_clear(self):
+        self.seed(20)
+        call_command('seed_data', mode='clear', bulk=True, stdout=StringIO())
+        self.assertFalse(Task.objects.exists() or Comment.objects.exists() or Category.objects.exists())
+        self.assertFalse(TaskCounter.objects.exists() or TaskDeletion.objects.exists())
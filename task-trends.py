@@ -0,0 +1,274 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ParseError
+
+from .cache import get_stats_cache
+from .models import Task, TaskTrendRefresh, TaskTrendRollup
+from .quantiles import QuantileSketch
+from .stats import ACTIVE_STATUSES, COMPLETION_TIME, sketch_percentiles, summarize_completion
+
+
+TREND_INTERVALS = ['day', 'week']
+
+# Days recomputed per round of rollup queries
+REFRESH_BATCH_DAYS = 31
+
+# Held while a refresh runs, so overlapping runs don't both write
+REFRESH_LOCK_KEY = 'task_trends:rollup_lock'
+REFRESH_LOCK_TIMEOUT = 30 * 60
+
+
+def day_start(day):
+    """Aware start of a calendar day in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_ranges(days):
+    """Sorted days as contiguous (first, last) ranges"""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+def batch_ranges(ranges, size=REFRESH_BATCH_DAYS):
+    """Split (first, last) ranges into lists of ranges covering at most size days each"""
+    batch, days = [], 0
+    for first, last in ranges:
+        while first <= last:
+            end = min(last, first + timedelta(days=size - days - 1))
+            batch.append((first, end))
+            days += (end - first).days + 1
+            first = end + timedelta(days=1)
+            if days == size:
+                yield batch
+                batch, days = [], 0
+    if batch:
+        yield batch
+
+
+def in_days(field, ranges):
+    """Q matching datetimes of field within any of the (first, last) day ranges"""
+    q = Q(pk__in=[])
+    for first, last in ranges:
+        q |= Q(**{f'{field}__gte': day_start(first), f'{field}__lt': day_start(last + timedelta(days=1))})
+    return q
+
+
+def rollup_groups(tasks, ranges, now):
+    """Unsaved TaskTrendRollup rows of tasks for the days in ranges.
+
+    Counts are TruncDate group-bys over range scans of created_at,
+    completed_at and due_date; completion sketches take one pass over the
+    completed tasks' durations.
+    """
+    rows = {}
+
+    def row(group):
+        key = (group['day'], group['assigned_to'], group['category'])
+        if key not in rows:
+            rows[key] = TaskTrendRollup(day=key[0], assigned_to_id=key[1], category_id=key[2])
+        return rows[key]
+
+    tasks = tasks.order_by()
+    keys = ('day', 'assigned_to', 'category')
+
+    created = tasks.filter(in_days('created_at', ranges)).annotate(day=TruncDate('created_at'))
+    for group in created.values(*keys).annotate(total=Count('id')):
+        row(group).created = group['total']
+
+    completed = (
+        tasks.filter(in_days('completed_at', ranges), status='completed')
+        .annotate(day=TruncDate('completed_at'))
+    )
+    for group in completed.values(*keys).annotate(total=Count('id'), time=Sum(COMPLETION_TIME)):
+        group_row = row(group)
+        group_row.completed = group['total']
+        group_row.completion_time = group['time']
+    sketches = {}
+    durations = completed.annotate(duration=COMPLETION_TIME).values_list(*keys, 'duration')
+    for day, assigned_to, category, duration in durations.iterator():
+        sketch = sketches.setdefault((day, assigned_to, category), QuantileSketch())
+        sketch.add(duration.total_seconds())
+    for key, sketch in sketches.items():
+        rows[key].completion_sketch = sketch.to_dict()
+
+    # Due that day and, by now, either still open or completed late;
+    # cancelled tasks have no cancellation time to compare
+    overdue = (
+        tasks.filter(in_days('due_date', ranges), due_date__lt=now)
+        .filter(Q(status__in=ACTIVE_STATUSES) | Q(status='completed', completed_at__gt=F('due_date')))
+        .annotate(day=TruncDate('due_date'))
+    )
+    for group in overdue.values(*keys).annotate(total=Count('id')):
+        row(group).overdue = group['total']
+
+    return rows
+
+
+def changed_days(since, before):
+    """Days before `before` whose rollup may be out of date since a refresh at `since`.
+
+    These are the creation, completion and due days of tasks written
+    since then (less TASK_CHANGES_MARGIN, for transactions that commit
+    late). Days a task moved away from, or a deleted task was counted on,
+    aren't known here; the periodic full rebuild corrects those.
+    """
+    days = set()
+    changed = Task.objects.filter(updated_at__gte=since - settings.TASK_CHANGES_MARGIN)
+    for values in changed.values_list('created_at', 'completed_at', 'due_date').iterator():
+        days.update(timezone.localdate(value) for value in values if value is not None)
+    return {day for day in days if day < before}
+
+
+def refresh_trend_rollup(full=False, now=None):
+    """Bring TaskTrendRollup up to date for every day before today.
+
+    Recomputes the days closed since the last refresh and the days
+    changed tasks count on; full=True (or the first run) rebuilds every
+    day. Returns the number of days recomputed, or None if another
+    refresh is running.
+    """
+    cache = get_stats_cache()
+    if not cache.add(REFRESH_LOCK_KEY, 1, timeout=REFRESH_LOCK_TIMEOUT):
+        return None
+    try:
+        now = now or timezone.now()
+        today = timezone.localdate(now)
+        state = TaskTrendRefresh.objects.first()
+        if full or state is None:
+            first = Task.objects.aggregate(
+                created=Min('created_at'), completed=Min('completed_at'), due=Min('due_date')
+            )
+            first = [timezone.localdate(value) for value in first.values() if value is not None]
+            ranges = [(min(first), today - timedelta(days=1))] if first and min(first) < today else []
+        else:
+            days = changed_days(state.refreshed_at, today)
+            day = state.complete_before
+            while day < today:
+                days.add(day)
+                day += timedelta(days=1)
+            ranges = day_ranges(days)
+
+        with transaction.atomic():
+            if full or state is None:
+                TaskTrendRollup.objects.all().delete()
+            for batch in batch_ranges(ranges):
+                rows = rollup_groups(Task.objects.all(), batch, now)
+                stale = Q(pk__in=[])
+                for first, last in batch:
+                    stale |= Q(day__range=(first, last))
+                TaskTrendRollup.objects.filter(stale).delete()
+                TaskTrendRollup.objects.bulk_create(rows.values(), batch_size=1000)
+            TaskTrendRefresh.objects.update_or_create(pk=1, defaults={
+                'refreshed_at': now,
+                'complete_before': today,
+            })
+        return sum((last - first).days + 1 for first, last in ranges)
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+
+
+def parse_trend_params(query_params, today=None):
+    """(start, end, interval, assigned_to, category) of a trends request"""
+    interval = query_params.get('interval', 'day')
+    if interval not in TREND_INTERVALS:
+        raise ParseError(f"interval must be one of: {', '.join(TREND_INTERVALS)}")
+
+    dates = {}
+    for name in ('start', 'end'):
+        value = query_params.get(name)
+        try:
+            dates[name] = parse_date(value) if value else None
+        except ValueError:
+            dates[name] = None
+        if value and dates[name] is None:
+            raise ParseError(f'{name} must be a date (YYYY-MM-DD)')
+    end = dates['end'] or today or timezone.localdate()
+    start = dates['start'] or end - timedelta(days=settings.TASK_TRENDS_DEFAULT_DAYS - 1)
+    if start > end:
+        raise ParseError('start must not be after end')
+    step = 1 if interval == 'day' else 7
+    if ((end - start).days + 1) / step > settings.TASK_TRENDS_MAX_BUCKETS:
+        raise ParseError(f'At most {settings.TASK_TRENDS_MAX_BUCKETS} buckets; narrow the range or use interval=week')
+
+    ids = {}
+    for name in ('assigned_to', 'category'):
+        value = query_params.get(name)
+        if value and not value.isdigit():
+            raise ParseError(f'{name} must be an id')
+        ids[name] = int(value) if value else None
+    return start, end, interval, ids['assigned_to'], ids['category']
+
+
+def task_trends(start, end, interval='day', assigned_to=None, category=None, now=None):
+    """Created, completed and overdue counts and completion times per day or week from start to end.
+
+    Days the rollup covers are summed from TaskTrendRollup; later days
+    (today, and any since a missed refresh) are computed from the tasks
+    table. Weeks start on Monday; completion times are in hours.
+    """
+    now = now or timezone.now()
+    state = TaskTrendRefresh.objects.first()
+    complete_before = state.complete_before if state else start
+    step = timedelta(days=1 if interval == 'day' else 7)
+
+    def bucket_of(day):
+        return day if interval == 'day' else day - timedelta(days=day.weekday())
+
+    buckets = {}
+    day = bucket_of(start)
+    while day <= end:
+        buckets[day] = {
+            'date': day, 'created': 0, 'completed': 0, 'overdue': 0,
+            'completion_time': timedelta(0), 'sketch': QuantileSketch(),
+        }
+        day += step
+
+    def add(day, created, completed, overdue, completion_time, sketch):
+        bucket = buckets[bucket_of(day)]
+        bucket['created'] += created
+        bucket['completed'] += completed
+        bucket['overdue'] += overdue
+        bucket['completion_time'] += completion_time
+        if sketch:
+            bucket['sketch'].merge(QuantileSketch.from_dict(sketch))
+
+    rolled_end = min(end, complete_before - timedelta(days=1))
+    if start <= rolled_end:
+        rows = TaskTrendRollup.objects.filter(day__range=(start, rolled_end))
+        if assigned_to:
+            rows = rows.filter(assigned_to_id=assigned_to)
+        if category:
+            rows = rows.filter(category_id=category)
+        values = rows.values_list(
+            'day', 'created', 'completed', 'overdue', 'completion_time', 'completion_sketch'
+        )
+        for row in values.iterator():
+            add(*row)
+
+    live_start = max(start, complete_before)
+    if live_start <= end:
+        tasks = Task.objects.all()
+        if assigned_to:
+            tasks = tasks.filter(assigned_to_id=assigned_to)
+        if category:
+            tasks = tasks.filter(category_id=category)
+        for row in rollup_groups(tasks, [(live_start, end)], now).values():
+            add(row.day, row.created, row.completed, row.overdue, row.completion_time, row.completion_sketch)
+
+    for bucket in buckets.values():
+        completion_time, sketch = bucket.pop('completion_time'), bucket.pop('sketch')
+        bucket['completion_hours'] = summarize_completion(
+            bucket['completed'], completion_time, sketch_percentiles(sketch)
+        )
+    return {'interval': interval, 'start': start, 'end': end, 'buckets': list(buckets.values())}
@@ -1,9 +1,11 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import AsyncTaskViewSet
 from .views import TaskViewSet, CategoryViewSet, UserViewSet
 
 router = DefaultRouter()
-router.register(r'tasks', TaskViewSet, basename='task')
+router.register(r'tasks', AsyncTaskViewSet if settings.ASYNC_API_VIEWS else TaskViewSet, basename='task')
 router.register(r'categories', CategoryViewSet)
 router.register(r'users', UserViewSet)
 
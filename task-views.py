@@ -1,22 +1,60 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import Http404, StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Q, Count, Avg
-from drf_yasg.utils import swagger_auto_schema
+from django.db import transaction
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+import time
+from drf_yasg.utils import swagger_auto_schema, no_body
 from drf_yasg import openapi
-from .models import Task, Category, Comment, Attachment
+from .models import Task, Category, Comment, Attachment, AttachmentUpload, TaskHistory, TaskCounter
+from .attachments import (
+    HashingUploadHandler, create_attachment, start_upload, read_chunk, claim_upload, write_chunk,
+    advance_upload, release_upload, complete_upload, attachment_response
+)
+from .cache import STATS_FILTER_PARAMS, get_cached_stats, get_stats_cache_counters
+from .changes import get_changes
+from .conditional import (
+    make_etag, collection_validators, task_validators, conditional_response, set_validators
+)
+from .export import CSVRenderer, NDJSONRenderer, accepts_gzip, stream_export
+from .history import record_task_history
+from .pagination import KeysetPagination, CommentPagination, AttachmentPagination, HistoryPagination
+from .search import get_search_backend
+from .snapshots import get_stats_snapshot
+from .trends import TREND_INTERVALS, parse_trend_params, task_trends
+from .stats import (
+    compute_task_stats, compute_counter_stats, category_task_counts,
+    category_task_count_subquery, task_category_ids
+)
 from .serializers import (
     TaskListSerializer, TaskDetailSerializer, TaskCreateUpdateSerializer,
-    CategorySerializer, CommentSerializer, AttachmentSerializer,
-    TaskStatsSerializer, UserSerializer
+    CategorySerializer, CommentSerializer, AttachmentSerializer, AttachmentUploadSerializer,
+    TaskHistorySerializer, TaskStatsSerializer, TaskTrendsSerializer, UserSerializer
 )
 
 
+def latest_per_task(queryset, field, limit):
+    """queryset limited to the newest `limit` rows of each task, newest first.
+
+    Prefetch can't take a sliced queryset, so rows are ranked per task with
+    a window function instead.
+    """
+    ordering = [F(field).desc(), F('id').desc()]
+    return queryset.annotate(
+        task_rank=Window(RowNumber(), partition_by=F('task'), order_by=ordering)
+    ).filter(task_rank__lte=limit).order_by(*ordering)
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     """Category CRUD operations"""
-    queryset = Category.objects.all()
+    queryset = Category.objects.annotate(task_count=category_task_count_subquery())
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -24,11 +62,50 @@ class CategoryViewSet(viewsets.ModelViewSet):
 class TaskViewSet(viewsets.ModelViewSet):
     """Task CRUD operations with advanced filtering and statistics"""
     permission_classes = [permissions.IsAuthenticated]
+    list_actions = ['list', 'my_tasks', 'changes']
+    # Actions rendered with TaskDetailSerializer and its ?expand= collections
+    detail_actions = ['retrieve', 'my_tasks']
+    task_counts_by_category = None
+    # Per-task sub-resources that only need the task's id
+    related_actions = [
+        'comments', 'attachments', 'history',
+        'add_attachment', 'uploads', 'upload_session', 'download_attachment',
+    ]
+    
+    # Columns rendered by TaskListSerializer, including its nested serializers
+    list_fields = [
+        'id', 'title', 'status', 'priority', 'due_date', 'created_at', 'updated_at',
+        'category', 'category__name', 'category__description', 'category__color',
+        'category__created_at',
+        'assigned_to', 'assigned_to__username', 'assigned_to__email',
+        'assigned_to__first_name', 'assigned_to__last_name',
+        'created_by', 'created_by__username', 'created_by__email',
+        'created_by__first_name', 'created_by__last_name',
+    ]
     
     def get_queryset(self):
-        queryset = Task.objects.all().select_related(
-            'category', 'assigned_to', 'created_by'
-        ).prefetch_related('comments', 'attachments')
+        if self.action in self.related_actions:
+            queryset = Task.objects.only('id')
+        else:
+            queryset = Task.objects.all().select_related(
+                'category', 'assigned_to', 'created_by'
+            )
+        if self.get_serializer_class() is TaskListSerializer:
+            queryset = queryset.only(*self.list_fields)
+        if self.action in self.detail_actions:
+            # Only the ?expand= collections, each capped to its latest items
+            limit = getattr(settings, 'TASK_DETAIL_EXPAND_LIMIT', 20)
+            related = {
+                'comments': latest_per_task(Comment.objects.select_related('author'), 'created_at', limit),
+                'attachments': latest_per_task(Attachment.objects.select_related('uploaded_by'), 'uploaded_at', limit),
+                'history': latest_per_task(TaskHistory.objects.select_related('changed_by'), 'changed_at', limit),
+            }
+            queryset = queryset.prefetch_related(*[
+                Prefetch(name, queryset=related[name]) for name in self.get_expand()
+            ])
+        if self.action == 'changes':
+            # A filtered feed couldn't report tasks that leave the filter
+            return queryset
         
         # Apply filters
         status_filter = self.request.query_params.get('status')
@@ -47,9 +124,8 @@ class TaskViewSet(viewsets.ModelViewSet):
         if assigned_to_filter:
             queryset = queryset.filter(assigned_to_id=assigned_to_filter)
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(description__icontains=search)
+            queryset = get_search_backend().filter(
+                queryset, search, rank=self.action in self.list_actions
             )
         if overdue and overdue.lower() == 'true':
             queryset = queryset.filter(
@@ -59,71 +135,330 @@ class TaskViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def get_counter_queryset(self):
+        """TaskCounter rows matching the request filters, or None if a filter needs the tasks table"""
+        status_filter = self.request.query_params.get('status')
+        priority_filter = self.request.query_params.get('priority')
+        category_filter = self.request.query_params.get('category')
+        assigned_to_filter = self.request.query_params.get('assigned_to')
+        search = self.request.query_params.get('search')
+        overdue = self.request.query_params.get('overdue')
+        
+        if search or (overdue and overdue.lower() == 'true'):
+            return None
+        
+        counters = TaskCounter.objects.all()
+        if status_filter:
+            counters = counters.filter(status=status_filter)
+        if priority_filter:
+            counters = counters.filter(priority=priority_filter)
+        if category_filter:
+            counters = counters.filter(category_id=category_filter)
+        if assigned_to_filter:
+            counters = counters.filter(assigned_to_id=assigned_to_filter)
+        return counters
+    
+    @property
+    def paginator(self):
+        """Use keyset pagination for list actions when ?pagination=keyset"""
+        if not hasattr(self, '_paginator'):
+            mode = self.request.query_params.get(KeysetPagination.mode_query_param)
+            if self.action in self.list_actions and mode == KeysetPagination.mode:
+                self._paginator = KeysetPagination()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    
+    def get_expand(self):
+        """Nested collections requested with ?expand=comments,attachments,history"""
+        requested = self.request.query_params.get('expand', '').split(',')
+        return [name for name in TaskDetailSerializer.expandable_fields if name in requested]
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in self.detail_actions:
+            context['expand'] = self.get_expand()
+        if self.task_counts_by_category is not None:
+            context['category_task_counts'] = self.task_counts_by_category
+        return context
+    
+    def get_serializer(self, *args, **kwargs):
+        rendered_actions = self.list_actions + self.detail_actions
+        if args and self.action in rendered_actions and self.task_counts_by_category is None:
+            # One grouped query over the categories being rendered, instead
+            # of a COUNT per nested category; async views set them beforehand
+            tasks = args[0] if kwargs.get('many') else [args[0]]
+            self.task_counts_by_category = category_task_counts(task_category_ids(tasks))
+        return super().get_serializer(*args, **kwargs)
+    
+    def get_collection_validators(self, request):
+        """(ETag, Last-Modified) for list-style responses of this action and query"""
+        query = sorted(request.query_params.lists())
+        return collection_validators(self.action, request.user.pk, query)
+    
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = self.get_collection_validators(request)
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+    
+    def retrieve(self, request, *args, **kwargs):
+        validators = task_validators(self.kwargs['pk'], self.get_expand())
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+        
+        etag, last_modified = validators
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+    
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            task = serializer.save()
+            record_task_history([task], self.request.user)
+    
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in self.detail_actions:
+            return TaskDetailSerializer
+        if self.action in self.list_actions:
             return TaskListSerializer
-        elif self.action in ['create', 'update', 'partial_update']:
+        elif self.action in ['create', 'update', 'partial_update', 'bulk']:
             return TaskCreateUpdateSerializer
         return TaskDetailSerializer
     
     @swagger_auto_schema(
         method='get',
+        manual_parameters=[
+            openapi.Parameter(
+                'fresh', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                description='false serves the last snapshot (without filters, or with assigned_to only)'
+            )
+        ],
         responses={200: TaskStatsSerializer}
     )
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get task statistics"""
-        queryset = self.get_queryset()
-        
-        stats = {
-            'total_tasks': queryset.count(),
-            'pending_tasks': queryset.filter(status='pending').count(),
-            'in_progress_tasks': queryset.filter(status='in_progress').count(),
-            'completed_tasks': queryset.filter(status='completed').count(),
-            'overdue_tasks': queryset.filter(
-                due_date__lt=timezone.now(),
-                status__in=['pending', 'in_progress']
-            ).count(),
-        }
-        
-        # Tasks by priority
-        priority_stats = queryset.values('priority').annotate(
-            count=Count('id')
-        ).order_by('priority')
-        stats['tasks_by_priority'] = {
-            item['priority']: item['count'] for item in priority_stats
-        }
-        
-        # Tasks by category
-        category_stats = queryset.values('category__name').annotate(
-            count=Count('id')
-        ).order_by('category__name')
-        stats['tasks_by_category'] = {
-            item['category__name'] or 'Uncategorized': item['count'] 
-            for item in category_stats
-        }
-        
-        # Completion rate
-        completed = stats['completed_tasks']
-        total = stats['total_tasks']
-        stats['completion_rate'] = (completed / total * 100) if total > 0 else 0
-        
-        # Average completion time (in days)
-        completed_tasks = queryset.filter(
-            status='completed',
-            completed_at__isnull=False
-        ).exclude(created_at__isnull=True)
-        
-        if completed_tasks.exists():
-            avg_completion = completed_tasks.aggregate(
-                avg_time=Avg('completed_at') - Avg('created_at')
-            )
-            # Convert to days
-            stats['average_completion_time'] = avg_completion['avg_time'].days if avg_completion['avg_time'] else 0
-        else:
-            stats['average_completion_time'] = 0
+        if self.wants_stats_snapshot():
+            snapshot = get_stats_snapshot(request.query_params.get('assigned_to'))
+            if snapshot is not None:
+                return self.get_snapshot_response(request, *snapshot)
+        
+        etag = self.get_stats_etag(self.get_collection_validators(request)[0])
+        response = conditional_response(request, etag, None)
+        if response is not None:
+            return set_validators(response, etag, None)
         
+        stats, hit = get_cached_stats(request.user, request.query_params, self.compute_stats)
+        return self.get_stats_response(stats, hit, etag)
+    
+    def get_stats_etag(self, etag):
+        # overdue_tasks changes with the clock, so the ETag also rolls over
+        # with the cache TTL
+        return make_etag(etag, int(time.time()) // settings.TASK_STATS_CACHE_TTL)
+    
+    def get_stats_response(self, stats, hit, etag):
         serializer = TaskStatsSerializer(stats)
+        response = Response(serializer.data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+        return set_validators(response, etag, None)
+    
+    def wants_stats_snapshot(self):
+        """Whether stats may come from a snapshot: ?fresh=false, with no filter but assigned_to"""
+        params = self.request.query_params
+        if params.get('fresh', '').lower() != 'false':
+            return False
+        if not params.get('assigned_to', '0').isdigit():
+            return False
+        return not any(params.get(name) for name in STATS_FILTER_PARAMS if name != 'assigned_to')
+    
+    def get_snapshot_response(self, request, stats, last_modified, as_of):
+        etag = make_etag('snapshot', request.query_params.get('assigned_to'), last_modified)
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = Response(TaskStatsSerializer(stats).data)
+        response['X-Snapshot-Time'] = as_of.isoformat()
+        return set_validators(response, etag, last_modified)
+    
+    def compute_stats(self):
+        counters = self.get_counter_queryset()
+        if counters is not None:
+            return compute_counter_stats(counters, self.get_queryset())
+        return compute_task_stats(self.get_queryset())
+    
+    @swagger_auto_schema(
+        method='get',
+        manual_parameters=[
+            openapi.Parameter(
+                'interval', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=TREND_INTERVALS,
+                description='bucket size (default day; weeks start on Monday)'
+            ),
+            openapi.Parameter(
+                'start', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE,
+                description='first day (default TASK_TRENDS_DEFAULT_DAYS before end)'
+            ),
+            openapi.Parameter(
+                'end', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE,
+                description='last day (default today)'
+            ),
+            openapi.Parameter('assigned_to', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+            openapi.Parameter('category', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: TaskTrendsSerializer}
+    )
+    @action(detail=False, methods=['get'])
+    def trends(self, request):
+        """Get created, completed and overdue counts and completion times per day or week"""
+        params = parse_trend_params(request.query_params)
+        etag = self.get_stats_etag(self.get_collection_validators(request)[0])
+        response = conditional_response(request, etag, None)
+        if response is None:
+            response = Response(TaskTrendsSerializer(task_trends(*params)).data)
+        return set_validators(response, etag, None)
+    
+    @action(
+        detail=False, methods=['get'], url_path='stats/cache',
+        permission_classes=[permissions.IsAdminUser]
+    )
+    def stats_cache(self, request):
+        """Get stats cache hit/miss counters"""
+        return Response(get_stats_cache_counters())
+    
+    @swagger_auto_schema(
+        method='get',
+        manual_parameters=[
+            openapi.Parameter(
+                'format', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['csv', 'ndjson'],
+                description='csv (default) or ndjson; also chosen by the Accept header'
+            )
+        ],
+        responses={200: 'The filtered tasks, gzip-encoded when the client accepts it'}
+    )
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """Stream the tasks matching the list filters as CSV or NDJSON"""
+        return self.get_export_response(
+            request, stream_export(self.get_queryset(), request.accepted_renderer.format, self.wants_gzip())
+        )
+    
+    def wants_gzip(self):
+        return bool(accepts_gzip.search(self.request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    
+    def get_export_response(self, request, stream):
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(stream, content_type=f'{renderer.media_type}; charset=utf-8')
+        filename = f'tasks-{timezone.localdate():%Y%m%d}.{renderer.format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Vary'] = 'Accept, Accept-Encoding'
+        if self.wants_gzip():
+            response['Content-Encoding'] = 'gzip'
+        # Don't let nginx buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    def get_bulk_instances(self, ids):
+        """Return (tasks in ids order, per-item errors) for a bulk request's task ids"""
+        valid_ids = {pk for pk in ids if isinstance(pk, int) and not isinstance(pk, bool)}
+        tasks = self.get_queryset().in_bulk(list(valid_ids))
+        
+        instances, errors, seen = [], [], set()
+        for pk in ids:
+            if pk not in valid_ids:
+                errors.append({'id': ['A valid task id is required.']})
+            elif pk in seen:
+                errors.append({'id': ['Duplicate task id.']})
+            elif pk not in tasks:
+                errors.append({'id': ['Task not found.']})
+            else:
+                instances.append(tasks[pk])
+                errors.append({})
+            seen.add(pk)
+        return instances, errors
+    
+    @swagger_auto_schema(
+        method='get',
+        manual_parameters=[
+            openapi.Parameter(
+                'since', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                description='watermark from the previous response; omit for a full sync'
+            )
+        ],
+        responses={200: TaskListSerializer(many=True), 410: 'Watermark expired, sync again without since'}
+    )
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Tasks changed and ids of tasks deleted since ?since=, for delta sync.
+
+        Pass back the returned watermark on the next call, repeating at once
+        while has_more is true. A task may be returned again by a later
+        sync, so clients should apply changes as upserts.
+        """
+        tasks, deleted, watermark, has_more = get_changes(
+            self.get_queryset(), request.query_params.get('since')
+        )
+        return Response({
+            'changed': self.get_serializer(tasks, many=True).data,
+            'deleted': deleted,
+            'watermark': watermark,
+            'has_more': has_more,
+        })
+    
+    @swagger_auto_schema(
+        methods=['post', 'patch'],
+        request_body=TaskCreateUpdateSerializer(many=True),
+        responses={200: TaskCreateUpdateSerializer(many=True)}
+    )
+    @swagger_auto_schema(
+        method='delete',
+        request_body=openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER))
+    )
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        """Create (POST), partially update (PATCH) or delete (DELETE) many tasks at once.
+        
+        POST takes a list of tasks, PATCH a list of tasks with their ``id``
+        and DELETE a list of ids. Nothing is written unless every item is
+        valid; errors come back as a list aligned with the request items.
+        """
+        items = request.data
+        max_items = getattr(settings, 'TASK_BULK_MAX_ITEMS', 1000)
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Expected a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > max_items:
+            return Response(
+                {'error': f'At most {max_items} items per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=items, many=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        
+        if request.method == 'DELETE':
+            instances, errors = self.get_bulk_instances(items)
+            if any(errors):
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+            # queryset.delete() still sends per-row delete signals, which keep
+            # counters and the search index in step
+            with transaction.atomic():
+                Task.objects.filter(pk__in=[task.pk for task in instances]).delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        
+        ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+        instances, errors = self.get_bulk_instances(ids)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(instances, data=items, many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
         return Response(serializer.data)
     
     @swagger_auto_schema(
@@ -150,6 +485,9 @@ class TaskViewSet(viewsets.ModelViewSet):
     def add_attachment(self, request, pk=None):
         """Add an attachment to a task"""
         task = self.get_object()
+        # Hash the file while it streams to the upload handlers
+        hasher = HashingUploadHandler(request)
+        request.upload_handlers.insert(0, hasher)
         file = request.FILES.get('file')
         
         if not file:
@@ -157,28 +495,187 @@ class TaskViewSet(viewsets.ModelViewSet):
                 {'error': 'No file provided'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if file.size > settings.TASK_ATTACHMENT_MAX_SIZE:
+            return Response(
+                {'error': f'File exceeds {settings.TASK_ATTACHMENT_MAX_SIZE} bytes'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
         
-        attachment = Attachment.objects.create(
-            task=task,
-            uploaded_by=request.user,
-            file=file,
-            filename=file.name,
-            file_size=file.size
+        attachment = create_attachment(task, request.user, file, file.name, hasher.digests.get('file', ''))
+        serializer = AttachmentSerializer(attachment, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @swagger_auto_schema(
+        method='post',
+        request_body=AttachmentUploadSerializer,
+        responses={201: AttachmentUploadSerializer}
+    )
+    @action(detail=True, methods=['post'])
+    def uploads(self, request, pk=None):
+        """Start a resumable attachment upload; PATCH the bytes to the Location returned"""
+        task = self.get_object()
+        serializer = AttachmentUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = start_upload(task, request.user, **serializer.validated_data)
+        location = reverse(
+            'task-upload-session', kwargs={'pk': task.pk, 'upload_id': upload.pk}, request=request
+        )
+        return Response(
+            AttachmentUploadSerializer(upload).data,
+            status=status.HTTP_201_CREATED,
+            headers={'Location': location, 'Upload-Offset': str(upload.offset)}
         )
+    
+    @swagger_auto_schema(
+        method='patch',
+        request_body=no_body,
+        manual_parameters=[
+            openapi.Parameter('Upload-Offset', openapi.IN_HEADER, type=openapi.TYPE_INTEGER, required=True)
+        ],
+        responses={200: AttachmentUploadSerializer, 201: AttachmentSerializer, 409: 'Offset mismatch'}
+    )
+    @swagger_auto_schema(method='get', responses={200: AttachmentUploadSerializer})
+    @action(
+        detail=True, methods=['get', 'patch', 'delete'],
+        url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)', url_name='upload-session'
+    )
+    def upload_session(self, request, pk=None, upload_id=None):
+        """Resumable upload session.
         
-        serializer = AttachmentSerializer(attachment)
+        GET reports the offset to resume from, PATCH writes the raw request
+        body at its Upload-Offset header and DELETE abandons the upload. The
+        PATCH that receives the last byte returns the new attachment.
+        """
+        task = self.get_object()
+        upload = get_object_or_404(
+            AttachmentUpload.objects.select_related('uploaded_by'),
+            pk=upload_id, task=task, uploaded_by=request.user
+        )
+        if request.method == 'DELETE':
+            upload.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method == 'GET':
+            return Response(
+                AttachmentUploadSerializer(upload).data, headers={'Upload-Offset': str(upload.offset)}
+            )
+        
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset header required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if offset != upload.offset:
+            return Response(
+                {'error': 'Upload-Offset does not match', 'offset': upload.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Upload-Offset': str(upload.offset)}
+            )
+        if int(request.META.get('CONTENT_LENGTH') or 0) > upload.size - offset:
+            return Response(
+                {'error': 'Chunk extends past the upload size'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        
+        # The body is spooled before the session is claimed, and each step
+        # commits on its own, so no lock is held while the client sends
+        chunk, written = read_chunk(upload, request.stream, offset)
+        with chunk:
+            writer = claim_upload(upload, offset)
+            if writer is not None:
+                try:
+                    write_chunk(upload, chunk, offset)
+                except BaseException:
+                    release_upload(upload, writer)
+                    raise
+        if writer is None or not advance_upload(upload, writer, offset, written):
+            upload.offset = AttachmentUpload.objects.filter(pk=upload.pk).values_list('offset', flat=True).first()
+            if upload.offset is None:
+                raise Http404('Upload was abandoned')
+            return Response(
+                {'error': 'Upload-Offset does not match', 'offset': upload.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Upload-Offset': str(upload.offset)}
+            )
+        upload.offset = offset + written
+        if upload.offset < upload.size:
+            return Response(
+                AttachmentUploadSerializer(upload).data, headers={'Upload-Offset': str(upload.offset)}
+            )
+        
+        attachment = complete_upload(upload, task)
+        serializer = AttachmentSerializer(attachment, context=self.get_serializer_context())
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    @swagger_auto_schema(
+        method='get',
+        responses={200: 'File contents', 206: 'Requested byte range', 416: 'Range not satisfiable'}
+    )
+    @action(
+        detail=True, methods=['get'],
+        url_path=r'attachments/(?P<attachment_id>\d+)/download', url_name='download-attachment'
+    )
+    def download_attachment(self, request, pk=None, attachment_id=None):
+        """Download an attachment's file, with Range support"""
+        task = self.get_object()
+        attachment = get_object_or_404(Attachment, pk=attachment_id, task=task)
+        return attachment_response(request, attachment)
+    
+    def list_related(self, queryset, serializer_class, pagination_class):
+        """Cursor-paginated response of one of the task's related collections"""
+        paginator = pagination_class()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+    
+    @swagger_auto_schema(method='get', responses={200: CommentSerializer(many=True)})
+    @action(detail=True, methods=['get'])
+    def comments(self, request, pk=None):
+        """Comments on a task, newest first"""
+        task = self.get_object()
+        return self.list_related(
+            Comment.objects.filter(task=task).select_related('author'),
+            CommentSerializer, CommentPagination
+        )
+    
+    @swagger_auto_schema(method='get', responses={200: AttachmentSerializer(many=True)})
+    @action(detail=True, methods=['get'])
+    def attachments(self, request, pk=None):
+        """Attachments of a task, newest first"""
+        task = self.get_object()
+        return self.list_related(
+            Attachment.objects.filter(task=task).select_related('uploaded_by'),
+            AttachmentSerializer, AttachmentPagination
+        )
+    
+    @swagger_auto_schema(method='get', responses={200: TaskHistorySerializer(many=True)})
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """Field change history of a task, newest first"""
+        task = self.get_object()
+        return self.list_related(
+            TaskHistory.objects.filter(task=task).select_related('changed_by'),
+            TaskHistorySerializer, HistoryPagination
+        )
+    
     @action(detail=False, methods=['get'])
     def my_tasks(self, request):
         """Get tasks assigned to current user"""
+        etag, last_modified = self.get_collection_validators(request)
+        response = conditional_response(request, etag, last_modified)
+        if response is not None:
+            return set_validators(response, etag, last_modified)
+        
         queryset = self.get_queryset().filter(assigned_to=request.user)
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(queryset, many=True)
+            response = Response(serializer.data)
+        return set_validators(response, etag, last_modified)
 
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):